@@ -1,8 +1,19 @@
-from django.contrib import admin
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
 from django.utils.html import format_html
-from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
-from .models import Employee, Category, Product, SaleItemImage, SaleItem, ProductImage, Order
+from .admin_tools import LargeTableAdmin, RelatedInputFilter
+from .bulk_edit import BulkEditError, apply_changes, export_products, read_changes, sign_changes, unsign_changes
+from .thumbnails import thumbnail_tag
+from .models import Employee, Category, Product, SaleItemImage, SaleItem, ProductImage, Order, OrderArchive, \
+    ContactMessage, ContactMessageArchive
 
 
 @admin.register(Employee)
@@ -31,18 +42,23 @@ class ProductImageInline(admin.TabularInline):
 
     def preview(self, obj):
         if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" style="max-height: 100px;"/>')
+            return thumbnail_tag(obj.image)
         return "-"
 
     preview.short_description = _("Предпросмотр")
 
 
+class BulkEditUploadForm(forms.Form):
+    file = forms.FileField(label='Файл XLSX')
+
+
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = ['name', 'size', 'price', 'quantity']
     search_fields = ['name', 'description']
     list_filter = ['category']
     readonly_fields = ['display_price']
+    actions = ['export_prices']
 
     fieldsets = (
         (None, {
@@ -59,6 +75,54 @@ class ProductAdmin(admin.ModelAdmin):
 
     display_price.short_description = 'Форматированная цена'
 
+    @admin.action(description='Выгрузить цены и остатки в XLSX')
+    def export_prices(self, request, queryset):
+        response = HttpResponse(
+            export_products(queryset),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+        response['Content-Disposition'] = f'attachment; filename="products-{timezone.now():%Y%m%d-%H%M}.xlsx"'
+        return response
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {'has_bulk_edit_permission': self.has_change_permission(request), **(extra_context or {})}
+        return super().changelist_view(request, extra_context)
+
+    def get_urls(self):
+        return [
+            path('bulk-edit/', self.admin_site.admin_view(self.bulk_edit_view), name='api_product_bulk_edit'),
+        ] + super().get_urls()
+
+    def bulk_edit_view(self, request):
+        """Загрузка XLSX с ценами и остатками: предпросмотр изменений, затем применение (api.bulk_edit)"""
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Загрузка цен и остатков',
+            'form': BulkEditUploadForm(),
+        }
+        if request.method == 'POST':
+            try:
+                if 'changes' in request.POST:
+                    updated = apply_changes(unsign_changes(request.POST['changes']))
+                    self.message_user(request, f'Обновлено товаров: {updated}', messages.SUCCESS)
+                    return redirect('admin:api_product_changelist')
+                form = BulkEditUploadForm(request.POST, request.FILES)
+                context['form'] = form
+                if form.is_valid():
+                    changes = read_changes(form.cleaned_data['file'])
+                    context.update({
+                        'changes': changes[:settings.BULK_EDIT_PREVIEW_ROWS],
+                        'changes_count': len(changes),
+                        'hidden_count': max(0, len(changes) - settings.BULK_EDIT_PREVIEW_ROWS),
+                        'signed_changes': sign_changes(changes),
+                    })
+            except BulkEditError as e:
+                context['errors'] = e.args[0]
+        return TemplateResponse(request, 'admin/api/product/bulk_edit.html', context)
+
     class Meta:
         verbose_name = _('Продукт')
         verbose_name_plural = _('Продукты')
@@ -71,9 +135,7 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ['name']
 
     def image_preview(self, obj):
-        if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" height="100" />')
-        return _("Нет изображения")
+        return thumbnail_tag(obj.image)
 
     image_preview.short_description = _("Превью")
 
@@ -82,18 +144,32 @@ class CategoryAdmin(admin.ModelAdmin):
         verbose_name_plural = _('Категории')
 
 
+class ProductInputFilter(RelatedInputFilter):
+    title = _('Продукт')
+    parameter_name = 'product'
+    field = 'product'
+    search_field = 'name'
+
+
+class SaleItemInputFilter(RelatedInputFilter):
+    title = 'Товар распродажи'
+    parameter_name = 'sale_item'
+    field = 'sale_item'
+    search_field = 'title'
+
+
 @admin.register(ProductImage)
-class ProductImageAdmin(admin.ModelAdmin):
+class ProductImageAdmin(LargeTableAdmin):
     list_display = ['id', 'product', 'image_preview', 'is_main', 'order']
     list_editable = ['is_main', 'order']
-    list_filter = ['product', 'is_main']
+    list_filter = [ProductInputFilter, 'is_main']
+    list_select_related = ['product']
     search_fields = ['product__name']
+    autocomplete_fields = ['product']
     readonly_fields = ['image_preview']
 
     def image_preview(self, obj):
-        if obj.image:
-            return mark_safe(f'<img src="{obj.image.url}" height="100" />')
-        return _("Нет изображения")
+        return thumbnail_tag(obj.image)
 
     image_preview.short_description = _("Превью")
 
@@ -103,13 +179,20 @@ class ProductImageAdmin(admin.ModelAdmin):
 
 
 @admin.register(SaleItemImage)
-class SaleItemImageAdmin(admin.ModelAdmin):
-    list_display = ('sale_item', 'is_main', 'order')
+class SaleItemImageAdmin(LargeTableAdmin):
+    list_display = ('sale_item', 'image_preview', 'is_main', 'order')
     list_editable = ('is_main', 'order')
-    list_filter = ('sale_item', 'is_main')
+    list_filter = (SaleItemInputFilter, 'is_main')
+    list_select_related = ('sale_item',)
     search_fields = ('sale_item__title',)
+    autocomplete_fields = ('sale_item',)
     fields = ('sale_item', 'image', 'is_main', 'order')
 
+    def image_preview(self, obj):
+        return thumbnail_tag(obj.image)
+
+    image_preview.short_description = _("Превью")
+
     class Meta:
         verbose_name = _('Изображение товара распродажи')
         verbose_name_plural = _('Изображения товаров распродажи')
@@ -117,11 +200,11 @@ class SaleItemImageAdmin(admin.ModelAdmin):
 
 @admin.register(SaleItem)
 class SaleItemAdmin(admin.ModelAdmin):
-    list_display = ('title', 'old_price', 'new_price', 'is_active', 'created_at')
+    list_display = ('title', 'old_price', 'new_price', 'is_active', 'starts_at', 'ends_at', 'created_at')
     list_filter = ('is_active', 'created_at')
     search_fields = ('title', 'description')
     prepopulated_fields = {'slug': ('title',)}
-    fields = ('title', 'slug', 'description', 'old_price', 'new_price', 'is_active')
+    fields = ('title', 'slug', 'description', 'old_price', 'new_price', 'is_active', 'starts_at', 'ends_at')
 
     class Meta:
         verbose_name = _('Товар распродажи')
@@ -129,7 +212,7 @@ class SaleItemAdmin(admin.ModelAdmin):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     list_display = (
         'id', 'created_at', 'first_name', 'last_name',
         'phone', 'total', 'status', 'city'
@@ -198,3 +281,39 @@ class OrderAdmin(admin.ModelAdmin):
             return readonly_fields + ('products',)
         return readonly_fields
 
+
+
+@admin.register(OrderArchive)
+class OrderArchiveAdmin(OrderAdmin):
+    """Архив только для просмотра"""
+    list_filter = ('status',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ContactMessage)
+class ContactMessageAdmin(LargeTableAdmin):
+    list_display = ('id', 'created_at', 'email')
+    search_fields = ('email', 'message')
+    readonly_fields = ('created_at',)
+
+
+@admin.register(ContactMessageArchive)
+class ContactMessageArchiveAdmin(ContactMessageAdmin):
+    """Архив только для просмотра"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,70 @@
+"""Списки админки для больших таблиц.
+
+LargeTableAdmin не считает строки таблицы точно: без фильтров и поиска
+число берётся из статистики Postgres (pg_class.reltuples), если таблица
+больше ADMIN_ESTIMATED_COUNT_THRESHOLD строк, а второй COUNT(*) «из N всего»
+отключён. Номер последней страницы при этом приблизителен.
+
+RelatedInputFilter заменяет фильтр по внешнему ключу, который выводит по
+ссылке на каждый связанный объект, полем ввода: id или часть названия.
+"""
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimated_count(queryset):
+    """Оценка числа строк таблицы модели по статистике планировщика; None, если таблицу ещё не анализировали"""
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class RelatedInputFilter(admin.SimpleListFilter):
+    """Фильтр по внешнему ключу field: число — id, иначе поиск по search_field связанного объекта"""
+    template = 'admin/input_filter.html'
+    field = None
+    search_field = None
+
+    def lookups(self, request, model_admin):
+        # Непустой список, чтобы фильтр отображался; варианты не выводятся
+        return ((None, None),)
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'params': [
+                (name, value) for name, value in changelist.params.items()
+                if name not in (self.parameter_name, PAGE_VAR)
+            ],
+        }
+
+    def queryset(self, request, queryset):
+        value = (self.value() or '').strip()
+        if not value:
+            return queryset
+        if value.isdigit():
+            return queryset.filter(**{f'{self.field}_id': int(value)})
+        return queryset.filter(**{f'{self.field}__{self.search_field}__icontains': value})
@@ -1,6 +1,21 @@
+import sys
+
 from django.apps import AppConfig
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .instrumentation import install_query_hook
+        from .metrics import register_worker
+
+        connection_created.connect(install_query_hook, dispatch_uid='api.instrumentation')
+        # Под gunicorn приложение загружается в мастере (preload_app), а воркеры отмечаются в post_fork:
+        # метрика мастера осталась бы лишним «воркером» навсегда
+        if 'gunicorn' not in sys.modules:
+            register_worker()
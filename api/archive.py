@@ -0,0 +1,57 @@
+"""Перенос старых заказов и сообщений в архивные таблицы.
+
+Рабочие таблицы Order и ContactMessage держат только последние
+ORDER_ARCHIVE_AFTER_DAYS и CONTACT_ARCHIVE_AFTER_DAYS дней, поэтому фильтры
+и счётчики админки работают с ограниченным объёмом. Старые строки
+переносятся в OrderArchive и ContactMessageArchive с теми же id. Архив
+только пополняется, и строки приходят в порядке created_at, поэтому
+BRIN-индексу по дате хватает нескольких страниц.
+
+Перенос идёт пачками, каждая в своей транзакции: DELETE ... RETURNING
+и INSERT в одном запросе, поэтому строка всегда ровно в одной таблице.
+Строки, заблокированные другими транзакциями, ждут следующего запуска.
+
+Список /orders/ показывает только рабочую таблицу; заказ по id
+(/orders/<id>/) ищется и в архиве. Архивы доступны в админке только для
+просмотра.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ContactMessage, ContactMessageArchive, Order, OrderArchive
+
+ARCHIVES = {
+    'orders': (Order, OrderArchive, 'ORDER_ARCHIVE_AFTER_DAYS'),
+    'contact_messages': (ContactMessage, ContactMessageArchive, 'CONTACT_ARCHIVE_AFTER_DAYS'),
+}
+
+
+def _move_sql(model, archive_model):
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in archive_model._meta.concrete_fields)
+    table = model._meta.db_table
+    return (
+        f'WITH moved AS ('
+        f'DELETE FROM {table} WHERE id IN ('
+        f'SELECT id FROM {table} WHERE created_at < %s ORDER BY created_at LIMIT %s FOR UPDATE SKIP LOCKED'
+        f') RETURNING {columns}) '
+        f'INSERT INTO {archive_model._meta.db_table} ({columns}) SELECT {columns} FROM moved ORDER BY created_at'
+    )
+
+
+def archive_old(name, batch_size=None, now=None):
+    """Перенести в архив строки старше срока из настроек; возвращает число перенесённых"""
+    model, archive_model, setting = ARCHIVES[name]
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    before = (now or timezone.now()) - timedelta(days=getattr(settings, setting))
+    sql = _move_sql(model, archive_model)
+    moved = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [before, batch_size])
+            count = cursor.rowcount
+        moved += count
+        if count < batch_size:
+            return moved
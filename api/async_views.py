@@ -0,0 +1,152 @@
+"""Асинхронные представления горячих чтений каталога для ASGI.
+
+Под ASGI (geology.asgi, ASYNC_CATALOG_VIEWS = True) список товаров, фасеты
+и активные распродажи обслуживаются корутинами: запросы к базе идут через
+асинхронный интерфейс ORM и кэша, и воркер не держит поток на время
+ожидания базы. Ответы совпадают с ответами ProductViewSet, CategoryFiltersView
+и SaleItemViewSet (это проверяют тесты), запросы укладываются в их бюджеты;
+запись и остальные методы передаются им же.
+"""
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .budgets import query_budget
+from .caching import aget_or_compute, aget_version
+from .filters import ProductFilter, PRODUCT_FILTER_FIELDS
+from .models import Category, Product, SaleItem
+from .routers import replica_reads
+from .serializers import ProductSerializer, SaleItemSerializer
+from .views import ProductViewSet, SaleItemViewSet, get_filter_counts, sale_items_cache_key
+
+READ_METHODS = ('GET', 'HEAD')
+
+_products_view = sync_to_async(ProductViewSet.as_view({'get': 'list', 'post': 'create'}))
+_sale_items_view = sync_to_async(SaleItemViewSet.as_view({'get': 'list', 'post': 'create'}))
+
+
+def _json(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def _page_number(request, count):
+    """Номер страницы как у PageNumberPagination или None, если страницы нет"""
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    num_pages = max(1, math.ceil(count / page_size))
+    value = request.GET.get('page', 1)
+    if value == 'last':
+        return num_pages, num_pages
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None, num_pages
+    if not 1 <= number <= num_pages:
+        return None, num_pages
+    return number, num_pages
+
+
+def _page_links(request, number, num_pages):
+    url = request.build_absolute_uri()
+    next_url = replace_query_param(url, 'page', number + 1) if number < num_pages else None
+    if number == 1:
+        previous_url = None
+    elif number == 2:
+        previous_url = remove_query_param(url, 'page')
+    else:
+        previous_url = replace_query_param(url, 'page', number - 1)
+    return next_url, previous_url
+
+
+def _paginated(request, count, number, num_pages, results):
+    next_url, previous_url = _page_links(request, number, num_pages)
+    return _json({'count': count, 'next': next_url, 'previous': previous_url, 'results': results})
+
+
+@replica_reads
+@query_budget(ProductViewSet, 'list')
+async def product_list(request):
+    if request.method not in READ_METHODS:
+        return await _products_view(request)
+    try:
+        queryset = ProductFilter(request.GET, PRODUCT_FILTER_FIELDS).apply(Product.objects.all())
+    except ValidationError as e:
+        return _json(e.detail, status=400)
+
+    count = await queryset.acount()
+    number, num_pages = _page_number(request, count)
+    if number is None:
+        return _json({'detail': 'Invalid page.'}, status=404)
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    offset = (number - 1) * page_size
+    products = [product async for product in queryset[offset:offset + page_size].aiterator()]
+    await sync_to_async(prefetch_related_objects)(products, 'images')
+
+    serializer = ProductSerializer(products, many=True, context={'request': request})
+    return _paginated(request, count, number, num_pages, serializer.data)
+
+
+async def _filter_counts(queryset, product_filter):
+    async def compute():
+        return await sync_to_async(get_filter_counts)(queryset, PRODUCT_FILTER_FIELDS)
+
+    return await aget_or_compute(
+        f'filter-counts:{product_filter.cache_key}', compute, settings.FILTER_COUNTS_CACHE_TIMEOUT,
+    )
+
+
+@replica_reads
+@query_budget(ProductViewSet, 'filters')
+async def product_filters(request):
+    try:
+        product_filter = ProductFilter(request.GET, PRODUCT_FILTER_FIELDS)
+    except ValidationError as e:
+        return _json(e.detail, status=400)
+    queryset = product_filter.apply(Product.objects.all())
+    return _json(await _filter_counts(queryset, product_filter))
+
+
+@replica_reads
+async def category_filters(request, category_id):
+    if not await Category.objects.filter(id=category_id).aexists():
+        return _json({"error": "Category not found"}, status=404)
+    try:
+        product_filter = ProductFilter(request.GET, PRODUCT_FILTER_FIELDS, category_id=category_id)
+    except ValidationError as e:
+        return _json(e.detail, status=400)
+    queryset = product_filter.apply(Product.objects.all())
+    return _json(await _filter_counts(queryset, product_filter))
+
+
+async def get_active_sale_items():
+    """Асинхронный вариант views.get_active_sale_items с тем же ключом кэша"""
+    minute = timezone.now().replace(second=0, microsecond=0)
+
+    async def compute():
+        items = [item async for item in SaleItem.objects.active(minute).aiterator()]
+        await sync_to_async(prefetch_related_objects)(items, 'images')
+        return items
+
+    key = sale_items_cache_key(await aget_version('sale-items'), minute)
+    return await aget_or_compute(key, compute, settings.SALE_ITEMS_CACHE_TIMEOUT)
+
+
+@replica_reads
+@query_budget(SaleItemViewSet, 'list')
+async def sale_item_list(request):
+    if request.method not in READ_METHODS:
+        return await _sale_items_view(request)
+    items = await get_active_sale_items()
+    number, num_pages = _page_number(request, len(items))
+    if number is None:
+        return _json({'detail': 'Invalid page.'}, status=404)
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    page = items[(number - 1) * page_size:number * page_size]
+    serializer = SaleItemSerializer(page, many=True, context={'request': request})
+    return _paginated(request, len(items), number, num_pages, serializer.data)
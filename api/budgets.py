@@ -0,0 +1,89 @@
+"""Бюджеты SQL-запросов для представлений.
+
+Представление с QueryBudgetMixin объявляет query_budget — максимальное число
+запросов на действие ({'list': 3, 'retrieve': 2}). При превышении, в
+зависимости от QUERY_BUDGET_MODE, пишется предупреждение ('log') или
+выбрасывается QueryBudgetExceeded ('raise', для тестов); в отчёт попадают
+повторяющиеся запросы — обычно это и есть N+1. None отключает проверку.
+
+Асинхронные представления (api.async_views), заменяющие действие viewset,
+проверяются по его же бюджету декоратором query_budget.
+"""
+import functools
+import logging
+from collections import Counter
+
+from django.conf import settings
+
+from .instrumentation import capture_queries, fingerprint
+
+logger = logging.getLogger('api.performance')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.fingerprints[fingerprint(sql)] += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return sum(self.fingerprints.values())
+
+    def report(self):
+        duplicated = [(sql, count) for sql, count in self.fingerprints.most_common() if count > 1]
+        if not duplicated:
+            return 'no duplicated statements'
+        return 'duplicated statements:\n' + '\n'.join(f'  {count}x {sql}' for sql, count in duplicated)
+
+
+def check_budget(name, budget, counter):
+    if budget is None or counter.count <= budget:
+        return
+    message = f'{name} made {counter.count} queries, budget is {budget}; {counter.report()}'
+    if settings.QUERY_BUDGET_MODE == 'raise':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class QueryBudgetMixin:
+    query_budget = {}
+
+    def get_budget_action(self):
+        return getattr(self, 'action', None) or self.request.method.lower()
+
+    def get_query_budget(self):
+        return self.query_budget.get(self.get_budget_action())
+
+    def dispatch(self, request, *args, **kwargs):
+        if settings.QUERY_BUDGET_MODE is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        counter = QueryCounter()
+        with capture_queries(counter):
+            response = super().dispatch(request, *args, **kwargs)
+        check_budget(f'{type(self).__name__}.{self.get_budget_action()}', self.get_query_budget(), counter)
+        return response
+
+
+def query_budget(view_class, action, methods=('GET', 'HEAD')):
+    """Декоратор асинхронного представления: бюджет действия action из view_class.query_budget"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            # Остальные методы передаются самому viewset, и он проверяет их сам
+            if settings.QUERY_BUDGET_MODE is None or request.method not in methods:
+                return await view(request, *args, **kwargs)
+            counter = QueryCounter()
+            with capture_queries(counter):
+                response = await view(request, *args, **kwargs)
+            check_budget(f'{view.__name__} ({view_class.__name__}.{action})', view_class.query_budget.get(action), counter)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,196 @@
+"""Массовая правка цен и остатков через XLSX в админке товаров.
+
+Действие «Выгрузить цены и остатки» отдаёт выбранные товары таблицей
+(ID, название, размер, цена, количество). Загруженная обратно таблица
+сравнивается с базой: предпросмотр показывает только изменившиеся строки,
+а сами изменения передаются форме подтверждения подписанными (django.core.signing),
+так что между шагами ничего не хранится на сервере.
+
+Применение — одна транзакция: строки блокируются, и если товар успели
+изменить после предпросмотра, ничего не записывается. Запись идёт пачками
+по BULK_EDIT_BATCH_SIZE строк без Product.full_clean(): цена и количество
+проверяются валидаторами своих полей при разборе файла. Массовый UPDATE не
+шлёт сигналов, поэтому журнал изменений (по нему же публикуется снимок
+каталога), поток остатков, версия кэша и ревалидация фронтенда вызываются здесь.
+"""
+import io
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+from openpyxl import Workbook, load_workbook
+
+from .caching import bump_version
+from .changes import record_changes
+from .models import Product
+from .revalidation import get_notifier, paths_for
+from .streaming import notify_products
+
+HEADER = ('ID', 'Название', 'Размер', 'Цена', 'Количество')
+ID_COLUMN, PRICE_COLUMN, QUANTITY_COLUMN = 0, 3, 4
+SIGNING_SALT = 'api.bulk_edit'
+# Пачка строк — один UPDATE из массивов: bulk_update строит CASE на каждую строку, и на тысячах строк
+# его компиляция в Python занимает секунды
+UPDATE_SQL = (
+    f'UPDATE {Product._meta.db_table} AS p SET price = v.price, quantity = v.quantity, updated_at = %s '
+    'FROM unnest(%s::bigint[], %s::numeric[], %s::integer[]) AS v(id, price, quantity) WHERE p.id = v.id'
+)
+# Подписанные изменения действительны столько секунд после предпросмотра
+SIGNED_MAX_AGE = 3600
+
+
+class BulkEditError(Exception):
+    pass
+
+
+@dataclass
+class Change:
+    id: int
+    name: str
+    old_price: Decimal
+    new_price: Decimal
+    old_quantity: int
+    new_quantity: int
+
+
+def export_products(queryset):
+    """XLSX с ценами и остатками товаров queryset"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Товары')
+    sheet.append(HEADER)
+    rows = queryset.order_by('id').values_list('id', 'name', 'size', 'price', 'quantity')
+    for row in rows.iterator(chunk_size=2000):
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def _clean(field_name, value):
+    field = Product._meta.get_field(field_name)
+    if isinstance(value, float):
+        # Excel хранит числа как float: 99.99 -> '99.99', 5.0 -> 5
+        value = int(value) if field_name == 'quantity' and value.is_integer() else str(value)
+    if field_name == 'price' and isinstance(value, str):
+        try:
+            value = Decimal(value.strip().replace(',', '.').replace(' ', ''))
+        except InvalidOperation:
+            raise ValidationError('не число')
+    return field.clean(value, None)
+
+
+def read_changes(file):
+    """Изменения из загруженной таблицы относительно базы; BulkEditError со списком ошибок по строкам"""
+    try:
+        workbook = load_workbook(file, read_only=True, data_only=True)
+    except Exception:
+        raise BulkEditError(['Файл не является таблицей XLSX'])
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None or tuple(header[:len(HEADER)]) != HEADER:
+            raise BulkEditError([f'Первая строка должна быть заголовком: {", ".join(HEADER)}'])
+        parsed, errors = {}, []
+        for number, row in enumerate(rows, start=2):
+            row = tuple(row) + (None,) * (len(HEADER) - len(row))
+            if all(value is None for value in row):
+                continue
+            try:
+                product_id = int(row[ID_COLUMN])
+                price = _clean('price', row[PRICE_COLUMN])
+                quantity = _clean('quantity', row[QUANTITY_COLUMN])
+            except (TypeError, ValueError):
+                errors.append(f'Строка {number}: неверный ID')
+                continue
+            except ValidationError as e:
+                errors.append(f'Строка {number}: {"; ".join(e.messages)}')
+                continue
+            if product_id in parsed:
+                errors.append(f'Строка {number}: товар {product_id} уже встречался выше')
+                continue
+            parsed[product_id] = (price, quantity)
+    finally:
+        workbook.close()
+
+    products = Product.objects.only('id', 'name', 'price', 'quantity').in_bulk(list(parsed))
+    missing = sorted(set(parsed) - set(products))
+    if missing:
+        errors.append(f'Нет товаров с ID: {", ".join(map(str, missing[:20]))}' + (' …' if len(missing) > 20 else ''))
+    if errors:
+        raise BulkEditError(errors)
+
+    changes = []
+    for product_id, (price, quantity) in sorted(parsed.items()):
+        product = products[product_id]
+        if (product.price, product.quantity) != (price, quantity):
+            changes.append(Change(product_id, product.name, product.price, price, product.quantity, quantity))
+    return changes
+
+
+def sign_changes(changes):
+    return signing.dumps(
+        [[c.id, c.name, str(c.old_price), str(c.new_price), c.old_quantity, c.new_quantity] for c in changes],
+        salt=SIGNING_SALT, compress=True,
+    )
+
+
+def unsign_changes(token):
+    try:
+        rows = signing.loads(token, salt=SIGNING_SALT, max_age=SIGNED_MAX_AGE)
+    except signing.BadSignature:
+        raise BulkEditError(['Предпросмотр устарел, загрузите файл заново'])
+    return [
+        Change(product_id, name, Decimal(old_price), Decimal(new_price), old_quantity, new_quantity)
+        for product_id, name, old_price, new_price, old_quantity, new_quantity in rows
+    ]
+
+
+def apply_changes(changes):
+    """Записать изменения одной транзакцией; BulkEditError, если товары изменились после предпросмотра"""
+    ids = [change.id for change in changes]
+    now = timezone.now()
+    with transaction.atomic():
+        products = Product.objects.select_for_update().only(
+            'id', 'category_id', 'price', 'quantity', 'updated_at',
+        ).in_bulk(ids)
+        stale = [
+            change.id for change in changes
+            if change.id not in products
+            or (products[change.id].price, products[change.id].quantity) != (change.old_price, change.old_quantity)
+        ]
+        if stale:
+            raise BulkEditError([
+                f'Товары изменились после предпросмотра, загрузите файл заново: {", ".join(map(str, stale[:20]))}'
+            ])
+
+        updated = []
+        for change in changes:
+            product = products[change.id]
+            product.price = change.new_price
+            product.quantity = change.new_quantity
+            product.updated_at = now
+            updated.append(product)
+        batch_size = settings.BULK_EDIT_BATCH_SIZE
+        with connection.cursor() as cursor:
+            for start in range(0, len(changes), batch_size):
+                batch = changes[start:start + batch_size]
+                cursor.execute(UPDATE_SQL, [
+                    now,
+                    [change.id for change in batch],
+                    [change.new_price for change in batch],
+                    [change.new_quantity for change in batch],
+                ])
+
+        # То, что при save() делают сигналы (api.signals)
+        record_changes(Product, ids)
+        notify_products(updated)
+        transaction.on_commit(lambda: bump_version('categories'))
+        notifier = get_notifier()
+        if notifier is not None:
+            paths = set().union(*(paths_for('product', product) for product in updated))
+            transaction.on_commit(lambda: notifier.add(paths))
+    return len(updated)
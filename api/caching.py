@@ -0,0 +1,40 @@
+"""Вспомогательные функции кэширования ответов API"""
+from django.core.cache import cache
+
+from .instrumentation import record_cache_access
+
+
+def get_or_compute(key, compute, timeout):
+    """Значение из кэша или compute(), сохранённое на timeout секунд"""
+    value = cache.get(key)
+    record_cache_access(value is not None)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+async def aget_or_compute(key, compute, timeout):
+    """get_or_compute для асинхронных представлений; compute — корутинная функция"""
+    value = await cache.aget(key)
+    record_cache_access(value is not None)
+    if value is None:
+        value = await compute()
+        await cache.aset(key, value, timeout)
+    return value
+
+
+def get_version(name):
+    """Версия набора ключей: при сбросе увеличивается, старые ключи перестают читаться"""
+    return cache.get_or_set(f'version:{name}', 1, None)
+
+
+async def aget_version(name):
+    return await cache.aget_or_set(f'version:{name}', 1, None)
+
+
+def bump_version(name):
+    try:
+        cache.incr(f'version:{name}')
+    except ValueError:
+        cache.set(f'version:{name}', 2, None)
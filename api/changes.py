@@ -0,0 +1,101 @@
+"""Журнал изменений каталога для дельта-синхронизации (лента /changes/)"""
+import base64
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import CatalogChange, Category, Product, ProductImage, SaleItem, SaleItemImage
+
+TRACKED_MODELS = {
+    Category: 'category',
+    Product: 'product',
+    ProductImage: 'product_image',
+    SaleItem: 'sale_item',
+    SaleItemImage: 'sale_item_image',
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def record_changes(model, ids, deleted=False):
+    """Записать изменения объектов model с первичными ключами ids.
+
+    Вызывается из сигналов; массовые операции (update, bulk_update), которые
+    сигналов не шлют, должны вызывать её сами.
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {CatalogChange._meta.db_table} (model, object_id, deleted, txid, changed_at) '
+            'SELECT %s, object_id, %s, txid_current(), now() FROM unnest(%s::bigint[]) AS object_id',
+            [TRACKED_MODELS[model], deleted, ids]
+        )
+
+
+def encode_cursor(txid, change_id):
+    return base64.urlsafe_b64encode(f'{txid}:{change_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return 0, 0
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        txid, change_id = (int(part) for part in raw.split(':'))
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(token)
+    return txid, change_id
+
+
+def latest_cursor():
+    """Курсор последнего изменения, после которого уже ничего не закоммитится (см. changes_since)"""
+    row = (
+        CatalogChange.objects
+        .filter(txid__lt=RawSQL('txid_snapshot_xmin(txid_current_snapshot())', []))
+        .order_by('-txid', '-id')
+        .values_list('txid', 'id')
+        .first()
+    )
+    return encode_cursor(*(row or (0, 0)))
+
+
+def changes_since(token, limit):
+    """Изменения после курсора: (список CatalogChange без повторов, следующий курсор, есть ли ещё).
+
+    Отдаются только транзакции старше самой старой незавершённой, поэтому
+    курсор монотонен: всё, что закоммитится позже, окажется после него.
+    """
+    txid, change_id = decode_cursor(token)
+    rows = list(
+        CatalogChange.objects
+        .filter(Q(txid__gt=txid) | Q(txid=txid, id__gt=change_id))
+        .filter(txid__lt=RawSQL('txid_snapshot_xmin(txid_current_snapshot())', []))
+        .order_by('txid', 'id')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_token = encode_cursor(rows[-1].txid, rows[-1].id) if rows else (token or encode_cursor(0, 0))
+
+    # В пределах страницы важно только последнее изменение объекта
+    latest = {}
+    for row in rows:
+        latest.pop((row.model, row.object_id), None)
+        latest[(row.model, row.object_id)] = row
+    return list(latest.values()), next_token, has_more
+
+
+def compact_changes():
+    """Удалить записи, у которых есть более позднее изменение того же объекта"""
+    table = CatalogChange._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} old USING {table} new '
+            'WHERE new.model = old.model AND new.object_id = old.object_id '
+            'AND (new.txid, new.id) > (old.txid, old.id)'
+        )
+        return cursor.rowcount
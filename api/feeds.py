@@ -0,0 +1,213 @@
+"""Генерация фида Яндекс.Маркета (YML) и sitemap в файлы для раздачи через nginx.
+
+Товары разбиты на шарды по id (FEED_SHARD_SIZE товаров на шард). Для каждого
+шарда хранятся фрагмент офферов и sitemap; при очередной сборке
+перезаписываются только шарды с товарами, изменёнными с прошлой сборки.
+Итоговый yandex.yml склеивается из фрагментов, sitemap.xml — индекс шардов.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from itertools import groupby
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import CatalogChange, Category, Product
+
+STATE_FILE = '.state.json'
+PRODUCT_FIELDS = [
+    'id', 'category_id', 'name', 'size', 'description', 'quantity', 'price', 'updated_at',
+    'brand', 'thread_connection', 'thread_connection_2', 'armament', 'seal', 'iadc',
+]
+PARAMS = [
+    ('size', 'Размер'),
+    ('thread_connection', 'Присоединительная резьба'),
+    ('thread_connection_2', 'Присоединительная резьба 2'),
+    ('armament', 'Вооружение'),
+    ('seal', 'Уплотнение'),
+    ('iadc', 'IADC'),
+]
+
+
+def _path(name):
+    return os.path.join(settings.FEEDS_ROOT, name)
+
+
+def _write_atomic(name, chunks):
+    path = _path(name)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.writelines(chunks)
+    os.replace(tmp_path, path)
+
+
+def _load_state():
+    try:
+        with open(_path(STATE_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _shard(product_id):
+    return product_id // settings.FEED_SHARD_SIZE
+
+
+def _offers_name(shard):
+    return f'offers-{shard:05d}.xml'
+
+
+def _sitemap_name(shard):
+    return f'sitemap-products-{shard:05d}.xml'
+
+
+def _product_rows(shards=None):
+    """Товары по возрастанию id вместе с изображениями — один запрос с LEFT JOIN"""
+    queryset = Product.objects.all()
+    if shards is not None:
+        size = settings.FEED_SHARD_SIZE
+        ranges = Q()
+        for shard in shards:
+            ranges |= Q(id__gte=shard * size, id__lt=(shard + 1) * size)
+        queryset = queryset.filter(ranges)
+    rows = (
+        queryset
+        .order_by('id', '-images__is_main', 'images__order', 'images__id')
+        .values(*PRODUCT_FIELDS, 'images__image')
+        .iterator(chunk_size=2000)
+    )
+    for _, group in groupby(rows, key=lambda row: row['id']):
+        group = list(group)
+        product = group[0]
+        product['pictures'] = [row['images__image'] for row in group if row['images__image']]
+        yield product
+
+
+def _offer(product):
+    url = settings.PRODUCT_PAGE_URL.format(id=product['id'])
+    available = 'true' if product['quantity'] > 0 else 'false'
+    parts = [
+        f'<offer id="{product["id"]}" available="{available}">',
+        f'<url>{escape(url)}</url>',
+        f'<price>{product["price"]}</price>',
+        '<currencyId>RUR</currencyId>',
+        f'<categoryId>{product["category_id"]}</categoryId>',
+    ]
+    for picture in product['pictures'][:10]:
+        parts.append(f'<picture>{escape(settings.PUBLIC_API_URL + settings.MEDIA_URL + picture)}</picture>')
+    parts.append(f'<name>{escape(product["name"])}</name>')
+    if product['brand']:
+        parts.append(f'<vendor>{escape(product["brand"])}</vendor>')
+    parts.append(f'<description>{escape(product["description"])}</description>')
+    parts.append(f'<count>{product["quantity"]}</count>')
+    for field, title in PARAMS:
+        if product[field]:
+            parts.append(f'<param name={quoteattr(title)}>{escape(product[field])}</param>')
+    parts.append('</offer>\n')
+    return ''.join(parts)
+
+
+def _sitemap_url(url, lastmod=None):
+    lastmod = f'<lastmod>{lastmod.date().isoformat()}</lastmod>' if lastmod else ''
+    return f'<url><loc>{escape(url)}</loc>{lastmod}</url>\n'
+
+
+def _write_shard(shard, products):
+    _write_atomic(_offers_name(shard), (_offer(product) for product in products))
+    _write_atomic(_sitemap_name(shard), [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n',
+        *(_sitemap_url(settings.PRODUCT_PAGE_URL.format(id=p['id']), p['updated_at']) for p in products),
+        '</urlset>\n',
+    ])
+
+
+def _remove_shard(shard):
+    for name in (_offers_name(shard), _sitemap_name(shard)):
+        try:
+            os.remove(_path(name))
+        except FileNotFoundError:
+            pass
+
+
+def _changed_shards(since):
+    product_ids = Product.objects.filter(updated_at__gte=since).values_list('id', flat=True)
+    deleted_ids = CatalogChange.objects.filter(
+        model='product', deleted=True, changed_at__gte=since
+    ).values_list('object_id', flat=True)
+    return {_shard(product_id) for product_id in product_ids.iterator()} | \
+           {_shard(product_id) for product_id in deleted_ids.iterator()}
+
+
+def _assemble(shards, now):
+    """yandex.yml из заголовка и фрагментов офферов, sitemap.xml — индекс шардов"""
+    categories = Category.objects.order_by('id').values_list('id', 'name')
+
+    def yml():
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield f'<yml_catalog date="{now.strftime("%Y-%m-%dT%H:%M%z")}">\n<shop>\n'
+        yield f'<name>{escape(settings.FEED_SHOP_NAME)}</name>\n'
+        yield f'<company>{escape(settings.FEED_COMPANY)}</company>\n'
+        yield f'<url>{escape(settings.SITE_URL)}</url>\n'
+        yield '<currencies><currency id="RUR" rate="1"/></currencies>\n<categories>\n'
+        for category_id, name in categories:
+            yield f'<category id="{category_id}">{escape(name)}</category>\n'
+        yield '</categories>\n<offers>\n'
+        for shard in shards:
+            with open(_path(_offers_name(shard)), encoding='utf-8') as f:
+                while chunk := f.read(1 << 16):
+                    yield chunk
+        yield '</offers>\n</shop>\n</yml_catalog>\n'
+
+    _write_atomic('yandex.yml', yml())
+
+    _write_atomic('sitemap-categories.xml', [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n',
+        *(_sitemap_url(settings.CATEGORY_PAGE_URL.format(id=category_id)) for category_id, _ in categories),
+        '</urlset>\n',
+    ])
+    base_url = settings.FEEDS_URL
+    _write_atomic('sitemap.xml', [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n',
+        f'<sitemap><loc>{escape(base_url)}sitemap-categories.xml</loc></sitemap>\n',
+        *(f'<sitemap><loc>{escape(base_url + _sitemap_name(shard))}</loc></sitemap>\n' for shard in shards),
+        '</sitemapindex>\n',
+    ])
+
+
+def build_feeds(full=False):
+    """Собрать фид и sitemap. Возвращает число перезаписанных шардов."""
+    os.makedirs(settings.FEEDS_ROOT, exist_ok=True)
+    state = _load_state()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT now()')
+        started_at = cursor.fetchone()[0]
+
+    existing = set(state.get('shards', []))
+    if full or 'built_at' not in state:
+        shards = None
+        stale = existing
+    else:
+        # Небольшой запас на транзакции, закоммиченные во время прошлой сборки
+        since = datetime.fromisoformat(state['built_at']) - timedelta(seconds=settings.FEED_REBUILD_OVERLAP)
+        shards = _changed_shards(since)
+        stale = shards & existing
+
+    written = set()
+    if shards is None or shards:
+        for shard, products in groupby(_product_rows(shards), key=lambda p: _shard(p['id'])):
+            _write_shard(shard, list(products))
+            written.add(shard)
+    for shard in stale - written:
+        _remove_shard(shard)
+
+    current = sorted((existing - stale) | written)
+    _assemble(current, timezone.localtime(started_at))
+    _write_atomic(STATE_FILE, [json.dumps({'built_at': started_at.isoformat(), 'shards': current})])
+    return len(written)
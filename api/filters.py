@@ -0,0 +1,123 @@
+"""Разбор и компиляция фильтров каталога.
+
+Поддерживаемый синтаксис (для каждого поля из PRODUCT_FILTER_FIELDS):
+    ?brand=A                  — точное совпадение
+    ?brand=A&brand=B, ?brand=A,B — любое из значений (IN)
+    ?seal__not=rubber         — исключение (можно несколько значений)
+а также category, availability, price_min, price_max.
+
+Запятая между цифрами не считается разделителем, чтобы размеры вида
+«215,9» не разбивались; для таких значений используйте повторный параметр.
+"""
+import hashlib
+import json
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+PRODUCT_FILTER_FIELDS = [
+    'size', 'brand', 'thread_connection',
+    'thread_connection_2', 'armament', 'seal', 'iadc'
+]
+EXCLUDE_SUFFIX = '__not'
+
+_separator_re = re.compile(r'(?<!\d),|,(?!\d)')
+
+
+def _split(values):
+    """Значения из повторных и перечисленных через запятую параметров"""
+    result = set()
+    for value in values:
+        for part in _separator_re.split(value):
+            part = part.strip()
+            if part:
+                result.add(part)
+    return tuple(sorted(result))
+
+
+def _parse_price(query_params, param):
+    value = query_params.get(param)
+    if not value:
+        return None
+    try:
+        price = Decimal(value.replace(',', '.'))
+        # quantize бросает InvalidOperation и на числах длиннее точности контекста (1e30)
+        if price.is_finite():
+            return price.quantize(Decimal('0.01'))
+    except InvalidOperation:
+        pass
+    raise ValidationError({param: 'Некорректное значение цены'})
+
+
+class ProductFilter:
+    """Нормализованный фильтр товаров.
+
+    Одинаковые по смыслу запросы (другой порядок параметров, повторы значений)
+    дают одинаковый фильтр, поэтому cache_key можно использовать как ключ кэша.
+    """
+
+    def __init__(self, query_params, fields=PRODUCT_FILTER_FIELDS, category_id=None):
+        self.fields = list(fields)
+        self.include = {}
+        self.exclude = {}
+        for field in self.fields:
+            values = _split(query_params.getlist(field))
+            if values:
+                self.include[field] = values
+            values = _split(query_params.getlist(field + EXCLUDE_SUFFIX))
+            if values:
+                self.exclude[field] = values
+
+        if category_id is None:
+            category_id = query_params.get('category') or None
+        if category_id is not None:
+            try:
+                category_id = int(category_id)
+            except (TypeError, ValueError):
+                raise ValidationError({'category': 'Некорректный идентификатор категории'})
+        self.category_id = category_id
+
+        availability = query_params.get('availability')
+        self.availability = availability if availability in ('in-stock', 'out-of-stock') else None
+        self.price_min = _parse_price(query_params, 'price_min')
+        self.price_max = _parse_price(query_params, 'price_max')
+
+    def as_dict(self):
+        """Каноническое представление фильтра"""
+        return {
+            'category': self.category_id,
+            'availability': self.availability,
+            'price_min': str(self.price_min) if self.price_min is not None else None,
+            'price_max': str(self.price_max) if self.price_max is not None else None,
+            'include': {field: list(values) for field, values in sorted(self.include.items())},
+            'exclude': {field: list(values) for field, values in sorted(self.exclude.items())},
+        }
+
+    @property
+    def cache_key(self):
+        canonical = json.dumps(self.as_dict(), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(canonical.encode()).hexdigest()
+
+    def to_q(self):
+        """Одно условие WHERE: category/price идут первыми под индекс (category_id, price)"""
+        q = Q()
+        if self.category_id is not None:
+            q &= Q(category_id=self.category_id)
+        if self.price_min is not None:
+            q &= Q(price__gte=self.price_min)
+        if self.price_max is not None:
+            q &= Q(price__lte=self.price_max)
+        if self.availability == 'in-stock':
+            q &= Q(quantity__gt=0)
+        elif self.availability == 'out-of-stock':
+            q &= Q(quantity=0)
+        for field, values in sorted(self.include.items()):
+            q &= Q(**{field: values[0]}) if len(values) == 1 else Q(**{f'{field}__in': values})
+        for field, values in sorted(self.exclude.items()):
+            q &= ~Q(**{field: values[0]}) if len(values) == 1 else ~Q(**{f'{field}__in': values})
+        return q
+
+    def apply(self, queryset):
+        return queryset.filter(self.to_q())
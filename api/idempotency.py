@@ -0,0 +1,131 @@
+"""Ключи идемпотентности для отправки заказов и сообщений.
+
+Клиент передаёт заголовок Idempotency-Key (например, UUID на попытку
+оформления). Повтор с тем же ключом и телом получает сохранённый ответ с
+заголовком Idempotent-Replayed: true — без валидации, записи в базу и писем.
+
+Ключ занимается строкой IdempotencyKey, которая коммитится до выполнения
+запроса, поэтому из одновременных одинаковых запросов выполняется один,
+остальные получают 409 с Retry-After. Создание объекта и сохранение ответа
+идут в одной транзакции, письма отправляются после её коммита: упавший
+запрос не оставляет ни объекта, ни ответа и освобождает ключ. Ключ, занятый
+дольше IDEMPOTENCY_LOCK_TIMEOUT секунд (воркер умер), можно занять заново.
+Сохраняются только успешные ответы; ошибочный запрос повторяется заново.
+
+Тот же ключ с другим телом — 422; ответ отдаётся только на тело, совпадающее
+байт в байт, поэтому чужой ключ не раскрывает чужих данных. Ответы хранятся
+IDEMPOTENCY_KEY_TTL секунд; просроченные удаляются пачками при занятии новых
+ключей и командой purge_idempotency_keys.
+"""
+import functools
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .metrics import IDEMPOTENCY
+from .models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+# Сколько просроченных ключей удаляется при занятии нового
+PURGE_BATCH = 100
+
+
+def request_fingerprint(request):
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def purge_expired(limit=None):
+    expired = IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+    if limit is not None:
+        expired = IdempotencyKey.objects.filter(pk__in=expired.values('pk')[:limit])
+    deleted, _ = expired.delete()
+    return deleted
+
+
+def claim(scope, key, fingerprint):
+    """(запись ключа, занят ли он этим запросом)"""
+    now = timezone.now()
+    fields = {
+        'fingerprint': fingerprint,
+        'status_code': None,
+        'response': None,
+        'created_at': now,
+        'expires_at': now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+    }
+    record, created = IdempotencyKey.objects.get_or_create(scope=scope, key=key, defaults=fields)
+    if created:
+        purge_expired(PURGE_BATCH)
+        return record, True
+
+    abandoned = record.status_code is None and \
+        record.created_at <= now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    if record.expires_at <= now or abandoned:
+        # Занимаем заново, только если никто не успел раньше
+        if IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).update(**fields):
+            for name, value in fields.items():
+                setattr(record, name, value)
+            return record, True
+        record.refresh_from_db()
+    return record, False
+
+
+def release(record):
+    IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True, created_at=record.created_at).delete()
+
+
+def idempotent(scope):
+    """Декоратор create: поддержка Idempotency-Key; scope разделяет ключи представлений"""
+    def decorator(create):
+        @functools.wraps(create)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.META.get(HEADER)
+            if key is None:
+                return create(view, request, *args, **kwargs)
+            if not key or len(key) > IdempotencyKey._meta.get_field('key').max_length:
+                return Response(
+                    {'detail': 'Idempotency-Key must be 1 to 255 characters long.'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            fingerprint = request_fingerprint(request)
+            record, claimed = claim(scope, key, fingerprint)
+            if not claimed:
+                return replay(scope, record, fingerprint)
+
+            try:
+                with transaction.atomic():
+                    response = create(view, request, *args, **kwargs)
+                    if status.is_success(response.status_code):
+                        record.status_code = response.status_code
+                        record.response = response.data
+                        record.save(update_fields=['status_code', 'response'])
+            except Exception:
+                release(record)
+                raise
+            if not status.is_success(response.status_code):
+                release(record)
+            return response
+        return wrapper
+    return decorator
+
+
+def replay(scope, record, fingerprint):
+    if record.fingerprint != fingerprint:
+        IDEMPOTENCY.labels(scope, 'mismatch').inc()
+        return Response(
+            {'detail': 'Idempotency-Key was already used with a different request body.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status_code is None:
+        IDEMPOTENCY.labels(scope, 'in_progress').inc()
+        return Response(
+            {'detail': 'A request with this Idempotency-Key is still being processed.'},
+            status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'},
+        )
+    IDEMPOTENCY.labels(scope, 'replayed').inc()
+    return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
@@ -0,0 +1,233 @@
+"""Замеры времени обработки запроса: заголовок Server-Timing и журнал.
+
+ServerTimingMiddleware считает общее время, время и число SQL-запросов,
+время сериализации DRF и попадания в кэш api.caching. Медленные запросы и
+повторы одного и того же SQL (признак N+1) пишутся в журнал с уровнем
+WARNING. При REQUEST_TIMING_ENABLED = False middleware отключается целиком
+(MiddlewareNotUsed) и ничего не стоит.
+
+Server-Timing раскрывает время и число SQL-запросов, поэтому отдаётся всем
+только при REQUEST_TIMING_HEADER (по умолчанию — при DEBUG), а иначе лишь
+сотрудникам, вошедшим в админку.
+
+SQL перехватывается обёрткой, которая ставится на каждое соединение при его
+создании (install_query_hook), а получатели берутся из контекста запроса
+(capture_queries). Контекст переходит в потоки sync_to_async, поэтому
+запросы асинхронных представлений под ASGI тоже учитываются, хотя
+выполняются в другом потоке и через другое соединение.
+"""
+import functools
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger('api.performance')
+
+_current = ContextVar('request_metrics', default=None)
+_query_wrappers = ContextVar('query_wrappers', default=())
+_placeholders_re = re.compile(r'%s(?:\s*,\s*%s)+')
+
+
+def fingerprint(sql):
+    """SQL без параметров; списки IN разной длины сводятся к одному виду"""
+    return _placeholders_re.sub('%s, ...', sql)
+
+
+def _execute(execute, sql, params, many, context):
+    for wrapper in reversed(_query_wrappers.get()):
+        execute = functools.partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def install_query_hook(connection, **kwargs):
+    """Обработчик сигнала connection_created (подключается в ApiConfig.ready)"""
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+@contextmanager
+def capture_queries(wrapper):
+    """Как connection.execute_wrapper, но для всех соединений в контексте текущего запроса"""
+    token = _query_wrappers.set((*_query_wrappers.get(), wrapper))
+    try:
+        yield
+    finally:
+        _query_wrappers.reset(token)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total_time = 0.0
+        self.db_time = 0.0
+        self.connect_time = 0.0
+        self.queries = 0
+        self.fingerprints = Counter()
+        self.serialize_time = 0.0
+        self.serializing = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def query_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def finish(self):
+        self.total_time = time.perf_counter() - self.started
+
+    def repeated_queries(self, threshold):
+        """Запросы, выполненные не менее threshold раз"""
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count >= threshold]
+
+    def server_timing(self):
+        return ', '.join([
+            f'total;dur={self.total_time * 1000:.1f}',
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'connect;dur={self.connect_time * 1000:.1f}',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+        ])
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total_time * 1000, 1),
+            'db_ms': round(self.db_time * 1000, 1),
+            'connect_ms': round(self.connect_time * 1000, 1),
+            'queries': self.queries,
+            'serialize_ms': round(self.serialize_time * 1000, 1),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+def current_metrics():
+    """Метрики обрабатываемого запроса (None вне запроса или при выключенных замерах)"""
+    return _current.get()
+
+
+def record_cache_access(hit):
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+def _has_session(request):
+    # Без cookie сессии пользователь анонимный, и сессию можно не загружать
+    return settings.SESSION_COOKIE_NAME in request.COOKIES
+
+
+def _is_staff(request):
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+def _install_serializer_timing():
+    """Оборачивает BaseSerializer.data: считается только внешний сериализатор"""
+    from rest_framework.serializers import BaseSerializer
+
+    original = BaseSerializer.data
+    if getattr(original.fget, 'timed', False):
+        return
+
+    def data(self):
+        metrics = _current.get()
+        if metrics is None or metrics.serializing:
+            return original.fget(self)
+        metrics.serializing = True
+        start = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            metrics.serialize_time += time.perf_counter() - start
+            metrics.serializing = False
+
+    data.timed = True
+    BaseSerializer.data = property(data)
+
+
+class ServerTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        _install_serializer_timing()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with capture_queries(metrics.query_wrapper):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        header = settings.REQUEST_TIMING_HEADER or _has_session(request) and _is_staff(request)
+        return self.process(request, response, metrics, header)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with capture_queries(metrics.query_wrapper):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        # Пользователь из сессии загружается синхронно
+        header = settings.REQUEST_TIMING_HEADER or _has_session(request) and await sync_to_async(_is_staff)(request)
+        return self.process(request, response, metrics, header)
+
+    def process(self, request, response, metrics, header):
+        metrics.finish()
+        if header:
+            response['Server-Timing'] = metrics.server_timing()
+        self.log(request, response, metrics)
+        return response
+
+    def log(self, request, response, metrics):
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **metrics.as_dict(),
+        }
+        flags = []
+        if metrics.total_time * 1000 >= settings.SLOW_REQUEST_MS:
+            flags.append('slow')
+        repeated = metrics.repeated_queries(settings.REPEATED_QUERY_THRESHOLD)
+        if repeated:
+            flags.append('n+1')
+            fields['repeated_queries'] = [{'sql': sql[:200], 'count': count} for sql, count in repeated]
+        fields['flags'] = flags
+
+        level = logging.WARNING if flags else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        summary = ' '.join(f'{key}={fields[key]}' for key in metrics.as_dict())
+        message = f"{request.method} {request.path} {response.status_code} {summary}"
+        if flags:
+            message += f" flags={','.join(flags)}"
+        for item in fields.get('repeated_queries', []):
+            message += f"\n  {item['count']}x {item['sql']}"
+        logger.log(level, message, extra={'request_metrics': fields})
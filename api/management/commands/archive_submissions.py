@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.archive import ARCHIVES, archive_old
+
+
+class Command(BaseCommand):
+    help = 'Move old orders and contact messages to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=ARCHIVES, action='append', help='Archive only this table (can be repeated)')
+        parser.add_argument('--batch-size', type=int, help='Rows per transaction (default: ARCHIVE_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        for name in options['only'] or ARCHIVES:
+            moved = archive_old(name, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Archived {moved} {name.replace("_", " ")}'))
@@ -0,0 +1,85 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import QueryDict
+
+from api.filters import ProductFilter, PRODUCT_FILTER_FIELDS
+from api.models import Product
+
+
+def legacy_filter(queryset, query_params):
+    """Фильтрация в прежнем виде: одно точное значение на поле, цепочка filter()"""
+    category_id = query_params.get('category')
+    if category_id:
+        queryset = queryset.filter(category_id=category_id)
+    availability = query_params.get('availability')
+    if availability == 'in-stock':
+        queryset = queryset.filter(quantity__gt=0)
+    elif availability == 'out-of-stock':
+        queryset = queryset.filter(quantity=0)
+    for field in PRODUCT_FILTER_FIELDS:
+        value = query_params.get(field)
+        if value:
+            queryset = queryset.filter(**{field: value})
+    return queryset
+
+
+class Command(BaseCommand):
+    help = 'Compare compiled product filters with the legacy single-value filtering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='Number of random filter combinations')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        samples = list(Product.objects.order_by('id').values('category_id', *PRODUCT_FILTER_FIELDS)[:2000])
+        if not samples:
+            self.stderr.write('No products in the database')
+            return
+
+        cases = []
+        for _ in range(options['queries']):
+            sample = rng.choice(samples)
+            params = QueryDict(mutable=True)
+            params['category'] = str(sample['category_id'])
+            for field in rng.sample(PRODUCT_FILTER_FIELDS, rng.randint(0, 3)):
+                if sample[field]:
+                    params[field] = sample[field]
+            if rng.random() < 0.5:
+                params['availability'] = 'in-stock'
+            cases.append(params)
+
+        results = {}
+        for name, build in (
+            ('legacy', lambda params: legacy_filter(Product.objects.all(), params)),
+            ('compiled', lambda params: ProductFilter(params).apply(Product.objects.all())),
+        ):
+            compile_times, query_times = [], []
+            for params in cases:
+                start = time.perf_counter()
+                queryset = build(params).values_list('id', flat=True)[:20]
+                sql, sql_params = queryset.query.sql_with_params()
+                compile_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, sql_params)
+                    cursor.fetchall()
+                query_times.append(time.perf_counter() - start)
+            results[name] = (compile_times, query_times)
+
+        self.stdout.write(f'{len(cases)} filter combinations, times in ms (median / p95)')
+        for name, (compile_times, query_times) in results.items():
+            self.stdout.write(
+                f'{name:>9}: compile {_ms(compile_times)}  query {_ms(query_times)}'
+            )
+
+
+def _ms(values):
+    values = sorted(values)
+    p95 = values[int(len(values) * 0.95) - 1] if len(values) > 1 else values[0]
+    return f'{statistics.median(values) * 1000:.3f} / {p95 * 1000:.3f}'
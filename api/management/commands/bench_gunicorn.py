@@ -0,0 +1,146 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+PROFILES = {
+    # То, что запускалось раньше: один sync-воркер, соединение с базой на каждый запрос
+    'default': ['gunicorn', 'geology.wsgi:application'],
+    'tuned-no-reuse': ['gunicorn', '-c', 'geology/gunicorn_conf.py', 'geology.wsgi:application'],
+    'tuned': ['gunicorn', '-c', 'geology/gunicorn_conf.py', 'geology.wsgi:application'],
+    'pooled': ['gunicorn', '-c', 'geology/gunicorn_conf.py', 'geology.wsgi:application'],
+    # ASGI с асинхронными представлениями каталога
+    'asgi': ['gunicorn', '-c', 'geology/gunicorn_conf.py', 'geology.asgi:application'],
+}
+PROFILE_ENV = {
+    'default': {'DB_CONN_MAX_AGE': '0'},
+    'tuned-no-reuse': {'DB_CONN_MAX_AGE': '0'},
+    'pooled': {'DB_POOL_SIZE': '4'},
+    'asgi': {'GUNICORN_WORKER_CLASS': 'uvicorn.workers.UvicornWorker'},
+}
+READ_SCENARIOS = ['product_list', 'product_filter', 'category_filters', 'sale_items']
+
+
+class LatencyProxy:
+    """TCP-прокси к Postgres с задержкой на каждый пакет: база «на другом хосте».
+
+    На одной машине запросы к базе почти не ждут сети, и выигрыш потоков
+    gthread не виден; задержка воспроизводит ожидание ввода-вывода в проде.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.port = None
+        self.loop = asyncio.new_event_loop()
+        self.started = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        self.started.wait()
+        return self.port
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(asyncio.start_server(self._handle, '127.0.0.1', 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_forever()
+
+    async def _open_upstream(self):
+        database = settings.DATABASES['default']
+        host = database['HOST'] or 'localhost'
+        port = int(database['PORT'] or 5432)
+        if host.startswith('/'):
+            return await asyncio.open_unix_connection(os.path.join(host, f'.s.PGSQL.{port}'))
+        return await asyncio.open_connection(host, port)
+
+    async def _pipe(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                await asyncio.sleep(self.delay)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, client_reader, client_writer):
+        upstream_reader, upstream_writer = await self._open_upstream()
+        await asyncio.gather(
+            self._pipe(client_reader, upstream_writer),
+            self._pipe(upstream_reader, client_writer),
+        )
+
+
+class Command(BaseCommand):
+    help = 'Start gunicorn with the default and the tuned configuration and compare their throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', choices=PROFILES, dest='profiles')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--scenario', action='append', dest='scenarios')
+        parser.add_argument('--output-dir', help='Where to keep the JSON results (default: a temporary directory)')
+        parser.add_argument('--db-latency', type=float, default=1.0,
+                            help='Milliseconds added to every packet between gunicorn and Postgres (0 to connect directly)')
+
+    def handle(self, *args, **options):
+        profiles = options['profiles'] or list(PROFILES)
+        output_dir = options['output_dir'] or tempfile.mkdtemp(prefix='bench-gunicorn-')
+        os.makedirs(output_dir, exist_ok=True)
+        address = f'127.0.0.1:{options["port"]}'
+        database_env = {}
+        if options['db_latency']:
+            proxy_port = LatencyProxy(options['db_latency'] / 1000).start()
+            database_env = {'DB_HOST': '127.0.0.1', 'DB_PORT': str(proxy_port)}
+
+        previous = None
+        for profile in profiles:
+            command_line = [f'{name}={value}' for name, value in PROFILE_ENV.get(profile, {}).items()] + PROFILES[profile]
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{profile}: {" ".join(command_line)}'))
+            env = {
+                **os.environ, **database_env, **PROFILE_ENV.get(profile, {}),
+                'GUNICORN_BIND': address, 'GUNICORN_ACCESS_LOG': '',
+            }
+            command = [*PROFILES[profile], '--bind', address] if profile == 'default' else PROFILES[profile]
+            server = subprocess.Popen(
+                [sys.executable, '-m', *command], cwd=settings.BASE_DIR, env=env,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                self.wait_ready(f'http://{address}', server)
+                output = os.path.join(output_dir, f'{profile}.json')
+                call_command(
+                    'benchmark', url=f'http://{address}', output=output, baseline=previous,
+                    requests=options['requests'], concurrency=options['concurrency'],
+                    scenarios=options['scenarios'] or READ_SCENARIOS, stdout=self.stdout,
+                )
+                previous = output
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+
+    def wait_ready(self, base_url, server, timeout=60):
+        deadline = time.monotonic() + timeout
+        request = urllib.request.Request(f'{base_url}/api/v1/categories/', headers={'X-Forwarded-Proto': 'https'})
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'gunicorn exited with code {server.returncode}')
+            try:
+                with urllib.request.urlopen(request, timeout=5):
+                    return
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.5)
+        raise CommandError('gunicorn did not start in time')
@@ -0,0 +1,276 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from api.filters import PRODUCT_FILTER_FIELDS
+from api.models import Category, Product
+from api.synthetic import SYNTHETIC_EMAIL_DOMAIN
+
+SCENARIOS = ['product_list', 'product_filter', 'category_filters', 'category_retrieve', 'sale_items', 'order_create']
+# Сценарии с записью в базу: против запущенного сервера (--url) не выполняются, поэтому там
+# не мешают и токен-бакеты записи (api.throttling) — чтения они не ограничивают
+WRITE_SCENARIOS = {'order_create'}
+
+
+class Catalog:
+    """Идентификаторы и значения атрибутов, из которых собираются запросы"""
+
+    def __init__(self):
+        self.category_ids = list(Category.objects.values_list('id', flat=True))
+        self.samples = list(Product.objects.order_by('id').values('id', 'name', 'price', *PRODUCT_FILTER_FIELDS)[:2000])
+        if not self.category_ids or not self.samples:
+            raise CommandError('The catalog is empty; run seed_catalog first')
+        self.pages = max(1, min(Product.objects.count() // settings.REST_FRAMEWORK['PAGE_SIZE'], 50))
+
+    def filter_params(self, rng):
+        sample = rng.choice(self.samples)
+        params = {}
+        for field in rng.sample(PRODUCT_FILTER_FIELDS, rng.randint(1, 3)):
+            if sample[field]:
+                params[field] = sample[field]
+        if rng.random() < 0.5:
+            params['availability'] = 'in-stock'
+        return params
+
+    def request(self, scenario, rng):
+        """(метод, путь, тело) очередного запроса сценария"""
+        if scenario == 'product_list':
+            return 'GET', f'/api/v1/products/?{urlencode({"page": rng.randint(1, self.pages)})}', None
+        if scenario == 'product_filter':
+            params = {'category': rng.choice(self.category_ids), **self.filter_params(rng)}
+            return 'GET', f'/api/v1/products/?{urlencode(params)}', None
+        if scenario == 'category_filters':
+            path = f'/api/v1/categories/{rng.choice(self.category_ids)}/filters/'
+            return 'GET', f'{path}?{urlencode(self.filter_params(rng))}', None
+        if scenario == 'category_retrieve':
+            return 'GET', f'/api/v1/categories/{rng.choice(self.category_ids)}/', None
+        if scenario == 'sale_items':
+            return 'GET', '/api/v1/sale-items/', None
+        if scenario == 'order_create':
+            product = rng.choice(self.samples)
+            return 'POST', '/api/v1/orders/', {
+                'phone': '+79000000000', 'email': f'bench@{SYNTHETIC_EMAIL_DOMAIN}',
+                'first_name': 'Бенчмарк', 'last_name': 'Тестовый', 'zip_code': '450000',
+                'region': 'Башкортостан', 'city': 'Уфа', 'address': 'ул. Ленина, 1',
+                'delivery_method': 'pickup', 'agreed_to_terms': True, 'total': str(product['price']),
+                'products': [{'id': product['id'], 'name': product['name'], 'price': str(product['price']), 'quantity': 1}],
+            }
+        raise ValueError(scenario)
+
+
+class InProcessTransport:
+    def __init__(self, cold):
+        host = urlsplit(settings.PUBLIC_API_URL)
+        self.host = host.netloc
+        self.secure = host.scheme == 'https'
+        self.cold = cold
+        self.local = threading.local()
+
+    def __call__(self, method, path, body):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(HTTP_HOST=self.host)
+        if self.cold:
+            cache.clear()
+        if method == 'POST':
+            response = client.post(path, json.dumps(body), content_type='application/json', secure=self.secure)
+        else:
+            response = client.get(path, secure=self.secure)
+        return response.status_code
+
+    def close_thread(self):
+        connections.close_all()
+
+
+class HTTPTransport:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def __call__(self, method, path, body):
+        data = json.dumps(body).encode() if body is not None else None
+        # Как за nginx: иначе SECURE_SSL_REDIRECT отвечает редиректом на https
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method,
+            headers={'Content-Type': 'application/json', 'X-Forwarded-Proto': 'https'},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def close_thread(self):
+        pass
+
+
+def _percentile(values, fraction):
+    index = min(len(values) - 1, max(0, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+def _summary(latencies, errors, wall_time):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / wall_time, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        'p50_ms': round(_percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(_percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Measure API latency and throughput on the current (seeded) database and compare with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, dest='scenarios',
+                            help='Run only this scenario (can be repeated)')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=1, help='Parallel clients')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--url', help='Benchmark a running server (e.g. http://localhost:8000) instead of in-process')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every in-process request')
+        parser.add_argument('--output', help='Where to save the JSON results (default: benchmarks/<timestamp>.json)')
+        parser.add_argument('--baseline', help='JSON results to compare with')
+        parser.add_argument('--tolerance', type=float, default=10, help='Allowed slowdown, percent')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        catalog = Catalog()
+        scenarios = options['scenarios'] or SCENARIOS
+        if options['url']:
+            transport = HTTPTransport(options['url'])
+            scenarios = [scenario for scenario in scenarios if scenario not in WRITE_SCENARIOS]
+        else:
+            transport = InProcessTransport(options['cold'])
+        # Клиент Django и потоки используют свои соединения — текущее больше не нужно
+        connection.close()
+
+        results = {}
+        # Без токен-бакетов order_create измерял бы ответы 429
+        with override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', WRITE_THROTTLE_ENABLED=False,
+        ):
+            for scenario in scenarios:
+                results[scenario] = self.run_scenario(catalog, transport, scenario, options)
+                self.stdout.write(self.format_result(scenario, results[scenario]))
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'commit': _git_commit(),
+                'mode': 'http' if options['url'] else 'in-process',
+                'cold_cache': options['cold'],
+                'products': Product.objects.count(),
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'seed': options['seed'],
+            },
+            'scenarios': results,
+        }
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f'{timezone.now():%Y%m%d-%H%M%S}.json'
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Results saved to {output}')
+
+        if options['baseline']:
+            regressions = self.compare(report, options['baseline'], options['tolerance'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'Regressions: {", ".join(regressions)}')
+
+    def run_scenario(self, catalog, transport, scenario, options):
+        rng = random.Random(f'{options["seed"]}-{scenario}')
+        warmup = [catalog.request(scenario, rng) for _ in range(options['warmup'])]
+        planned = [catalog.request(scenario, rng) for _ in range(options['requests'])]
+        for request in warmup:
+            transport(*request)
+
+        latencies, errors = [], 0
+        lock = threading.Lock()
+        queue = iter(planned)
+
+        def worker():
+            nonlocal errors
+            try:
+                while True:
+                    with lock:
+                        request = next(queue, None)
+                    if request is None:
+                        return
+                    start = time.perf_counter()
+                    status = transport(*request)
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        if not 200 <= status < 300:
+                            errors += 1
+            finally:
+                transport.close_thread()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return _summary(latencies, errors, time.perf_counter() - start)
+
+    def format_result(self, scenario, result):
+        line = (
+            f'{scenario:>18}: {result["rps"]:8.1f} req/s  p50 {result["p50_ms"]:8.2f}  '
+            f'p95 {result["p95_ms"]:8.2f}  p99 {result["p99_ms"]:8.2f} ms  errors {result["errors"]}'
+        )
+        # Ошибки (не 2xx) отвечают быстрее настоящей работы, и замер сценария не сравним с базовым
+        return self.style.WARNING(line) if result['errors'] else line
+
+    def compare(self, report, baseline_path, tolerance):
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        self.stdout.write(f'\nCompared with {baseline_path} (commit {baseline["meta"].get("commit")})')
+        regressions = []
+        for scenario, result in report['scenarios'].items():
+            before = baseline['scenarios'].get(scenario)
+            if before is None:
+                continue
+            p95_change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+            rps_change = (result['rps'] - before['rps']) / before['rps'] * 100
+            regressed = p95_change > tolerance or rps_change < -tolerance
+            line = f'{scenario:>18}: p95 {before["p95_ms"]:.2f} -> {result["p95_ms"]:.2f} ms ({p95_change:+.1f}%)  ' \
+                   f'rps {before["rps"]:.1f} -> {result["rps"]:.1f} ({rps_change:+.1f}%)'
+            if regressed:
+                regressions.append(scenario)
+                self.stdout.write(self.style.ERROR(line + '  REGRESSION'))
+            else:
+                self.stdout.write(line)
+        return regressions
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.feeds import build_feeds
+
+
+class Command(BaseCommand):
+    help = 'Build the Yandex Market feed and sitemap, rewriting only shards with changed products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rewrite every shard')
+
+    def handle(self, *args, **options):
+        written = build_feeds(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Feeds updated, {written} shards rewritten'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api.similarity import build_similar_products, update_similar_products
+
+
+class Command(BaseCommand):
+    help = 'Rebuild precomputed similar products (fully or for the given products only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product', type=int, action='append', dest='product_ids',
+            help='Recompute only around this product id (can be repeated)'
+        )
+        parser.add_argument('--count', type=int, help='Number of similar products to keep')
+
+    def handle(self, *args, **options):
+        if options['product_ids']:
+            updated = update_similar_products(options['product_ids'], k=options['count'])
+            self.stdout.write(self.style.SUCCESS(f'Recomputed similar products for {updated} products'))
+        else:
+            created = build_similar_products(k=options['count'])
+            self.stdout.write(self.style.SUCCESS(f'Stored similar products for {created} products'))
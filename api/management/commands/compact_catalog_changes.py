@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.changes import compact_changes
+
+
+class Command(BaseCommand):
+    help = 'Drop catalog change records superseded by a later change of the same object'
+
+    def handle(self, *args, **kwargs):
+        removed = compact_changes()
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} superseded catalog changes'))
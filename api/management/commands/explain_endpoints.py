@@ -0,0 +1,183 @@
+import json
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+
+from api.instrumentation import fingerprint
+from api.models import Category, Product, SaleItem
+from api.synthetic import seed_catalog
+
+DEFAULT_CALLS = [
+    '/api/v1/products/',
+    '/api/v1/products/?category={category}',
+    '/api/v1/products/?category={category}&availability=in-stock&price_min=1000',
+    '/api/v1/products/{product}/',
+    '/api/v1/products/{product}/similar/',
+    '/api/v1/products/filters/?category={category}',
+    '/api/v1/categories/',
+    '/api/v1/categories/{category}/',
+    '/api/v1/categories/{category}/products/',
+    '/api/v1/categories/{category}/filters/',
+    '/api/v1/sale-items/',
+    '/api/v1/sale-items/{sale_item}/',
+    '/api/v1/changes/?limit=100',
+]
+
+
+class StatementRecorder:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        # EXPLAIN ANALYZE выполняет запрос, поэтому повторяем только чтение
+        if not many and sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+            self.statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def _walk(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _walk(child)
+
+
+def _plan_summary(plan):
+    nodes = list(_walk(plan))
+    rows_examined = 0
+    seq_scans = []
+    for node in nodes:
+        if 'Scan' in node['Node Type']:
+            rows = node.get('Actual Rows', 0) + node.get('Rows Removed by Filter', 0) \
+                + node.get('Rows Removed by Index Recheck', 0)
+            rows_examined += rows * node.get('Actual Loops', 1)
+        if node['Node Type'] == 'Seq Scan':
+            seq_scans.append(node['Relation Name'])
+    return {
+        'cost': plan['Total Cost'],
+        'time_ms': plan.get('Actual Total Time', 0) * plan.get('Actual Loops', 1),
+        'rows_examined': int(rows_examined),
+        'seq_scans': sorted(seq_scans),
+        'shared_hit': plan.get('Shared Hit Blocks', 0),
+        'shared_read': plan.get('Shared Read Blocks', 0),
+        'shape': [_node_label(node) for node in nodes],
+    }
+
+
+def _node_label(node):
+    label = node['Node Type']
+    if 'Index Name' in node:
+        label += f' using {node["Index Name"]}'
+    if 'Relation Name' in node:
+        label += f' on {node["Relation Name"]}'
+    return label
+
+
+class Command(BaseCommand):
+    help = 'Replay API calls in-process and report EXPLAIN (ANALYZE, BUFFERS) for every SELECT they run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', help='JSON file with a list of paths; {category}, {product}, {sale_item} are filled in')
+        parser.add_argument('--seed', type=int, metavar='PRODUCTS',
+                            help='Seed a synthetic catalog of this size inside a transaction that is rolled back')
+        parser.add_argument('--timings', action='store_true',
+                            help='Include actual times and buffer counts (they make reports noisy to diff)')
+        parser.add_argument('--output', help='Write the report here instead of stdout')
+
+    def handle(self, *args, **options):
+        calls = DEFAULT_CALLS
+        if options['calls']:
+            with open(options['calls'], encoding='utf-8') as f:
+                calls = json.load(f)
+
+        # Все чтения — в основной базе: реплики не видят каталог из незакоммиченной транзакции,
+        # а запросы к ним не попали бы в recorder соединения default
+        with transaction.atomic(), override_settings(REPLICA_DATABASES=[]):
+            if options['seed']:
+                seed_catalog(products=options['seed'], categories=10, sale_items=20)
+            results = self.explain_calls(calls)
+            # EXPLAIN ANALYZE выполняет запросы; откатываем всё, включая синтетический каталог
+            transaction.set_rollback(True)
+
+        report = self.format_report(results, options['timings'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(report)
+            self.stdout.write(f'Report written to {options["output"]}')
+        else:
+            self.stdout.write(report, ending='')
+
+    def placeholders(self):
+        category = (
+            Category.objects.annotate(size=Count('products')).order_by('-size', 'id').values_list('id', flat=True).first()
+        )
+        product = Product.objects.filter(category_id=category).order_by('id').values_list('id', flat=True).first()
+        sale_item = SaleItem.objects.order_by('id').values_list('slug', flat=True).first()
+        if category is None or product is None:
+            raise CommandError('The catalog is empty; seed it with seed_catalog or pass --seed')
+        return {'category': category, 'product': product, 'sale_item': sale_item}
+
+    def explain_calls(self, calls):
+        values = self.placeholders()
+        host = urlsplit(settings.PUBLIC_API_URL)
+        client = Client(HTTP_HOST=host.netloc)
+        results = []
+        for template in calls:
+            path = template.format(**values)
+            cache.clear()
+            recorder = StatementRecorder()
+            with connection.execute_wrapper(recorder):
+                response = client.get(path, secure=host.scheme == 'https')
+
+            statements = {}
+            for sql, params in recorder.statements:
+                key = fingerprint(sql)
+                if key in statements:
+                    statements[key]['calls'] += 1
+                    continue
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+                    plan = cursor.fetchone()[0]
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                statements[key] = {'sql': key, 'calls': 1, **_plan_summary(plan[0]['Plan'])}
+            results.append({'path': template, 'status': response.status_code, 'statements': list(statements.values())})
+        return results
+
+    def format_report(self, results, timings):
+        lines = []
+        everything = [(result['path'], statement) for result in results for statement in result['statements']]
+
+        lines.append('== Statements by cost ==')
+        for path, statement in sorted(everything, key=lambda item: (-item[1]['cost'], item[0], item[1]['sql'])):
+            lines.append(f'{statement["cost"]:>12.2f}  {path}  {statement["sql"][:120]}')
+
+        lines.append('')
+        lines.append('== Sequential scans ==')
+        for path, statement in sorted(everything, key=lambda item: (-len(item[1]['seq_scans']), item[0], item[1]['sql'])):
+            if statement['seq_scans']:
+                lines.append(f'{", ".join(statement["seq_scans"]):>40}  {path}  {statement["sql"][:80]}')
+
+        lines.append('')
+        lines.append('== Rows examined ==')
+        for path, statement in sorted(everything, key=lambda item: (-item[1]['rows_examined'], item[0], item[1]['sql'])):
+            lines.append(f'{statement["rows_examined"]:>12}  {path}  {statement["sql"][:120]}')
+
+        for result in results:
+            lines.append('')
+            lines.append(f'== {result["path"]} ({result["status"]}, {len(result["statements"])} distinct statements) ==')
+            for statement in result['statements']:
+                lines.append(f'-- x{statement["calls"]} cost={statement["cost"]:.2f} rows_examined={statement["rows_examined"]}')
+                if timings:
+                    lines.append(
+                        f'-- time={statement["time_ms"]:.3f}ms shared_hit={statement["shared_hit"]} '
+                        f'shared_read={statement["shared_read"]}'
+                    )
+                lines.append(statement['sql'])
+                lines.extend(f'   {node}' for node in statement['shape'])
+        lines.append('')
+        return '\n'.join(lines)
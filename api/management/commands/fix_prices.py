@@ -1,20 +1,29 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.changes import record_changes
 from api.models import Product  # Измените импорт на ваше приложение
+from api.streaming import notify_products
 
 
 class Command(BaseCommand):
     help = 'Fix product prices before making price required'
 
     def handle(self, *args, **kwargs):
-        # Установите минимальную цену для товаров без цены
-        updated_null = Product.objects.filter(price__isnull=True).update(price=0.01)
-
-        # Исправьте нулевые цены
-        updated_zero = Product.objects.filter(price=0).update(price=0.01)
+        with transaction.atomic():
+            # Товары без цены и с нулевой ценой получают минимальную цену
+            null_ids = list(Product.objects.filter(price__isnull=True).values_list('id', flat=True))
+            zero_ids = list(Product.objects.filter(price=0).values_list('id', flat=True))
+            ids = null_ids + zero_ids
+            Product.objects.filter(pk__in=ids).update(price=0.01, updated_at=timezone.now())
+            # update() не шлёт сигналов — журнал изменений и поток остатков пишем сами
+            record_changes(Product, ids)
+            notify_products(Product.objects.filter(pk__in=ids).only('id', 'price', 'quantity', 'updated_at'))
 
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully fixed {updated_null + updated_zero} product prices. '
-                f'Null prices: {updated_null}, Zero prices: {updated_zero}'
+                f'Successfully fixed {len(ids)} product prices. '
+                f'Null prices: {len(null_ids)}, Zero prices: {len(zero_ids)}'
             )
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.publishing import publish_catalog, watch_catalog
+
+
+class Command(BaseCommand):
+    help = 'Render the public catalog API to a static snapshot and switch nginx to it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--watch', action='store_true',
+            help='Keep running and publish after catalog changes (run exactly one such process)',
+        )
+
+    def handle(self, *args, **options):
+        if options['watch']:
+            watch_catalog()
+            return
+        version, files = publish_catalog()
+        self.stdout.write(self.style.SUCCESS(f'Published catalog version {version} ({files} files)'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired Idempotency-Key records with their stored responses'
+
+    def handle(self, *args, **kwargs):
+        removed = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired idempotency keys'))
@@ -0,0 +1,42 @@
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the frontend revalidation hook and print received batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=3001)
+        parser.add_argument('--fail', type=int, default=0, help='Answer 503 to the first N requests')
+
+    def handle(self, *args, **options):
+        stdout = self.stdout
+        failures = {'left': options['fail']}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if failures['left'] > 0:
+                    failures['left'] -= 1
+                    self.send_response(503)
+                    self.end_headers()
+                    stdout.write('503 (simulated failure)')
+                    return
+                paths = json.loads(body or b'{}').get('paths', [])
+                stdout.write(f'{len(paths)} paths: {", ".join(paths)}')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{"revalidated": true}')
+
+            def log_message(self, format, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', options['port']), Handler)
+        self.stdout.write(f'Listening on http://127.0.0.1:{options["port"]}/ (Ctrl+C to stop)')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.models import CatalogChange, Category, Order, Product, ProductImage, ProductSimilarity, SaleItem, \
+    SaleItemImage
+from api.synthetic import SYNTHETIC_EMAIL_DOMAIN, seed_catalog
+
+# Заказы не очищаются: их id остаются в архиве заказов и сохранённых ответах Idempotency-Key
+FLUSHED_MODELS = [CatalogChange, Category, Product, ProductImage, ProductSimilarity, SaleItem, SaleItemImage]
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic catalog for benchmarks and load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--sale-items', type=int, default=50)
+        parser.add_argument('--max-images', type=int, default=3, help='Up to this many images per product')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--flush', action='store_true',
+            help='Truncate the catalog and the change feed first (ids restart from 1) and delete synthetic orders'
+        )
+
+    def handle(self, *args, **options):
+        if options['flush']:
+            # TRUNCATE вместо delete(): без каскада сигналов на каждый товар
+            tables = ', '.join(connection.ops.quote_name(model._meta.db_table) for model in FLUSHED_MODELS)
+            with connection.cursor() as cursor:
+                cursor.execute(f'TRUNCATE {tables} RESTART IDENTITY CASCADE')
+            Order.objects.filter(email__iendswith=f'@{SYNTHETIC_EMAIL_DOMAIN}').delete()
+            self.stdout.write('Existing catalog truncated')
+        elif Category.objects.exists():
+            raise CommandError('The catalog is not empty; use --flush to replace it')
+
+        counts = seed_catalog(
+            products=options['products'],
+            categories=options['categories'],
+            orders=options['orders'],
+            sale_items=options['sale_items'],
+            max_images=options['max_images'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(', '.join(f'{count} {name}' for name, count in counts.items())))
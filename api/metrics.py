@@ -0,0 +1,150 @@
+"""Метрики Prometheus и эндпоинт /metrics.
+
+Под gunicorn каждый воркер пишет значения в общий каталог
+PROMETHEUS_MULTIPROC_DIR (переменная окружения задаётся до старта
+процессов, каталог очищается при запуске), а /metrics собирает их по всем
+воркерам. Без переменной используется обычный реестр текущего процесса.
+"""
+import ipaddress
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, \
+    generate_latest, multiprocess
+
+from .instrumentation import current_metrics
+
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+REQUEST_DURATION = Histogram(
+    'api_request_duration_seconds', 'Время обработки запроса',
+    ['route', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RESPONSES = Counter('api_responses_total', 'Ответы по маршрутам и кодам', ['route', 'method', 'status'])
+DB_QUERIES = Histogram(
+    'api_db_queries_per_request', 'Число SQL-запросов на HTTP-запрос',
+    ['route'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+DB_DURATION = Histogram(
+    'api_db_duration_seconds', 'Суммарное время SQL на HTTP-запрос',
+    ['route'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DB_CONNECTIONS = Counter(
+    'api_db_connections_total', 'Получение соединения с базой: opened — новое, reused — постоянное или из пула',
+    ['result'],
+)
+DB_CONNECTION_WAIT = Histogram(
+    'api_db_connection_wait_seconds', 'Ожидание соединения с базой (открытие или место в пуле)',
+    buckets=(0, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1, 5),
+)
+CACHE_REQUESTS = Counter('api_cache_requests_total', 'Обращения к кэшу api.caching', ['result'])
+EMAIL_OUTBOX = Gauge(
+    'api_email_outbox', 'Письма, ожидающие отправки в фоновых потоках',
+    multiprocess_mode='livesum',
+)
+EMAILS = Counter('api_emails_total', 'Отправленные письма', ['kind', 'result'])
+THROTTLED = Counter('api_throttled_total', 'Запросы, отклонённые api.throttling', ['scope', 'bucket'])
+IDEMPOTENCY = Counter(
+    'api_idempotency_total', 'Повторы запросов с Idempotency-Key: replayed, in_progress, mismatch',
+    ['scope', 'result'],
+)
+WORKER = Gauge(
+    'api_worker_start_time_seconds', 'Время запуска процесса-воркера (метка pid — идентификатор воркера)',
+    multiprocess_mode='liveall',
+)
+
+
+def register_worker():
+    """Отметить процесс как воркер: под gunicorn — хук post_fork, иначе ApiConfig.ready()"""
+    WORKER.set(time.time())
+
+
+def record_connection(reused, wait):
+    """Для бэкенда geology.postgresql: каждое получение соединения"""
+    DB_CONNECTIONS.labels('reused' if reused else 'opened').inc()
+    DB_CONNECTION_WAIT.observe(wait)
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.connect_time += wait
+
+
+def client_ip(request):
+    # X-Real-IP выставляет nginx; при прямом обращении внутри сети docker его нет
+    return request.META.get('HTTP_X_REAL_IP') or request.META.get('REMOTE_ADDR', '')
+
+
+def _is_internal(ip):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def metrics_view(request):
+    # Адрес соединения, а не X-Real-IP: заголовок задаёт клиент, а снаружи nginx /metrics не проксирует
+    if not _is_internal(request.META.get('REMOTE_ADDR', '')):
+        return HttpResponseForbidden()
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_dead(pid):
+    """Для хука child_exit gunicorn: убрать live-метрики завершившегося воркера"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
+
+
+class PrometheusMiddleware:
+    """Латентность и коды ответов по именам маршрутов; SQL и кэш берутся из ServerTimingMiddleware"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        return self.observe(request, response, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        return self.observe(request, response, time.perf_counter() - start)
+
+    def observe(self, request, response, duration):
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        if route == 'metrics':
+            return response
+        REQUEST_DURATION.labels(route, request.method).observe(duration)
+        RESPONSES.labels(route, request.method, response.status_code).inc()
+
+        metrics = current_metrics()
+        if metrics is not None:
+            DB_QUERIES.labels(route).observe(metrics.queries)
+            DB_DURATION.labels(route).observe(metrics.db_time)
+            if metrics.cache_hits:
+                CACHE_REQUESTS.labels('hit').inc(metrics.cache_hits)
+            if metrics.cache_misses:
+                CACHE_REQUESTS.labels('miss').inc(metrics.cache_misses)
+        return response
@@ -0,0 +1,32 @@
+# Generated by Django 4.2 on 2026-10-18 23:07
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_order_options_remove_order_user_order_products_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSimilarity',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='similarity', serialize=False, to='api.product', verbose_name='Продукт')),
+                ('similar_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), size=None, verbose_name='Похожие продукты')),
+                ('scores', django.contrib.postgres.fields.ArrayField(base_field=models.FloatField(), size=None, verbose_name='Сходство')),
+            ],
+            options={
+                'verbose_name': 'Похожие продукты',
+                'verbose_name_plural': 'Похожие продукты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productsimilarity',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['similar_ids'], name='similarity_similar_ids_gin'),
+        ),
+    ]
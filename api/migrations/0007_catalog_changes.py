@@ -0,0 +1,74 @@
+# Generated by Django 4.2 on 2026-10-18 23:11
+
+from django.db import migrations, models
+
+# Начальное наполнение журнала: курсор с нуля отдаёт весь текущий каталог
+BACKFILL_TABLES = [
+    ('category', 'api_category'),
+    ('product', 'api_product'),
+    ('product_image', 'api_productimage'),
+    ('sale_item', 'api_saleitem'),
+    ('sale_item_image', 'api_saleitemimage'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_product_category_price_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('category', 'Категория'), ('product', 'Продукт'), ('product_image', 'Изображение продукта'), ('sale_item', 'Товар распродажи'), ('sale_item_image', 'Изображение товара распродажи')], max_length=32, verbose_name='Модель')),
+                ('object_id', models.BigIntegerField(verbose_name='ID объекта')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Удалён')),
+                ('txid', models.BigIntegerField(verbose_name='Транзакция')),
+                ('changed_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Изменение каталога',
+                'verbose_name_plural': 'Изменения каталога',
+                'ordering': ['txid', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата обновления'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата обновления'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата обновления'),
+        ),
+        migrations.AddField(
+            model_name='saleitemimage',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата обновления'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogchange',
+            index=models.Index(fields=['txid', 'id'], name='catalog_change_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogchange',
+            index=models.Index(fields=['model', 'object_id'], name='catalog_change_object_idx'),
+        ),
+        migrations.RunSQL(
+            [
+                f"INSERT INTO api_catalogchange (model, object_id, deleted, txid, changed_at) "
+                f"SELECT '{model}', id, false, txid_current(), now() FROM {table} ORDER BY id"
+                for model, table in BACKFILL_TABLES
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
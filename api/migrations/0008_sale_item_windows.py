@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-18 23:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_catalog_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saleitem',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Окончание показа'),
+        ),
+        migrations.AddField(
+            model_name='saleitem',
+            name='starts_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Начало показа'),
+        ),
+        migrations.AddIndex(
+            model_name='saleitem',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['starts_at', 'ends_at'], name='sale_item_active_window_idx'),
+        ),
+    ]
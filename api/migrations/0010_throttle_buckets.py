@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-19 00:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleBucket',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Ключ')),
+                ('tokens', models.FloatField(verbose_name='Токены')),
+                ('updated_at', models.DateTimeField(verbose_name='Обновлён')),
+            ],
+            options={
+                'verbose_name': 'Бакет ограничения запросов',
+                'verbose_name_plural': 'Бакеты ограничения запросов',
+            },
+        ),
+        # Состояние бакетов не нужно переживать сбой: без WAL каждое списание дешевле
+        migrations.RunSQL(
+            'ALTER TABLE api_throttlebucket SET UNLOGGED',
+            reverse_sql='ALTER TABLE api_throttlebucket SET LOGGED',
+        ),
+    ]
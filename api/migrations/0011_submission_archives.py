@@ -0,0 +1,71 @@
+# Generated by Django 4.2 on 2026-10-19 00:02
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_throttle_buckets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContactMessageArchive',
+            fields=[
+                ('email', models.EmailField(max_length=255)),
+                ('message', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+            ],
+            options={
+                'verbose_name': 'Архивное сообщение',
+                'verbose_name_plural': 'Архив сообщений',
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderArchive',
+            fields=[
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(default='new', max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('phone', models.CharField(max_length=20)),
+                ('email', models.EmailField(max_length=254)),
+                ('comment', models.TextField(blank=True)),
+                ('first_name', models.CharField(max_length=100, verbose_name='Имя')),
+                ('last_name', models.CharField(max_length=100, verbose_name='Фамилия')),
+                ('company', models.CharField(blank=True, max_length=100, verbose_name='Компания')),
+                ('country', models.CharField(default='Российская Федерация', max_length=100, verbose_name='Страна')),
+                ('zip_code', models.CharField(max_length=20, verbose_name='Индекс')),
+                ('region', models.CharField(max_length=100, verbose_name='Регион')),
+                ('city', models.CharField(max_length=100, verbose_name='Город')),
+                ('address', models.CharField(max_length=255, verbose_name='Адрес')),
+                ('delivery_method', models.CharField(max_length=50, verbose_name='Способ доставки')),
+                ('agreed_to_terms', models.BooleanField(default=False, verbose_name='Согласие')),
+                ('products', models.JSONField(default=list, verbose_name='Товары')),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+            ],
+            options={
+                'verbose_name': 'Архивный заказ',
+                'verbose_name_plural': 'Архив заказов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(fields=['created_at'], name='contact_message_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderarchive',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='order_archive_created_brin'),
+        ),
+        migrations.AddIndex(
+            model_name='contactmessagearchive',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='contact_archive_created_brin'),
+        ),
+    ]
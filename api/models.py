@@ -1,30 +1,57 @@
 from decimal import Decimal
 import os
 
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import BrinIndex, GinIndex
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Q
 from django.conf import settings
-from django.utils.safestring import mark_safe
+from django.utils import timezone
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
 
 
+from .thumbnails import thumbnail_tag
 from .validators import validate_image_extension, validate_image_size, validate_svg_content
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-class ContactMessage(models.Model):
+class ContactMessageBase(models.Model):
     email = models.EmailField(max_length=255)
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        abstract = True
+
     def __str__(self):
         return f"Message from {self.email}"
 
 
+class ContactMessage(ContactMessageBase):
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='contact_message_created_idx'),
+        ]
+
+
+class ContactMessageArchive(ContactMessageBase):
+    """Сообщения старше CONTACT_ARCHIVE_AFTER_DAYS (команда archive_submissions)"""
+    id = models.BigIntegerField(primary_key=True)
+
+    class Meta:
+        verbose_name = "Архивное сообщение"
+        verbose_name_plural = "Архив сообщений"
+        indexes = [
+            BrinIndex(fields=['created_at'], name='contact_archive_created_brin'),
+        ]
+
+
 class Employee(models.Model):
     full_name = models.CharField("Полное имя", max_length=255)
     photo = models.ImageField("Фото", upload_to='employees/', blank=True, null=True)
@@ -61,6 +88,17 @@ class Employee(models.Model):
         return self.full_name
 
 
+class CategoryQuerySet(models.QuerySet):
+    def with_counts(self):
+        """Категории с числом товаров и товаров в наличии — одним агрегирующим запросом"""
+        queryset = self.annotate(
+            products_count=models.Count('products'),
+            in_stock_count=models.Count('products', filter=Q(products__quantity__gt=0)),
+        )
+        # Meta.ordering в запросах с GROUP BY не применяется
+        return queryset if queryset.query.order_by else queryset.order_by(*self.model._meta.ordering)
+
+
 class Category(models.Model):
     name = models.CharField(_('Название'), max_length=255)
     image = models.FileField(
@@ -74,13 +112,12 @@ class Category(models.Model):
             validate_svg_content
         ]
     )
+    updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
+
+    objects = CategoryQuerySet.as_manager()
 
     def image_preview(self):
-        if self.image:
-            if self.image.name.endswith('.svg'):
-                return mark_safe(f'<img src="{self.image.url}" height="100" />')
-            return mark_safe(f'<img src="{self.image.url}" height="100" />')
-        return _("Нет изображения")
+        return thumbnail_tag(self.image)
 
     image_preview.short_description = _("Превью")
 
@@ -120,11 +157,15 @@ class Product(models.Model):
     armament = models.CharField(_('Вооружение'), max_length=100, blank=True, null=True)
     seal = models.CharField(_('Уплотнение'), max_length=100, blank=True, null=True)
     iadc = models.CharField(_('IADC'), max_length=100, blank=True, null=True)
+    updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
 
     class Meta:
         verbose_name = _('Продукт')
         verbose_name_plural = _('Продукты')
         ordering = ['id']
+        indexes = [
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.size})" if self.size else self.name
@@ -170,13 +211,10 @@ class ProductImage(models.Model):
         _('Порядок сортировки'),
         default=0
     )
+    updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
 
     def image_preview(self):
-        if self.image:
-            if self.image.name.endswith('.svg'):
-                return mark_safe(f'<img src="{self.image.url}" height="100" />')
-            return mark_safe(f'<img src="{self.image.url}" height="100" />')
-        return _("Нет изображения")
+        return thumbnail_tag(self.image)
     image_preview.short_description = _("Превью")
 
     def __str__(self):
@@ -186,7 +224,30 @@ class ProductImage(models.Model):
         ordering = ['id']
 
 
-class Order(models.Model):
+class ProductSimilarity(models.Model):
+    """Предрассчитанные похожие товары (заполняется командой build_similar_products)"""
+    product = models.OneToOneField(
+        Product,
+        primary_key=True,
+        related_name='similarity',
+        on_delete=models.CASCADE,
+        verbose_name=_('Продукт')
+    )
+    similar_ids = ArrayField(models.BigIntegerField(), verbose_name=_('Похожие продукты'))
+    scores = ArrayField(models.FloatField(), verbose_name=_('Сходство'))
+
+    class Meta:
+        verbose_name = _('Похожие продукты')
+        verbose_name_plural = _('Похожие продукты')
+        indexes = [
+            GinIndex(fields=['similar_ids'], name='similarity_similar_ids_gin'),
+        ]
+
+    def __str__(self):
+        return f"Похожие для #{self.product_id}"
+
+
+class OrderBase(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=20, default='new')
@@ -206,10 +267,43 @@ class Order(models.Model):
     agreed_to_terms = models.BooleanField("Согласие", default=False)
     products = models.JSONField("Товары",  default=list)
 
+    class Meta:
+        abstract = True
+
     def __str__(self):
         return f"Order #{self.id}"
 
 
+class Order(OrderBase):
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
+
+
+class OrderArchive(OrderBase):
+    """Заказы старше ORDER_ARCHIVE_AFTER_DAYS (команда archive_submissions); номера сохраняются"""
+    id = models.BigIntegerField(primary_key=True)
+
+    class Meta:
+        verbose_name = "Архивный заказ"
+        verbose_name_plural = "Архив заказов"
+        indexes = [
+            BrinIndex(fields=['created_at'], name='order_archive_created_brin'),
+        ]
+
+
+class SaleItemQuerySet(models.QuerySet):
+    def active(self, now=None):
+        """Активные распродажи, чьё окно показа включает момент now"""
+        now = now or timezone.now()
+        return self.filter(
+            Q(starts_at__isnull=True) | Q(starts_at__lte=now),
+            Q(ends_at__isnull=True) | Q(ends_at__gt=now),
+            is_active=True,
+        )
+
+
 class SaleItem(models.Model):
     title = models.CharField("Название", max_length=255)
     slug = models.SlugField("URL-адрес", max_length=255, unique=True)
@@ -227,13 +321,28 @@ class SaleItem(models.Model):
         validators=[MinValueValidator(Decimal('0.01'))]
     )
     is_active = models.BooleanField("Активный", default=True)
+    starts_at = models.DateTimeField("Начало показа", null=True, blank=True)
+    ends_at = models.DateTimeField("Окончание показа", null=True, blank=True)
     created_at = models.DateTimeField("Дата создания", auto_now_add=True)
     updated_at = models.DateTimeField("Дата обновления", auto_now=True)
 
+    objects = SaleItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Товар распродажи"
         verbose_name_plural = "Товары распродажи"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['starts_at', 'ends_at'],
+                condition=Q(is_active=True),
+                name='sale_item_active_window_idx',
+            ),
+        ]
+
+    def clean(self):
+        if self.starts_at and self.ends_at and self.ends_at <= self.starts_at:
+            raise ValidationError({'ends_at': 'Окончание показа должно быть позже начала'})
 
     def __str__(self):
         return self.title
@@ -264,6 +373,7 @@ class SaleItemImage(models.Model):
         "Порядок сортировки",
         default=0
     )
+    updated_at = models.DateTimeField("Дата обновления", auto_now=True)
 
     class Meta:
         verbose_name = "Изображение товара распродажи"
@@ -272,3 +382,80 @@ class SaleItemImage(models.Model):
 
     def __str__(self):
         return f"Изображение для {self.sale_item.title}"
+
+
+class CatalogChange(models.Model):
+    """Журнал изменений каталога для ленты /changes/ (удаления — с deleted=True).
+
+    txid — номер транзакции Postgres: курсор ленты идёт по (txid, id) и отдаёт
+    только транзакции старше всех ещё не завершённых, поэтому поздно
+    закоммиченные изменения не оказываются позади курсора клиента.
+    """
+    MODEL_CHOICES = [
+        ('category', 'Категория'),
+        ('product', 'Продукт'),
+        ('product_image', 'Изображение продукта'),
+        ('sale_item', 'Товар распродажи'),
+        ('sale_item_image', 'Изображение товара распродажи'),
+    ]
+
+    model = models.CharField("Модель", max_length=32, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField("ID объекта")
+    deleted = models.BooleanField("Удалён", default=False)
+    txid = models.BigIntegerField("Транзакция")
+    changed_at = models.DateTimeField("Дата изменения", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Изменение каталога"
+        verbose_name_plural = "Изменения каталога"
+        ordering = ['txid', 'id']
+        indexes = [
+            models.Index(fields=['txid', 'id'], name='catalog_change_cursor_idx'),
+            models.Index(fields=['model', 'object_id'], name='catalog_change_object_idx'),
+        ]
+
+    def __str__(self):
+        action = 'удалён' if self.deleted else 'изменён'
+        return f"{self.model} #{self.object_id} {action}"
+
+
+class IdempotencyKey(models.Model):
+    """Сохранённый ответ на запрос с заголовком Idempotency-Key (api.idempotency).
+
+    Пока запрос выполняется, status_code пуст; повтор с тем же ключом и телом
+    получает сохранённый ответ до expires_at.
+    """
+    scope = models.CharField("Область", max_length=32)
+    key = models.CharField("Ключ", max_length=255)
+    fingerprint = models.CharField("Хэш тела запроса", max_length=64)
+    status_code = models.PositiveSmallIntegerField("Код ответа", null=True, blank=True)
+    response = models.JSONField("Ответ", null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField("Создан", auto_now_add=True)
+    expires_at = models.DateTimeField("Истекает")
+
+    class Meta:
+        verbose_name = "Ключ идемпотентности"
+        verbose_name_plural = "Ключи идемпотентности"
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='idempotency_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_key_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key}"
+
+
+class ThrottleBucket(models.Model):
+    """Токен-бакет api.throttling; таблица нежурналируемая (UNLOGGED), после сбоя базы бакеты просто полны"""
+    key = models.CharField("Ключ", max_length=100, primary_key=True)
+    tokens = models.FloatField("Токены")
+    updated_at = models.DateTimeField("Обновлён")
+
+    class Meta:
+        verbose_name = "Бакет ограничения запросов"
+        verbose_name_plural = "Бакеты ограничения запросов"
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,198 @@
+"""Профилирование отдельных запросов по требованию суперпользователя.
+
+Запрос с заголовком X-Profile: 1 или параметром ?_profile=1 от сессии
+суперпользователя выполняется под cProfile с записью всех SQL и их времени.
+Отчёт (.txt и .prof для snakeviz) сохраняется в PROFILING_ROOT, хранятся
+последние PROFILING_KEEP отчётов; путь к отчёту в админке возвращается в
+заголовке X-Profile-Report. Для остальных запросов проверка сводится к
+поиску флага в META. Без PROFILING_ENABLED (по умолчанию — вне DEBUG)
+middleware отключается.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import admin
+from django.core.exceptions import MiddlewareNotUsed, PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+from django.urls import reverse
+from django.utils import timezone
+
+from .instrumentation import capture_queries
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile'
+REPORT_SUFFIXES = ('.txt', '.prof')
+
+_report_name_re = re.compile(r'^[\w.-]+$')
+
+
+class SQLRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - start, sql, params))
+
+
+def _wants_profile(request):
+    return PROFILE_HEADER in request.META or PROFILE_PARAM in request.META.get('QUERY_STRING', '')
+
+
+def _report_name(request):
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S-%f')
+    slug = re.sub(r'[^\w]+', '-', request.path).strip('-')[:80] or 'root'
+    return f'{stamp}-{request.method.lower()}-{slug}'
+
+
+def _write_report(name, request, response, elapsed, profiler, recorder):
+    os.makedirs(settings.PROFILING_ROOT, exist_ok=True)
+    path = os.path.join(settings.PROFILING_ROOT, name)
+    profiler.dump_stats(f'{path}.prof')
+
+    db_time = sum(duration for duration, _, _ in recorder.queries)
+    out = io.StringIO()
+    out.write(f'{request.method} {request.get_full_path()}\n')
+    out.write(f'user: {request.user}, status: {response.status_code}\n')
+    out.write(f'total: {elapsed * 1000:.1f} ms, SQL: {len(recorder.queries)} queries, {db_time * 1000:.1f} ms\n')
+
+    out.write('\n== SQL, slowest first ==\n')
+    for duration, sql, params in sorted(recorder.queries, key=lambda query: query[0], reverse=True):
+        out.write(f'{duration * 1000:9.2f} ms  {sql}\n             params: {params!r}\n')
+
+    out.write('\n== Profile, by cumulative time ==\n')
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats('cumulative').print_stats(settings.PROFILING_TOP_FUNCTIONS)
+
+    with open(f'{path}.txt', 'w', encoding='utf-8') as f:
+        f.write(out.getvalue())
+
+
+def _rotate():
+    names = sorted(list_reports(), reverse=True)
+    for name in names[settings.PROFILING_KEEP:]:
+        for suffix in REPORT_SUFFIXES:
+            try:
+                os.remove(os.path.join(settings.PROFILING_ROOT, name + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_reports():
+    """Имена сохранённых отчётов (без расширения)"""
+    try:
+        files = os.listdir(settings.PROFILING_ROOT)
+    except FileNotFoundError:
+        return []
+    return [file[:-len('.txt')] for file in files if file.endswith('.txt')]
+
+
+def _is_superuser(request):
+    return request.user.is_superuser
+
+
+class ProfilingMiddleware:
+    """Должен стоять после AuthenticationMiddleware.
+
+    Под ASGI cProfile видит только код, выполненный в потоке событий;
+    синхронные части запроса попадают в отчёт лишь своими SQL-запросами.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not _wants_profile(request) or not _is_superuser(request):
+            return self.get_response(request)
+
+        name = _report_name(request)
+        recorder = SQLRecorder()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        with capture_queries(recorder):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        return self.report(name, request, response, time.perf_counter() - start, profiler, recorder)
+
+    async def __acall__(self, request):
+        # Пользователь из сессии загружается синхронно, поэтому только при наличии флага
+        if not _wants_profile(request) or not await sync_to_async(_is_superuser)(request):
+            return await self.get_response(request)
+
+        name = _report_name(request)
+        recorder = SQLRecorder()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        with capture_queries(recorder):
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+        return self.report(name, request, response, time.perf_counter() - start, profiler, recorder)
+
+    def report(self, name, request, response, elapsed, profiler, recorder):
+        _write_report(name, request, response, elapsed, profiler, recorder)
+        _rotate()
+        response['X-Profile-Report'] = reverse('profile-report', args=[name])
+        return response
+
+
+def _check_superuser(request):
+    # admin_view пропускает любого сотрудника, а в отчётах параметры SQL-запросов
+    if not request.user.is_superuser:
+        raise PermissionDenied
+
+
+def report_list_view(request):
+    _check_superuser(request)
+    reports = sorted(list_reports(), reverse=True)
+    return render(request, 'admin/profiles/list.html', {
+        **admin.site.each_context(request),
+        'title': 'Профили запросов',
+        'reports': reports,
+    })
+
+
+def report_view(request, name):
+    _check_superuser(request)
+    if not _report_name_re.match(name):
+        raise Http404
+    path = os.path.join(settings.PROFILING_ROOT, name)
+    if request.GET.get('format') == 'prof':
+        if not os.path.exists(f'{path}.prof'):
+            raise Http404
+        return FileResponse(open(f'{path}.prof', 'rb'), as_attachment=True, filename=f'{name}.prof')
+    try:
+        with open(f'{path}.txt', encoding='utf-8') as f:
+            content = f.read()
+    except FileNotFoundError:
+        raise Http404
+    return render(request, 'admin/profiles/detail.html', {
+        **admin.site.each_context(request),
+        'title': name,
+        'name': name,
+        'content': content,
+    })
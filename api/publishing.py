@@ -0,0 +1,184 @@
+"""Публикация статического снимка каталога для раздачи через nginx.
+
+Ответы API рендерятся теми же представлениями, что обслуживают запросы, и
+пишутся в каталог новой версии вместе со сжатыми копиями (.gz, .br — если
+установлен пакет brotli). Затем симлинк current атомарно переключается на
+новую версию. Имена файлов повторяют URI, параметры запроса кодируются в
+имени: /api/v1/products/?category=5&page=2 -> api/v1/products/index.category-5.page-2.json.
+Распродажи в снимок не входят: их видимость зависит от времени (starts_at/ends_at).
+
+Автопубликацию ведёт один процесс — watch_catalog (publish_catalog --watch):
+он следит за журналом изменений (api.changes) и публикует новую версию,
+когда после последнего изменения прошло CATALOG_PUBLISH_WINDOW секунд, но не
+позже CATALOG_PUBLISH_MAX_DELAY секунд после первого неопубликованного.
+В version.json снимка записан курсор журнала, который он учитывает.
+"""
+import fcntl
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.test import RequestFactory
+from django.utils import timezone
+
+from .changes import latest_cursor
+from .models import Category
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+VERSIONS_DIR = 'versions'
+CURRENT_LINK = 'current'
+LOCK_FILE = '.publish.lock'
+
+
+def _file_name(path, params):
+    suffix = ''.join(f'.{key}-{value}' for key, value in params)
+    return os.path.join(path.strip('/'), f'index{suffix}.json')
+
+
+class SnapshotWriter:
+    def __init__(self, root):
+        self.root = root
+        self.files = 0
+        host = urlsplit(settings.PUBLIC_API_URL)
+        self.factory = RequestFactory(HTTP_HOST=host.netloc)
+        self.secure = host.scheme == 'https'
+
+    def render(self, view, path, params=(), **kwargs):
+        """Отрендерить GET path через view и записать результат"""
+        request = self.factory.get(path, dict(params), secure=self.secure)
+        response = view(request, **kwargs)
+        response.render()
+        if response.status_code != 200:
+            raise RuntimeError(f'{path} {dict(params)} responded with {response.status_code}')
+        self.write(_file_name(path, params), response.content)
+        return response
+
+    def render_pages(self, view, path, params=(), **kwargs):
+        """Все страницы постраничного списка; первая доступна и без ?page="""
+        page = 1
+        while True:
+            response = self.render(view, path, (*params, ('page', page)), **kwargs)
+            if page == 1:
+                self.write(_file_name(path, params), response.content)
+            if not response.data.get('next'):
+                break
+            page += 1
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        with open(f'{path}.gz', 'wb') as f:
+            f.write(gzip.compress(content, compresslevel=9))
+        if brotli is not None:
+            with open(f'{path}.br', 'wb') as f:
+                f.write(brotli.compress(content))
+        self.files += 1
+
+
+def _render_catalog(writer):
+    from .views import CategoryFiltersView, CategoryViewSet, ProductViewSet
+
+    category_list = CategoryViewSet.as_view({'get': 'list'})
+    category_detail = CategoryViewSet.as_view({'get': 'retrieve'})
+    category_products = CategoryViewSet.as_view({'get': 'products'})
+    category_filters = CategoryFiltersView.as_view()
+    product_list = ProductViewSet.as_view({'get': 'list'})
+
+    writer.render_pages(category_list, '/api/v1/categories/')
+    for category_id in Category.objects.values_list('id', flat=True):
+        pk = str(category_id)
+        writer.render(category_detail, f'/api/v1/categories/{pk}/', pk=pk)
+        writer.render(category_products, f'/api/v1/categories/{pk}/products/', pk=pk)
+        writer.render(category_filters, f'/api/v1/categories/{pk}/filters/', category_id=category_id)
+        writer.render_pages(product_list, '/api/v1/products/', (('category', pk),))
+
+
+def publish_catalog():
+    """Собрать новую версию снимка и переключить на неё current. Возвращает (версия, число файлов)."""
+    root = settings.CATALOG_SNAPSHOT_ROOT
+    versions_root = os.path.join(root, VERSIONS_DIR)
+    os.makedirs(versions_root, exist_ok=True)
+
+    # Одновременно публикует только один процесс
+    with open(os.path.join(root, LOCK_FILE), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        # Курсор берётся до рендера: всё, что изменится во время него, попадёт в следующую версию
+        cursor = latest_cursor()
+        version = timezone.now().strftime('%Y%m%d%H%M%S%f')
+        version_dir = os.path.join(versions_root, version)
+        writer = SnapshotWriter(version_dir)
+        try:
+            _render_catalog(writer)
+            writer.write('version.json', json.dumps({'version': version, 'cursor': cursor}).encode())
+        except Exception:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            raise
+
+        tmp_link = os.path.join(root, f'{CURRENT_LINK}.tmp')
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.path.join(VERSIONS_DIR, version), tmp_link)
+        os.replace(tmp_link, os.path.join(root, CURRENT_LINK))
+
+        for old in sorted(os.listdir(versions_root))[:-settings.CATALOG_SNAPSHOT_KEEP]:
+            shutil.rmtree(os.path.join(versions_root, old), ignore_errors=True)
+
+    return version, writer.files
+
+
+def published_cursor():
+    """Курсор журнала, учтённый текущим снимком; None — снимка нет"""
+    path = os.path.join(settings.CATALOG_SNAPSHOT_ROOT, CURRENT_LINK, 'version.json')
+    try:
+        with open(path) as f:
+            return json.load(f).get('cursor')
+    except (OSError, ValueError):
+        return None
+
+
+def watch_catalog(poll=None, window=None, max_delay=None, iterations=None):
+    """Публиковать снимок после изменений каталога; iterations ограничивает число проверок (тесты)"""
+    poll = settings.CATALOG_PUBLISH_POLL if poll is None else poll
+    window = settings.CATALOG_PUBLISH_WINDOW if window is None else window
+    max_delay = settings.CATALOG_PUBLISH_MAX_DELAY if max_delay is None else max_delay
+    published = published_cursor()
+    seen, first_seen, last_seen = published, None, None
+    checks = 0
+    while iterations is None or checks < iterations:
+        checks += 1
+        # Долгоживущий процесс: соединение, оборванное перезапуском базы, заменяется новым
+        close_old_connections()
+        try:
+            current = latest_cursor()
+            now = time.monotonic()
+            if current != seen:
+                first_seen = first_seen or now
+                last_seen, seen = now, current
+            due = published is None or (
+                published != current and (now - last_seen >= window or now - first_seen >= max_delay)
+            )
+            if due:
+                version, files = publish_catalog()
+                published, first_seen = published_cursor(), None
+                logger.info(f'Published catalog version {version} ({files} files)')
+        except Exception:
+            logger.exception('Catalog publishing failed')
+        finally:
+            close_old_connections()
+        if iterations is None or checks < iterations:
+            time.sleep(poll)
@@ -0,0 +1,167 @@
+"""Уведомления фронтенда о необходимости перегенерировать статические страницы.
+
+Сигналы моделей добавляют затронутые пути в CoalescingDispatcher; тот копит
+их в течение окна (каждое новое изменение продлевает окно, но не дольше
+max_delay) и отправляет одной пачкой из фонового потока с повторами.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from string import Formatter
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescingDispatcher:
+    """Собирает ключи и передаёт их в deliver(batch) пачками из фонового потока"""
+
+    def __init__(self, deliver, window, max_delay, max_batch=None, retries=3, backoff=1.0, name='dispatcher'):
+        self.deliver = deliver
+        self.window = window
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.retries = retries
+        self.backoff = backoff
+        self.name = name
+        self._pending = set()
+        self._first_added = None
+        self._last_added = None
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def add(self, keys):
+        keys = set(keys)
+        if not keys:
+            return
+        with self._condition:
+            now = time.monotonic()
+            if not self._pending:
+                self._first_added = now
+            self._pending.update(keys)
+            self._last_added = now
+            self._ensure_worker()
+            self._condition.notify()
+
+    def flush(self):
+        """Синхронно отправить всё накопленное (тесты, завершение процесса)"""
+        with self._condition:
+            batch = self._take()
+        if batch:
+            self._deliver(batch)
+
+    def _ensure_worker(self):
+        # После fork (gunicorn preload) поток родителя в дочернем процессе не существует
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _due_at(self):
+        return min(self._last_added + self.window, self._first_added + self.max_delay)
+
+    def _take(self):
+        batch = sorted(self._pending)
+        self._pending.clear()
+        return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                while self._pending and time.monotonic() < self._due_at():
+                    self._condition.wait(self._due_at() - time.monotonic())
+                batch = self._take()
+            if batch:
+                try:
+                    self._deliver(batch)
+                finally:
+                    # deliver может обращаться к базе, а вне цикла запросов соединение потока
+                    # само не закроется и не вернётся в пул
+                    close_old_connections()
+
+    def _deliver(self, batch):
+        size = self.max_batch or len(batch)
+        for start in range(0, len(batch), size):
+            chunk = batch[start:start + size]
+            for attempt in range(1, self.retries + 1):
+                try:
+                    self.deliver(chunk)
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        logger.error(f"{self.name}: delivery of {len(chunk)} keys failed: {str(e)}")
+                    else:
+                        time.sleep(self.backoff * 2 ** (attempt - 1))
+
+
+def post_revalidation(paths):
+    """POST {"paths": [...]} на хук ревалидации фронтенда"""
+    request = urllib.request.Request(
+        settings.FRONTEND_REVALIDATE_URL,
+        data=json.dumps({"paths": paths}).encode(),
+        headers={
+            'Content-Type': 'application/json',
+            'X-Revalidate-Secret': settings.FRONTEND_REVALIDATE_SECRET,
+        },
+        method='POST',
+    )
+    with urllib.request.urlopen(request, timeout=settings.FRONTEND_REVALIDATE_TIMEOUT) as response:
+        response.read()
+    logger.info(f"Requested revalidation of {len(paths)} paths")
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier():
+    """Общий на процесс диспетчер ревалидации (None, если хук не настроен)"""
+    global _notifier
+    if not settings.FRONTEND_REVALIDATE_URL:
+        return None
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = CoalescingDispatcher(
+                post_revalidation,
+                window=settings.REVALIDATE_WINDOW,
+                max_delay=settings.REVALIDATE_MAX_DELAY,
+                max_batch=settings.REVALIDATE_MAX_BATCH,
+                retries=settings.REVALIDATE_RETRIES,
+                name='frontend-revalidation',
+            )
+            atexit.register(_notifier.flush)
+    return _notifier
+
+
+def template_fields(model_name):
+    """Поля объекта, из которых строятся его пути (REVALIDATE_PATHS)"""
+    return {
+        field
+        for template in settings.REVALIDATE_PATHS.get(model_name, [])
+        for _, field, _, _ in Formatter().parse(template) if field
+    }
+
+
+def paths_for(model_name, instance, previous=None):
+    """Пути фронтенда, затронутые изменением объекта (шаблоны из REVALIDATE_PATHS).
+
+    previous — значения template_fields до сохранения: товар, перенесённый в
+    другую категорию, пропадает и со страницы прежней.
+    """
+    values = [instance.__dict__]
+    if previous:
+        values.append({**instance.__dict__, **previous})
+    return {
+        template.format_map(value)
+        for value in values
+        for template in settings.REVALIDATE_PATHS.get(model_name, [])
+    }
@@ -0,0 +1,159 @@
+"""Чтение каталога с реплик базы.
+
+ReplicaRoutingMiddleware разрешает чтение с реплики только для GET/HEAD к
+представлениям, помеченным replica_reads (каталог). Всё остальное, включая
+запросы в том же HTTP-запросе после записи, идёт в основную базу. После
+записи клиент получает cookie REPLICA_STICKY_COOKIE, и следующие
+REPLICA_STICKY_SECONDS секунд его чтения тоже идут в основную базу: так он
+видит свой заказ или правку в админке, даже если реплика отстаёт.
+
+ReplicaRouter выбирает случайную здоровую реплику из REPLICA_DATABASES.
+Здоровье проверяется не чаще раза в REPLICA_HEALTH_INTERVAL секунд:
+реплика, к которой не подключиться или которая отстаёт больше чем на
+REPLICA_MAX_LAG секунд, пропускается; если здоровых нет, чтение идёт в
+основную базу.
+"""
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('replica_routing', default=None)
+_health = {}
+_health_lock = threading.Lock()
+
+
+def replica_reads(view):
+    """Помечает представление (класс или функцию), чтения которого можно выполнять на реплике"""
+    view.replica_reads = True
+    return view
+
+
+class RoutingState:
+    def __init__(self):
+        self.use_replica = False
+        self.wrote = False
+
+
+LAG_SQL = (
+    'SELECT pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn(), '
+    'EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())'
+)
+
+
+def lag_seconds(caught_up, since_replay):
+    """Отставание реплики: время с последней применённой транзакции, если полученный WAL ещё не применён"""
+    # Реплика, применившая всё полученное, не отстаёт, сколько бы ни простаивала основная база;
+    # на основной базе обе функции возвращают NULL
+    if caught_up or since_replay is None:
+        return 0.0
+    return float(since_replay)
+
+
+def _replica_lag(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return lag_seconds(*cursor.fetchone())
+
+
+def is_healthy(alias):
+    now = time.monotonic()
+    with _health_lock:
+        healthy, checked_at = _health.get(alias, (None, 0))
+    if healthy is not None and now - checked_at < settings.REPLICA_HEALTH_INTERVAL:
+        return healthy
+    try:
+        lag = _replica_lag(alias)
+    except DatabaseError as e:
+        logger.warning(f'Replica {alias} is unavailable: {e}')
+        connections[alias].close()
+        healthy = False
+    else:
+        healthy = lag <= settings.REPLICA_MAX_LAG
+        if not healthy:
+            logger.warning(f'Replica {alias} lags {lag:.1f} s behind the primary')
+    with _health_lock:
+        _health[alias] = (healthy, now)
+    return healthy
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or state.wrote:
+            return None
+        replicas = [alias for alias in settings.REPLICA_DATABASES if is_healthy(alias)]
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии основной базы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.process_response(request, response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.process_response(request, response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        view = getattr(view_func, 'cls', view_func)
+        state.use_replica = (
+            request.method in SAFE_METHODS
+            and getattr(view, 'replica_reads', False)
+            and settings.REPLICA_STICKY_COOKIE not in request.COOKIES
+        )
+
+    def process_response(self, request, response, state):
+        if state.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS, secure=request.is_secure(), httponly=True, samesite='Lax',
+            )
+        return response
@@ -29,10 +29,13 @@ class EmployeeSerializer(serializers.ModelSerializer):
 class CategorySerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
     is_svg = serializers.SerializerMethodField()
+    # Аннотации Category.objects.with_counts(); без них (создание, правка) поля пропускаются
+    products_count = serializers.IntegerField(read_only=True)
+    in_stock_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Category
-        fields = ['id', 'name', 'image', 'image_url', 'is_svg']
+        fields = ['id', 'name', 'image', 'image_url', 'is_svg', 'products_count', 'in_stock_count', 'updated_at']
 
     def get_image_url(self, obj):
         if obj.image:
@@ -53,7 +56,7 @@ class ProductImageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ProductImage
-        fields = ['id', 'image_url', 'is_svg', 'is_main', 'order', 'product']
+        fields = ['id', 'image_url', 'is_svg', 'is_main', 'order', 'product', 'updated_at']
 
     def get_image_url(self, obj):
         if obj.image:
@@ -80,20 +83,22 @@ class ProductSerializer(serializers.ModelSerializer):
             'id', 'name', 'size', 'description', 'quantity',
             'brand', 'thread_connection', 'thread_connection_2',
             'armament', 'seal', 'iadc', 'category',
-            'images', 'main_image', 'image_urls',  'price', 'display_price'
+            'images', 'main_image', 'image_urls',  'price', 'display_price', 'updated_at'
         ]
 
     def get_main_image(self, obj):
         if not hasattr(obj, 'images'):
             return None
 
-        main_image = obj.images.filter(is_main=True).first()
+        # Перебираем загруженные prefetch_related('images'), а не делаем filter() на каждый товар
+        images = list(obj.images.all())
+        main_image = next((image for image in images if image.is_main), None)
         if main_image and main_image.image:
             request = self.context.get('request')
             if request:
                 return request.build_absolute_uri(main_image.image.url)
 
-        first_image = obj.images.first()
+        first_image = images[0] if images else None
         if first_image and first_image.image:
             request = self.context.get('request')
             if request:
@@ -169,8 +174,8 @@ class SaleItemSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_main_image_url(self, obj):
-        # Просто ищем главное изображение среди связанных изображений
-        main_image = obj.images.filter(is_main=True).first()
+        # Ищем среди уже загруженных изображений (prefetch_related), без запроса на каждый товар
+        main_image = next((image for image in obj.images.all() if image.is_main), None)
 
         if main_image and main_image.image:
             request = self.context.get('request')
@@ -0,0 +1,84 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from .caching import bump_version
+from .changes import TRACKED_MODELS, record_changes
+from .models import Category, Product, ProductImage, SaleItem, SaleItemImage
+from .revalidation import get_notifier, paths_for, template_fields
+from .streaming import notify_products
+
+REVALIDATED_MODELS = {
+    Category: 'category',
+    Product: 'product',
+    SaleItem: 'sale_item',
+}
+# Версии кэшированных списков (api.caching), которые сбрасывает изменение модели
+CACHED_LISTS = {
+    Category: 'categories',
+    Product: 'categories',
+    SaleItem: 'sale-items',
+    SaleItemImage: 'sale-items',
+}
+
+
+def catalog_object_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        record_changes(sender, [instance.pk])
+
+
+def catalog_object_deleted(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], deleted=True)
+
+
+def remember_revalidated_fields(sender, instance, raw=False, **kwargs):
+    """Значения полей путей до сохранения: после смены категории или slug устаревает и старая страница"""
+    if raw or instance.pk is None or get_notifier() is None:
+        return
+    fields = template_fields(REVALIDATED_MODELS[sender])
+    instance._revalidation_previous = sender._default_manager.filter(pk=instance.pk).values(*fields).first()
+
+
+def revalidate_frontend(sender, instance, raw=False, **kwargs):
+    notifier = get_notifier()
+    if notifier is None or raw:
+        return
+    previous = instance.__dict__.pop('_revalidation_previous', None)
+    paths = paths_for(REVALIDATED_MODELS[sender], instance, previous)
+    transaction.on_commit(lambda: notifier.add(paths))
+
+
+def reset_cached_list(sender, instance, raw=False, **kwargs):
+    name = CACHED_LISTS[sender]
+    transaction.on_commit(lambda: bump_version(name))
+
+
+def touch_product(sender, instance, raw=False, **kwargs):
+    """Изображения входят в представление товара — сдвигаем его updated_at"""
+    if not raw:
+        Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+def notify_product_update(sender, instance, raw=False, update_fields=None, using='default', **kwargs):
+    """Остаток и цена для потока /products/stream/; при сохранении без этих полей не отправляется"""
+    if raw or (update_fields is not None and not {'price', 'quantity'} & set(update_fields)):
+        return
+    notify_products([instance], using=using)
+
+
+for model in TRACKED_MODELS:
+    post_save.connect(catalog_object_saved, sender=model, dispatch_uid=f'catalog-change-save-{model.__name__}')
+    post_delete.connect(catalog_object_deleted, sender=model, dispatch_uid=f'catalog-change-delete-{model.__name__}')
+
+for model in REVALIDATED_MODELS:
+    pre_save.connect(remember_revalidated_fields, sender=model, dispatch_uid=f'revalidate-pre-save-{model.__name__}')
+    post_save.connect(revalidate_frontend, sender=model, dispatch_uid=f'revalidate-save-{model.__name__}')
+    post_delete.connect(revalidate_frontend, sender=model, dispatch_uid=f'revalidate-delete-{model.__name__}')
+
+post_save.connect(touch_product, sender=ProductImage, dispatch_uid='touch-product-image-save')
+post_delete.connect(touch_product, sender=ProductImage, dispatch_uid='touch-product-image-delete')
+post_save.connect(notify_product_update, sender=Product, dispatch_uid='product-updates-notify')
+
+for model in CACHED_LISTS:
+    post_save.connect(reset_cached_list, sender=model, dispatch_uid=f'cached-list-save-{model.__name__}')
+    post_delete.connect(reset_cached_list, sender=model, dispatch_uid=f'cached-list-delete-{model.__name__}')
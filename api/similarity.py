@@ -0,0 +1,245 @@
+"""Расчёт похожих товаров.
+
+Атрибуты товара кодируются внутри категории целыми кодами значений (n x число
+атрибутов), размер — номером логарифмической корзины. Сходство пачки товаров
+со всей категорией — сумма весов совпавших кодов и близких корзин, считается
+векторно; top-k соседей выбирается через argpartition. Память — O(n) на
+кодировку и не больше MAX_CHUNK_SCORES оценок на пачку, поэтому большая
+категория не требует матриц n x n. Результат хранится в ProductSimilarity
+(одна строка с массивами id и оценок на товар).
+"""
+import io
+import math
+import re
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Product, ProductSimilarity
+
+# Вес совпадения атрибута
+ATTRIBUTE_WEIGHTS = {
+    'thread_connection': 3.0,
+    'iadc': 3.0,
+    'thread_connection_2': 1.5,
+    'brand': 1.0,
+    'armament': 1.0,
+    'seal': 0.5,
+}
+# Размер: совпадение корзины даёт полный вес, соседняя корзина — половину
+SIZE_WEIGHT = 2.0
+SIZE_NEIGHBOUR_FACTOR = 0.5
+# Ширина логарифмической корзины размера (~5%)
+SIZE_BUCKET_STEP = math.log(1.05)
+CHUNK_SIZE = 1024
+# Не больше стольких оценок в пачке: в категории из 100k товаров пачка — 160 строк, 16 МБ
+MAX_CHUNK_SCORES = 16_000_000
+# Корзина товара без размера: дальше любой настоящей
+NO_BUCKET = 1 << 24
+# Веса кратны 0.5: оценки считаются целыми в полубаллах (int8), это вдвое быстрее float32
+SCORE_SCALE = 2
+_ATTRIBUTE_POINTS = [np.int8(weight * SCORE_SCALE) for weight in ATTRIBUTE_WEIGHTS.values()]
+_SIZE_POINTS = np.int8(SIZE_WEIGHT * SCORE_SCALE)
+_NEIGHBOUR_POINTS = np.int8(SIZE_WEIGHT * SIZE_NEIGHBOUR_FACTOR * SCORE_SCALE)
+
+_number_re = re.compile(r'\d+(?:[.,]\d+)?')
+
+
+def parse_size(size):
+    """Первое число из строки размера ('215,9 мм' -> 215.9)"""
+    if not size:
+        return None
+    match = _number_re.search(size)
+    if not match:
+        return None
+    value = float(match.group().replace(',', '.'))
+    return value if value > 0 else None
+
+
+def _normalize(value):
+    if value is None:
+        return None
+    value = value.strip().lower()
+    return value or None
+
+
+def _load_rows(category_ids=None):
+    """Строки (id, category_id, size, *атрибуты), сгруппированные по категории"""
+    queryset = Product.objects.order_by('id')
+    if category_ids is not None:
+        queryset = queryset.filter(category_id__in=category_ids)
+    fields = ['id', 'category_id', 'size', *ATTRIBUTE_WEIGHTS]
+
+    by_category = defaultdict(list)
+    for row in queryset.values_list(*fields).iterator(chunk_size=5000):
+        by_category[row[1]].append(row)
+    return by_category
+
+
+def _encode(rows):
+    """Кодирование категории: ids, коды атрибутов (n x len(ATTRIBUTE_WEIGHTS)) и корзины размера.
+
+    Значения, встречающиеся в категории один раз, не могут совпасть ни с чем,
+    как и отсутствующие: они получают собственный отрицательный код строки,
+    а отсутствующий размер — корзину далеко от настоящих и друг от друга.
+    """
+    n = len(rows)
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=n)
+    codes = np.empty((n, len(ATTRIBUTE_WEIGHTS)), dtype=np.int32)
+    for column, offset in enumerate(range(3, 3 + len(ATTRIBUTE_WEIGHTS))):
+        values = [_normalize(row[offset]) for row in rows]
+        counts = defaultdict(int)
+        for value in values:
+            if value is not None:
+                counts[value] += 1
+        numbers = {value: number for number, value in enumerate(v for v, count in counts.items() if count > 1)}
+        codes[:, column] = [numbers.get(value, -1 - i) for i, value in enumerate(values)]
+
+    sizes = (parse_size(row[2]) for row in rows)
+    buckets = np.fromiter(
+        (NO_BUCKET + 3 * i if size is None else math.floor(math.log(size) / SIZE_BUCKET_STEP)
+         for i, size in enumerate(sizes)),
+        dtype=np.int32, count=n,
+    )
+    return ids, codes, buckets
+
+
+def _scores(codes, buckets, rows):
+    """Матрица сходства строк rows со всей категорией в полубаллах, без самих себя (-1)"""
+    shape = (len(rows), len(codes))
+    scores = np.zeros(shape, dtype=np.int8)
+    matched = np.empty(shape, dtype=bool)
+    points = np.empty(shape, dtype=np.int8)
+
+    def add(points_per_match):
+        np.multiply(matched.view(np.int8), points_per_match, out=points)
+        np.add(scores, points, out=scores)
+
+    for column, points_per_match in enumerate(_ATTRIBUTE_POINTS):
+        np.equal(codes[rows, column][:, None], codes[:, column], out=matched)
+        add(points_per_match)
+    chunk_buckets = buckets[rows][:, None]
+    for shift, points_per_match in ((0, _SIZE_POINTS), (1, _NEIGHBOUR_POINTS), (-1, _NEIGHBOUR_POINTS)):
+        np.equal(chunk_buckets, buckets + shift, out=matched)
+        add(points_per_match)
+    scores[np.arange(len(rows)), rows] = -1
+    return scores
+
+
+def _chunk_size(n):
+    return max(1, min(CHUNK_SIZE, MAX_CHUNK_SCORES // max(n, 1)))
+
+
+def _top_k(codes, buckets, rows, k):
+    """Итератор (строка, [(столбец, сходство), ...]) для строк rows"""
+    n = len(codes)
+    k = min(k, n - 1)
+    if k <= 0:
+        return
+    size = _chunk_size(n)
+    for start in range(0, len(rows), size):
+        chunk = rows[start:start + size]
+        scores = _scores(codes, buckets, chunk)
+        # argpartition по int8 втрое медленнее, чем по int32
+        best = np.argpartition(np.negative(scores, dtype=np.int32), k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        for i, row in enumerate(chunk):
+            yield row, [
+                (int(column), float(score) / SCORE_SCALE)
+                for column, score in zip(best[i], best_scores[i])
+                if score > 0
+            ]
+
+
+def _rows_for_copy(ids, codes, buckets, rows, k):
+    """Строки для COPY: product_id, {similar_ids}, {scores}"""
+    for row, neighbours in _top_k(codes, buckets, np.asarray(rows, dtype=np.int64), k):
+        similar_ids = ','.join(str(ids[column]) for column, _ in neighbours)
+        scores = ','.join(f'{score:.3f}' for _, score in neighbours)
+        yield f'{ids[row]}\t{{{similar_ids}}}\t{{{scores}}}\n'
+
+
+def _store(rows):
+    """Запись через COPY: на 100k товаров bulk_create заметно медленнее"""
+    buffer = io.StringIO()
+    buffer.writelines(rows)
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {ProductSimilarity._meta.db_table} (product_id, similar_ids, scores) FROM STDIN',
+            buffer
+        )
+
+
+def build_similar_products(k=None):
+    """Полный пересчёт таблицы похожих товаров. Возвращает число товаров."""
+    k = k or settings.SIMILAR_PRODUCTS_COUNT
+    rows = []
+    for category_rows in _load_rows().values():
+        ids, codes, buckets = _encode(category_rows)
+        rows.extend(_rows_for_copy(ids, codes, buckets, range(len(ids)), k))
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {ProductSimilarity._meta.db_table}')
+        _store(rows)
+    return len(rows)
+
+
+def update_similar_products(product_ids, k=None):
+    """Инкрементальный пересчёт после изменения товаров product_ids.
+
+    Пересчитываются сами товары, товары, у которых они были в списке похожих,
+    и товары, в top-k которых изменённый товар теперь проходит по сходству.
+    Возвращает число пересчитанных товаров.
+    """
+    k = k or settings.SIMILAR_PRODUCTS_COUNT
+    changed = set(product_ids)
+    if not changed:
+        return 0
+
+    referencing = set(
+        ProductSimilarity.objects
+        .filter(similar_ids__overlap=list(changed))
+        .values_list('product_id', flat=True)
+    )
+    category_ids = set(
+        Product.objects.filter(id__in=changed | referencing).values_list('category_id', flat=True)
+    )
+
+    # Порог попадания в top-k: худшее сохранённое сходство (0, если список неполон)
+    thresholds = defaultdict(float)
+    for product_id, scores in ProductSimilarity.objects.filter(
+        product__category_id__in=category_ids
+    ).values_list('product_id', 'scores'):
+        if len(scores) >= k:
+            thresholds[product_id] = scores[-1]
+
+    recomputed = set(changed)
+    rows = []
+    for category_rows in _load_rows(category_ids).values():
+        ids, codes, buckets = _encode(category_rows)
+        position = {int(product_id): i for i, product_id in enumerate(ids)}
+        affected = {position[p] for p in changed | referencing if p in position}
+
+        changed_rows = np.array([position[p] for p in changed if p in position], dtype=np.int64)
+        if len(changed_rows):
+            threshold = np.array([thresholds[int(p)] * SCORE_SCALE for p in ids], dtype=np.float32)
+            size = _chunk_size(len(ids))
+            for start in range(0, len(changed_rows), size):
+                scores = _scores(codes, buckets, changed_rows[start:start + size])
+                affected.update(np.flatnonzero((scores > threshold).any(axis=0)).tolist())
+
+        affected = sorted(affected)
+        recomputed.update(int(ids[row]) for row in affected)
+        rows.extend(_rows_for_copy(ids, codes, buckets, affected, k))
+
+    with transaction.atomic():
+        ProductSimilarity.objects.filter(product_id__in=recomputed).delete()
+        _store(rows)
+    return len(rows)
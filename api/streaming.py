@@ -0,0 +1,235 @@
+"""Остатки и цены товаров в реальном времени через Server-Sent Events.
+
+    GET /api/v1/products/stream/?ids=1,2,3
+
+Сохранение товара отправляет pg_notify в канале PRODUCT_UPDATES_CHANNEL в
+той же транзакции, поэтому после отката уведомления нет. В каждом процессе
+ASGI один Broadcaster слушает канал отдельным соединением (LISTEN в цикле
+событий, без потоков) и раздаёт обновления подписанным потокам, так что
+изменение, сделанное в любом воркере или в админке, доходит до всех.
+
+Поток начинается с текущих значений подписанных товаров, затем приходят
+события product; раз в SSE_HEARTBEAT_SECONDS отправляется комментарий,
+чтобы прокси не закрывали соединение. Медленный клиент получает только
+последнее значение каждого товара — очередь не растёт.
+
+Эндпоинт — отдельное ASGI-приложение (geology.asgi), а не представление
+Django: Django 4.2 не замечает отключения клиента во время потокового
+ответа, и подписки бы не освобождались.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+import psycopg2
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = '/api/v1/products/stream/'
+# Переподключение LISTEN после обрыва, секунды
+RECONNECT_DELAYS = (1, 2, 5, 10, 30)
+
+
+def product_payload(product):
+    return {
+        'id': product.pk,
+        'price': str(product.price),
+        'quantity': product.quantity,
+        'updated_at': product.updated_at.isoformat() if product.updated_at else None,
+    }
+
+
+def notify_products(products, using='default'):
+    """Уведомить подписчиков об изменении товаров; доставляется при коммите транзакции"""
+    payloads = [json.dumps(product_payload(product)) for product in products]
+    # Одним запросом: массовая правка в админке уведомляет о тысячах товаров
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload',
+            [settings.PRODUCT_UPDATES_CHANNEL, payloads],
+        )
+
+
+def _snapshot(ids):
+    try:
+        return [product_payload(product) for product in Product.objects.filter(id__in=ids).only(
+            'id', 'price', 'quantity', 'updated_at',
+        )]
+    finally:
+        # Вне цикла запросов Django соединение само не вернётся (в пул)
+        close_old_connections()
+
+
+class Subscription:
+    def __init__(self, ids):
+        self.ids = ids
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def put(self, payload):
+        self.pending[payload['id']] = payload
+        self.ready.set()
+
+    def take(self):
+        updates, self.pending = list(self.pending.values()), {}
+        self.ready.clear()
+        return updates
+
+
+class Broadcaster:
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.listener = None
+
+    def subscribe(self, ids):
+        subscription = Subscription(ids)
+        for product_id in ids:
+            self.subscribers[product_id].add(subscription)
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.get_running_loop().create_task(self.listen())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for product_id in subscription.ids:
+            subscribers = self.subscribers.get(product_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[product_id]
+
+    def publish(self, payload):
+        for subscription in self.subscribers.get(payload['id'], ()):
+            subscription.put(payload)
+
+    async def listen(self):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            listen_connection = None
+            try:
+                listen_connection = await sync_to_async(self.connect, thread_sensitive=False)()
+                if attempt and self.subscribers:
+                    # Пока слушателя не было, изменения могли пройти мимо
+                    for payload in await sync_to_async(_snapshot)(list(self.subscribers)):
+                        self.publish(payload)
+                attempt = 0
+                readable = asyncio.Event()
+                loop.add_reader(listen_connection.fileno(), readable.set)
+                try:
+                    while True:
+                        await readable.wait()
+                        readable.clear()
+                        listen_connection.poll()
+                        while listen_connection.notifies:
+                            self.publish(json.loads(listen_connection.notifies.pop(0).payload))
+                finally:
+                    loop.remove_reader(listen_connection.fileno())
+            except (psycopg2.Error, OSError) as e:
+                delay = RECONNECT_DELAYS[min(attempt, len(RECONNECT_DELAYS) - 1)]
+                attempt += 1
+                logger.warning(f'Product updates listener failed: {e}; reconnecting in {delay} s')
+                await asyncio.sleep(delay)
+            finally:
+                if listen_connection is not None:
+                    listen_connection.close()
+
+    def connect(self):
+        params = connection.get_connection_params()
+        # Keepalive: обрыв соединения без трафика обнаруживается за минуту, а не через часы
+        listen_connection = psycopg2.connect(
+            **params, keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3,
+        )
+        listen_connection.set_session(autocommit=True)
+        with listen_connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {settings.PRODUCT_UPDATES_CHANNEL}')
+        return listen_connection
+
+
+broadcaster = Broadcaster()
+
+
+def _parse_ids(query_string):
+    values = parse_qs(query_string.decode('latin1')).get('ids', [])
+    ids = set()
+    for value in values:
+        for part in value.split(','):
+            if part.strip():
+                ids.add(int(part))
+    return sorted(ids)
+
+
+def _cors_headers(scope):
+    origin = dict(scope['headers']).get(b'origin', b'').decode('latin1')
+    if origin not in settings.CORS_ALLOWED_ORIGINS:
+        return []
+    return [
+        (b'access-control-allow-origin', origin.encode('latin1')),
+        (b'access-control-allow-credentials', b'true'),
+        (b'vary', b'Origin'),
+    ]
+
+
+async def _plain_response(send, status, text):
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'text/plain')]})
+    await send({'type': 'http.response.body', 'body': text.encode()})
+
+
+def _event(payload):
+    return f'event: product\ndata: {json.dumps(payload)}\n\n'.encode()
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def product_stream(scope, receive, send):
+    """ASGI-приложение для STREAM_PATH"""
+    if scope['method'] != 'GET':
+        return await _plain_response(send, 405, 'Method not allowed')
+    try:
+        ids = _parse_ids(scope['query_string'])
+    except ValueError:
+        return await _plain_response(send, 400, 'ids must be comma-separated integers')
+    if not ids or len(ids) > settings.SSE_MAX_PRODUCTS:
+        return await _plain_response(send, 400, f'Pass 1 to {settings.SSE_MAX_PRODUCTS} product ids')
+
+    subscription = broadcaster.subscribe(ids)
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # nginx не должен буферизовать поток
+                (b'x-accel-buffering', b'no'),
+                *_cors_headers(scope),
+            ],
+        })
+        snapshot = await sync_to_async(_snapshot)(ids)
+        body = f'retry: {settings.SSE_RETRY_MS}\n\n'.encode() + b''.join(_event(payload) for payload in snapshot)
+        await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+        while not disconnected.done():
+            ready = asyncio.ensure_future(subscription.ready.wait())
+            await asyncio.wait(
+                {ready, disconnected}, timeout=settings.SSE_HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED,
+            )
+            ready.cancel()
+            if disconnected.done():
+                break
+            updates = subscription.take()
+            body = b''.join(_event(payload) for payload in updates) if updates else b': ping\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        broadcaster.unsubscribe(subscription)
+        disconnected.cancel()
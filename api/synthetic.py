@@ -0,0 +1,166 @@
+"""Синтетический каталог для нагрузочных тестов, бенчмарков и тестов запросов.
+
+Распределения приближены к реальному каталогу: немногие марки и размеры
+встречаются часто, остальные — редко (веса по закону Ципфа), цены
+логнормальные, около трети товаров нет в наличии. Всё создаётся через
+bulk_create, поэтому сигналы не срабатывают — изменения каталога
+записываются в ленту явно.
+"""
+import math
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .changes import record_changes
+from .models import Category, Order, Product, ProductImage, SaleItem, SaleItemImage
+
+BRANDS = ['Волгабурмаш', 'Уралбурмаш', 'Smith', 'Baker Hughes', 'Halliburton', 'Drilformance', 'Ulterra', 'Varel']
+SIZES = ['215,9', '295,3', '142,9', '155,6', '190,5', '393,7', '120,6', '244,5', '444,5', '165,1', '269,9', '311,1']
+THREADS = ['З-117', 'З-152', 'З-88', 'З-76', 'З-171', 'З-177', 'З-121', 'З-133', 'З-201']
+ARMAMENTS = ['ТКЗ', 'PDC', 'МЗ', 'ТЗ', 'МС', 'СЗ']
+SEALS = ['резиновое', 'металлическое', 'открытая опора']
+IADC = ['117', '137', '217', '437', '517', '537', '617', '637', '737', '837']
+CATEGORY_NAMES = ['Долота шарошечные', 'Долота PDC', 'Бурильные трубы', 'Переводники', 'Калибраторы',
+                  'Расширители', 'Керноотборники', 'Забойные двигатели', 'Ясы', 'Центраторы']
+
+BATCH_SIZE = 5000
+# Синтетические заказы (и заказы бенчмарка) отличаются от настоящих зарезервированным доменом почты
+SYNTHETIC_EMAIL_DOMAIN = 'example.com'
+
+
+def _zipf_weights(count, exponent=1.1):
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+class CatalogGenerator:
+    def __init__(self, seed=42):
+        self.rng = random.Random(seed)
+
+    def _choice(self, values, blank=0.0):
+        if self.rng.random() < blank:
+            return None
+        return self.rng.choices(values, weights=_zipf_weights(len(values)))[0]
+
+    def _price(self):
+        # Медиана около 60 тыс. руб., длинный хвост дорогих позиций
+        return Decimal(math.exp(self.rng.gauss(11, 0.9))).quantize(Decimal('0.01')) + Decimal('100')
+
+    def _quantity(self):
+        if self.rng.random() < 0.35:
+            return 0
+        return min(int(self.rng.expovariate(1 / 8)) + 1, 500)
+
+    def categories(self, count):
+        names = []
+        for i in range(count):
+            name, series = CATEGORY_NAMES[i % len(CATEGORY_NAMES)], i // len(CATEGORY_NAMES)
+            names.append(f'{name} {series + 1}' if series else name)
+        return [Category(name=name) for name in names]
+
+    def product(self, category_id, number):
+        brand = self._choice(BRANDS, blank=0.1)
+        size = self._choice(SIZES, blank=0.05)
+        return Product(
+            category_id=category_id,
+            name=f'{brand or "Изделие"} {size or ""} №{number}'.replace('  ', ' '),
+            size=size,
+            description='Синтетический товар для нагрузочного тестирования. ' * self.rng.randint(1, 6),
+            quantity=self._quantity(),
+            price=self._price(),
+            brand=brand,
+            thread_connection=self._choice(THREADS, blank=0.2),
+            thread_connection_2=self._choice(THREADS, blank=0.7),
+            armament=self._choice(ARMAMENTS, blank=0.3),
+            seal=self._choice(SEALS, blank=0.4),
+            iadc=self._choice(IADC, blank=0.5),
+        )
+
+    def images(self, product_id, max_images):
+        count = self.rng.randint(0, max_images)
+        return [
+            ProductImage(product_id=product_id, image=f'products/synthetic/{product_id}-{i}.jpg', is_main=i == 0, order=i)
+            for i in range(count)
+        ]
+
+    def order(self, products):
+        items = self.rng.sample(products, self.rng.randint(1, min(5, len(products))))
+        lines = [
+            {'id': product.id, 'name': product.name, 'price': str(product.price), 'quantity': self.rng.randint(1, 4)}
+            for product in items
+        ]
+        return Order(
+            total=sum(Decimal(line['price']) * line['quantity'] for line in lines),
+            phone='+7900' + ''.join(self.rng.choices('0123456789', k=7)),
+            email=f'buyer{self.rng.randint(1, 10 ** 6)}@{SYNTHETIC_EMAIL_DOMAIN}',
+            first_name='Иван', last_name='Петров',
+            zip_code='450000', region='Башкортостан', city='Уфа', address='ул. Ленина, 1',
+            delivery_method='pickup', agreed_to_terms=True,
+            products=lines,
+        )
+
+
+@transaction.atomic
+def seed_catalog(products=1000, categories=10, orders=0, sale_items=0, max_images=3, seed=42, log=None):
+    """Создать синтетический каталог. Возвращает словарь с числом созданных объектов."""
+    log = log or (lambda message: None)
+    generator = CatalogGenerator(seed)
+
+    created_categories = Category.objects.bulk_create(generator.categories(categories))
+    category_ids = [category.id for category in created_categories]
+    category_weights = _zipf_weights(len(category_ids), exponent=0.8)
+    log(f'{len(category_ids)} categories')
+
+    product_count = image_count = 0
+    sample = []
+    for start in range(0, products, BATCH_SIZE):
+        batch = [
+            generator.product(generator.rng.choices(category_ids, weights=category_weights)[0], start + i + 1)
+            for i in range(min(BATCH_SIZE, products - start))
+        ]
+        Product.objects.bulk_create(batch)
+        images = [image for product in batch for image in generator.images(product.id, max_images)]
+        ProductImage.objects.bulk_create(images, batch_size=BATCH_SIZE)
+        record_changes(Product, [product.id for product in batch])
+        record_changes(ProductImage, [image.id for image in images])
+        product_count += len(batch)
+        image_count += len(images)
+        sample.extend(batch[:100])
+        log(f'{product_count} products, {image_count} images')
+    record_changes(Category, category_ids)
+
+    if sale_items:
+        now = timezone.now()
+        offset = SaleItem.objects.count()
+        items = SaleItem.objects.bulk_create([
+            SaleItem(
+                title=f'Распродажа {offset + i + 1}', slug=f'synthetic-sale-{offset + i + 1}',
+                description='Синтетическая распродажа',
+                old_price=Decimal('10000.00') + i, new_price=Decimal('7500.00') + i,
+                # Часть распродаж с окном показа, в том числе уже закончившихся
+                starts_at=now - timedelta(days=1) if i % 3 == 1 else None,
+                ends_at=now + timedelta(days=7) if i % 3 == 1 else (now - timedelta(days=1) if i % 5 == 4 else None),
+            )
+            for i in range(sale_items)
+        ])
+        images = SaleItemImage.objects.bulk_create([
+            SaleItemImage(sale_item_id=item.id, image=f'sale_items/synthetic/{item.id}-{i}.jpg', is_main=i == 0, order=i)
+            for item in items for i in range(2)
+        ])
+        record_changes(SaleItem, [item.id for item in items])
+        record_changes(SaleItemImage, [image.id for image in images])
+        log(f'{len(items)} sale items')
+
+    if orders and sample:
+        Order.objects.bulk_create([generator.order(sample) for _ in range(orders)], batch_size=BATCH_SIZE)
+        log(f'{orders} orders')
+
+    return {
+        'categories': len(category_ids),
+        'products': product_count,
+        'images': image_count,
+        'sale_items': sale_items,
+        'orders': orders if sample else 0,
+    }
@@ -1,3 +1,536 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from geology.postgresql.base import ConnectionPool
+import numpy as np
+from openpyxl import load_workbook
+from rest_framework.exceptions import ValidationError
+
+from . import archive, async_views, bulk_edit, idempotency, publishing, revalidation, routers, similarity
+from .filters import ProductFilter
+from .models import CatalogChange, Category, ContactMessage, ContactMessageArchive, IdempotencyKey, Order, OrderArchive, \
+    Product, ProductImage, ProductSimilarity, SaleItem, SaleItemImage
+from .synthetic import seed_catalog
+from .views import CategoryFiltersView, CategoryViewSet, OrderViewSet, ProductViewSet, SaleItemViewSet
+
+CATALOG_SIZES = [1, 20, 200]
+
+
+@override_settings(QUERY_BUDGET_MODE='raise', SECURE_SSL_REDIRECT=False)
+class QueryBudgetTests(TestCase):
+    """Число запросов эндпоинтов каталога не зависит от размера каталога и укладывается в бюджет"""
+
+    def endpoints(self):
+        category = Category.objects.order_by('id').first()
+        product = Product.objects.filter(category=category).order_by('id').first()
+        sale_item = SaleItem.objects.order_by('id').first()
+        return {
+            ('products', 'list'): (ProductViewSet, '/api/v1/products/'),
+            ('products', 'filtered list'): (ProductViewSet, f'/api/v1/products/?category={category.id}&availability=in-stock'),
+            ('products', 'retrieve'): (ProductViewSet, f'/api/v1/products/{product.id}/'),
+            ('products', 'filters'): (ProductViewSet, f'/api/v1/products/filters/?category={category.id}'),
+            ('categories', 'list'): (CategoryViewSet, '/api/v1/categories/'),
+            ('categories', 'retrieve'): (CategoryViewSet, f'/api/v1/categories/{category.id}/'),
+            ('categories', 'products'): (CategoryViewSet, f'/api/v1/categories/{category.id}/products/'),
+            ('sale-items', 'list'): (SaleItemViewSet, '/api/v1/sale-items/'),
+            ('sale-items', 'retrieve'): (SaleItemViewSet, f'/api/v1/sale-items/{sale_item.slug}/'),
+        }
+
+    def count_queries(self):
+        counts = {}
+        for key, (viewset, url) in self.endpoints().items():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            budget = viewset.query_budget[key[1].split()[-1]]
+            self.assertLessEqual(len(queries), budget, url)
+            counts[key] = len(queries)
+        return counts
+
+    def test_query_counts_do_not_grow_with_catalog(self):
+        counts_by_size = {}
+        for size in CATALOG_SIZES:
+            with self.subTest(size=size):
+                seed_catalog(products=size, categories=1, sale_items=size, max_images=3, seed=size)
+                counts_by_size[size] = self.count_queries()
+                Category.objects.all().delete()
+                SaleItem.objects.all().delete()
+        for size in CATALOG_SIZES[1:]:
+            self.assertEqual(counts_by_size[size], counts_by_size[CATALOG_SIZES[0]], f'{size} objects')
+
+
+class SimilarityTests(TransactionTestCase):
+    def test_scores_follow_attribute_and_size_weights(self):
+        rows = [
+            # id, category_id, size, thread_connection, iadc, thread_connection_2, brand, armament, seal
+            (1, 1, '215,9 мм', 'З-117', '537', None, 'A', None, None),
+            (2, 1, '215,9', 'з-117 ', '537', None, 'B', None, None),
+            (3, 1, '226,7', None, None, None, 'A', None, None),
+            (4, 1, None, None, None, None, None, None, 'уникальное'),
+        ]
+        ids, codes, buckets = similarity._encode(rows)
+        scores = similarity._scores(codes, buckets, np.arange(len(rows))) / similarity.SCORE_SCALE
+        weights = similarity.ATTRIBUTE_WEIGHTS
+        self.assertEqual(scores[0, 1], weights['thread_connection'] + weights['iadc'] + similarity.SIZE_WEIGHT)
+        # 226,7 мм — соседняя корзина 215,9 мм (+5%)
+        self.assertEqual(scores[0, 2], weights['brand'] + similarity.SIZE_WEIGHT * similarity.SIZE_NEIGHBOUR_FACTOR)
+        self.assertEqual(scores[3].max(), 0)
+        self.assertEqual(list(np.diag(scores)), [-0.5] * 4)
+
+    def test_chunks_are_bounded_and_do_not_change_results(self):
+        self.assertLessEqual(similarity._chunk_size(10 ** 6) * 10 ** 6, similarity.MAX_CHUNK_SCORES)
+        seed_catalog(products=60, categories=1, sale_items=0, max_images=0, seed=5)
+        similarity.build_similar_products(k=5)
+        expected = dict(ProductSimilarity.objects.values_list('product_id', 'scores'))
+        self.assertEqual(len(expected), 60)
+        self.addCleanup(setattr, similarity, 'MAX_CHUNK_SCORES', similarity.MAX_CHUNK_SCORES)
+        similarity.MAX_CHUNK_SCORES = 60 * 3
+        similarity.build_similar_products(k=5)
+        self.assertEqual(dict(ProductSimilarity.objects.values_list('product_id', 'scores')), expected)
+
+
+class ProductFilterTests(TestCase):
+    def test_equivalent_queries_share_cache_key(self):
+        a = ProductFilter(QueryDict('brand=B&brand=A&seal__not=rubber&price_min=10'))
+        b = ProductFilter(QueryDict('price_min=10,00&seal__not=rubber&brand=A,B,A'))
+        self.assertEqual(a.include, {'brand': ('A', 'B')})
+        self.assertEqual(a.exclude, {'seal': ('rubber',)})
+        self.assertEqual(a.cache_key, b.cache_key)
+
+    def test_comma_between_digits_is_not_a_separator(self):
+        self.assertEqual(ProductFilter(QueryDict('size=215,9')).include, {'size': ('215,9',)})
+        self.assertEqual(ProductFilter(QueryDict('size=215,9, 311')).include, {'size': ('215,9', '311')})
+
+    def test_malformed_and_oversized_prices_are_rejected(self):
+        for value in ('abc', 'inf', 'NaN', '1e30', '9' * 40):
+            with self.subTest(value=value), self.assertRaises(ValidationError) as raised:
+                ProductFilter(QueryDict(f'price_max={value}'))
+            self.assertIn('price_max', raised.exception.detail)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_bad_price_is_400_not_500(self):
+        category = Category.objects.create(name='Долота')
+        for url in ('/api/v1/products/', '/api/v1/products/filters/', f'/api/v1/categories/{category.id}/filters/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'price_min': '1e30'})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('price_min', response.json())
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class AsyncViewsTests(TestCase):
+    """Асинхронные представления отвечают так же, как заменяемые ими представления DRF"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(products=50, categories=2, sale_items=45, max_images=1, seed=3)
+        cls.category = Category.objects.order_by('id').first()
+        cls.brand = Product.objects.filter(category=cls.category).values_list('brand', flat=True).first()
+
+    def assertSameResponses(self, sync_view, async_view, path, queries, **kwargs):
+        for query in queries:
+            with self.subTest(query=query):
+                cache.clear()
+                expected = sync_view(RequestFactory().get(path, query), **kwargs)
+                expected.render()
+                cache.clear()
+                actual = async_to_sync(async_view)(RequestFactory().get(path, query), **kwargs)
+                self.assertEqual(actual.status_code, expected.status_code)
+                self.assertEqual(json.loads(actual.content), json.loads(expected.content))
+
+    def test_product_list(self):
+        category = self.category.id
+        self.assertSameResponses(
+            ProductViewSet.as_view({'get': 'list'}), async_views.product_list, '/api/v1/products/', [
+                {}, {'page': 2}, {'page': 'last'}, {'page': 0}, {'page': 'x'}, {'page': 99},
+                {'category': category, 'availability': 'in-stock', 'brand': self.brand},
+                {'category': category, 'page': 'last'}, {'brand__not': self.brand, 'price_min': '100,5'},
+                {'price_min': '1e30'}, {'price_max': 'abc'}, {'category': 'x'},
+            ],
+        )
+
+    def test_filters(self):
+        queries = [{}, {'availability': 'in-stock', 'brand': self.brand}, {'price_min': '1e30'}]
+        self.assertSameResponses(
+            ProductViewSet.as_view({'get': 'filters'}), async_views.product_filters, '/api/v1/products/filters/',
+            queries + [{'category': self.category.id}],
+        )
+        self.assertSameResponses(
+            CategoryFiltersView.as_view(), async_views.category_filters,
+            f'/api/v1/categories/{self.category.id}/filters/', queries, category_id=self.category.id,
+        )
+
+    def test_sale_item_list(self):
+        self.assertSameResponses(
+            SaleItemViewSet.as_view({'get': 'list'}), async_views.sale_item_list, '/api/v1/sale-items/',
+            [{}, {'page': 2}, {'page': 'last'}, {'page': 0}, {'page': 'x'}, {'page': 99}],
+        )
+
+
+# Основная база в роли реплики: роутер выбирает её явно, а основная база — это None
+@override_settings(REPLICA_DATABASES=['default'], REPLICA_HEALTH_INTERVAL=0)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        routers._health.clear()
+
+    def route(self, method='GET', view=ProductViewSet.as_view({'get': 'list'}), cookies=None, write=False):
+        """База для чтения внутри запроса и ответ middleware"""
+        router = routers.ReplicaRouter()
+        routed = {}
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            if write:
+                router.db_for_write(Product)
+            routed['db'] = router.db_for_read(Product)
+            return HttpResponse()
+
+        middleware = routers.ReplicaRoutingMiddleware(get_response)
+        request = RequestFactory().generic(method, '/')
+        request.COOKIES.update(cookies or {})
+        response = middleware(request)
+        return routed['db'], response
+
+    def test_catalog_reads_go_to_replica(self):
+        db, response = self.route()
+        self.assertEqual(db, 'default')
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+    def test_writes_use_primary_and_stick(self):
+        db, response = self.route('POST', OrderViewSet.as_view({'post': 'create'}))
+        self.assertIsNone(db)
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+    def test_reads_after_write_use_primary(self):
+        db, _ = self.route(cookies={settings.REPLICA_STICKY_COOKIE: '1'})
+        self.assertIsNone(db)
+        db, response = self.route(write=True)
+        self.assertIsNone(db)
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+    @override_settings(REPLICA_MAX_LAG=-1)
+    def test_lagging_replica_falls_back_to_primary(self):
+        db, _ = self.route()
+        self.assertIsNone(db)
+
+    def test_lag_counts_only_while_replay_is_behind(self):
+        self.assertEqual(routers._replica_lag('default'), 0)
+        # Простой основной базы: всё полученное применено, последняя транзакция час назад
+        self.assertEqual(routers.lag_seconds(True, 3600), 0)
+        self.assertEqual(routers.lag_seconds(False, 12.5), 12.5)
+        # Реплика восстанавливается из архива WAL, без потоковой репликации
+        self.assertEqual(routers.lag_seconds(None, 12.5), 12.5)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class IdempotencyTests(TestCase):
+    def post(self, url, data, key='key-1'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, data, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_contact_message_without_side_effects(self):
+        data = {'email': 'client@example.com', 'message': 'Перезвоните'}
+        first = self.post('/api/v1/contact/', data)
+        retry = self.post('/api/v1/contact/', data)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry.json()), (201, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(ContactMessage.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_key_reused_with_other_body_is_rejected(self):
+        self.post('/api/v1/contact/', {'email': 'client@example.com', 'message': 'Первое'})
+        response = self.post('/api/v1/contact/', {'email': 'client@example.com', 'message': 'Второе'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(ContactMessage.objects.count(), 1)
+
+    def test_request_in_progress_conflicts(self):
+        data = {'email': 'client@example.com', 'message': 'Перезвоните'}
+        record, claimed = idempotency.claim('contact', 'key-1', hashlib.sha256(json.dumps(data).encode()).hexdigest())
+        self.assertTrue(claimed)
+        response = self.post('/api/v1/contact/', data)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(ContactMessage.objects.count(), 0)
+
+    def test_failed_request_releases_key(self):
+        response = self.post('/api/v1/contact/', {'email': 'not-an-email', 'message': ''})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+@override_settings(
+    SECURE_SSL_REDIRECT=False, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    WRITE_THROTTLE_RATES={'contact': {'ip': (2, 1), 'global': (3, 1)}},
+)
+class ThrottleTests(TestCase):
+    def post(self, ip):
+        data = {'email': 'client@example.com', 'message': 'Перезвоните'}
+        return self.client.post('/api/v1/contact/', data, content_type='application/json', HTTP_X_REAL_IP=ip)
+
+    def test_per_ip_and_global_buckets(self):
+        # Внутри транзакции теста now() не меняется, и бакеты не пополняются
+        self.assertEqual([self.post('10.0.0.1').status_code for _ in range(3)], [201, 201, 429])
+        self.assertEqual(self.post('10.0.0.2').status_code, 201)
+        response = self.post('10.0.0.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(ContactMessage.objects.count(), 3)
+
+
+# Лента отдаёт только транзакции старше незавершённых, поэтому тестам нужны настоящие коммиты
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CatalogChangesTests(TransactionTestCase):
+    def feed(self):
+        return {(row['type'], row['id']): row for row in self.client.get('/api/v1/changes/?limit=500').json()['results']}
+
+    def test_only_hidden_sale_items_are_sent_as_deletions(self):
+        now = timezone.now()
+        shown = SaleItem.objects.create(title='A', slug='a', description='', old_price=2, new_price=1)
+        expired = SaleItem.objects.create(
+            title='B', slug='b', description='', old_price=2, new_price=1, ends_at=now - timedelta(days=1),
+        )
+        hidden = SaleItem.objects.create(title='C', slug='c', description='', old_price=2, new_price=1, is_active=False)
+        expired_image = SaleItemImage.objects.create(sale_item=expired, image='sale_items/b.jpg')
+        hidden_image = SaleItemImage.objects.create(sale_item=hidden, image='sale_items/c.jpg')
+        feed = self.feed()
+        self.assertFalse(feed[('sale_item', shown.id)]['deleted'])
+        self.assertIsNotNone(feed[('sale_item', expired.id)]['data']['ends_at'])
+        self.assertTrue(feed[('sale_item', hidden.id)]['deleted'])
+        self.assertFalse(feed[('sale_item_image', expired_image.id)]['deleted'])
+        self.assertTrue(feed[('sale_item_image', hidden_image.id)]['deleted'])
+
+    def test_scheduled_sale_item_becomes_visible_at_its_start(self):
+        starts_at = timezone.now() + timedelta(hours=1)
+        scheduled = SaleItem.objects.create(
+            title='A', slug='a', description='', old_price=2, new_price=1, starts_at=starts_at,
+        )
+        self.assertFalse(SaleItem.objects.active().exists())
+        data = self.feed()[('sale_item', scheduled.id)]['data']
+        # Открытие окна в журнал не попадает: клиент показывает распродажу по полученному starts_at
+        self.assertEqual(parse_datetime(data['starts_at']), starts_at)
+        self.assertEqual(list(SaleItem.objects.active(now=parse_datetime(data['starts_at']))), [scheduled])
+
+    def test_bulk_writes_are_journaled(self):
+        seed_catalog(products=3, categories=1, sale_items=2, max_images=2, seed=1)
+        journaled = set(CatalogChange.objects.values_list('model', 'object_id'))
+        expected = {('product_image', pk) for pk in ProductImage.objects.values_list('id', flat=True)}
+        expected |= {('sale_item_image', pk) for pk in SaleItemImage.objects.values_list('id', flat=True)}
+        self.assertLessEqual(expected, journaled)
+
+        product = Product.objects.order_by('id').first()
+        Product.objects.filter(pk=product.pk).update(price=0)
+        CatalogChange.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('fix_prices', stdout=io.StringIO())
+        self.assertEqual(list(CatalogChange.objects.values_list('model', 'object_id')), [('product', product.id)])
+        # Поток остатков тоже узнаёт о новой цене
+        self.assertTrue(any('pg_notify' in query['sql'] for query in queries.captured_queries))
+
+
+class PublishingTests(TransactionTestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.settings = override_settings(CATALOG_SNAPSHOT_ROOT=self.root.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def versions(self):
+        return sorted(os.listdir(os.path.join(self.root.name, publishing.VERSIONS_DIR)))
+
+    def test_watcher_publishes_missing_snapshot_and_catalog_changes(self):
+        seed_catalog(products=3, categories=1, sale_items=1, max_images=0, seed=1)
+        publishing.watch_catalog(poll=0, window=0, max_delay=0, iterations=1)
+        self.assertEqual(len(self.versions()), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.root.name, 'current', 'api', 'v1', 'sale-items')))
+
+        # Без изменений журнала снимок не пересобирается
+        publishing.watch_catalog(poll=0, window=0, max_delay=0, iterations=2)
+        self.assertEqual(len(self.versions()), 1)
+
+        Category.objects.get().save()
+        publishing.watch_catalog(poll=0, window=0, max_delay=0, iterations=1)
+        self.assertEqual(len(self.versions()), 2)
+
+
+class ConnectionPoolTests(TestCase):
+    def new_connection(self):
+        raw = connection.get_new_connection(connection.get_connection_params())
+        self.addCleanup(raw.close)
+        return raw
+
+    def test_acquire_release_timeout_and_discard(self):
+        pool = ConnectionPool(size=1, timeout=0.01)
+        # Пустой пул отдаёт место, но не соединение: его открывает бэкенд
+        self.assertIsNone(pool.acquire())
+        with self.assertRaises(OperationalError):
+            pool.acquire()
+
+        raw = self.new_connection()
+        pool.release(raw, 1)
+        self.assertEqual(pool.acquire(), (raw, 1))
+
+        # Соединение, не вернувшееся в пул, освобождает место через discard
+        pool.discard()
+        self.assertIsNone(pool.acquire())
+        pool.discard()
+
+    def test_closed_connection_is_not_handed_out(self):
+        pool = ConnectionPool(size=1, timeout=0.01)
+        self.assertIsNone(pool.acquire())
+        raw = self.new_connection()
+        pool.release(raw, 1)
+        raw.close()
+        self.assertIsNone(pool.acquire())
+
+
+class MetricsTests(TestCase):
+    def test_scraped_over_plain_http_from_internal_network(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='172.18.0.5')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'api_responses_total', response.content)
+
+    def test_forwarded_address_is_not_trusted(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='203.0.113.7', HTTP_X_REAL_IP='10.0.0.1')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, REQUEST_TIMING_HEADER=False)
+class ServerTimingTests(TestCase):
+    def test_header_only_for_staff_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/v1/categories/'))
+        self.client.force_login(get_user_model().objects.create_user('editor', is_staff=True))
+        self.assertIn('queries', self.client.get('/api/v1/categories/')['Server-Timing'])
+
+    async def test_async_views_check_staff_from_session(self):
+        self.assertNotIn('Server-Timing', await self.async_client.get('/api/v1/products/'))
+        user = await get_user_model().objects.acreate(username='editor', is_staff=True)
+        await sync_to_async(self.async_client.force_login)(user)
+        self.assertIn('Server-Timing', await self.async_client.get('/api/v1/products/'))
+
+    def test_header_for_everyone_when_enabled(self):
+        with override_settings(REQUEST_TIMING_HEADER=True):
+            self.assertIn('Server-Timing', self.client.get('/api/v1/categories/'))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin'))
+
+    def test_disabled_by_default(self):
+        self.assertNotIn('X-Profile-Report', self.client.get('/api/v1/categories/', HTTP_X_PROFILE='1'))
+
+    def test_superuser_gets_report_when_enabled(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(PROFILING_ENABLED=True, PROFILING_ROOT=root):
+            response = self.client.get('/api/v1/categories/', HTTP_X_PROFILE='1')
+            self.assertIn('X-Profile-Report', response)
+            self.assertEqual(len(os.listdir(root)), 2)
+
+
+@override_settings(FRONTEND_REVALIDATE_URL='http://frontend.test/api/revalidate')
+class RevalidationTests(TestCase):
+    def setUp(self):
+        self.delivered = []
+        # Окно больше теста: отправляет только flush()
+        revalidation._notifier = revalidation.CoalescingDispatcher(self.delivered.extend, window=3600, max_delay=3600)
+        self.addCleanup(setattr, revalidation, '_notifier', None)
+
+    def test_moving_product_revalidates_both_categories(self):
+        seed_catalog(products=1, categories=2, sale_items=0, max_images=0, seed=1)
+        product = Product.objects.get()
+        old_category = product.category_id
+        new_category = Category.objects.exclude(pk=old_category).get().pk
+        product.category_id = new_category
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        revalidation.get_notifier().flush()
+        self.assertEqual(
+            sorted(self.delivered), sorted([f'/catalog/{old_category}', f'/catalog/{new_category}', f'/product/{product.pk}']),
+        )
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, ORDER_ARCHIVE_AFTER_DAYS=30, CONTACT_ARCHIVE_AFTER_DAYS=30)
+class ArchiveTests(TestCase):
+    def test_old_rows_move_to_archive_with_their_ids(self):
+        seed_catalog(products=5, categories=1, orders=7, sale_items=0, max_images=0, seed=1)
+        now = timezone.now()
+        orders = list(Order.objects.order_by('id'))
+        Order.objects.filter(pk__in=[order.pk for order in orders[:5]]).update(created_at=now - timedelta(days=40))
+        ContactMessage.objects.bulk_create([ContactMessage(email='client@example.com', message=str(i)) for i in range(3)])
+        ContactMessage.objects.filter(message='0').update(created_at=now - timedelta(days=40))
+
+        self.assertEqual(archive.archive_old('orders', batch_size=2), 5)
+        self.assertEqual(archive.archive_old('contact_messages'), 1)
+        self.assertEqual(archive.archive_old('orders'), 0)
+        self.assertEqual(
+            list(OrderArchive.objects.order_by('id').values_list('id', 'phone')),
+            [(order.pk, order.phone) for order in orders[:5]],
+        )
+        self.assertEqual(list(Order.objects.order_by('id')), orders[5:])
+        self.assertEqual(ContactMessageArchive.objects.get().message, '0')
+        self.assertEqual(ContactMessage.objects.count(), 2)
+
+        # Заказ по id находится и после переноса в архив
+        response = self.client.get(f'/api/v1/orders/{orders[0].pk}/')
+        self.assertEqual((response.status_code, response.json()['phone']), (200, orders[0].phone))
+        self.assertEqual(self.client.get('/api/v1/orders/0/').status_code, 404)
+        self.assertEqual(self.client.get('/api/v1/orders/x/').status_code, 404)
+
+
+class SeedCatalogTests(TransactionTestCase):
+    def test_flush_keeps_real_orders(self):
+        options = dict(products=5, categories=1, orders=3, sale_items=0, max_images=0, stdout=io.StringIO())
+        call_command('seed_catalog', **options)
+        real = Order.objects.create(
+            total=1, phone='+79001234567', email='client@mail.ru', first_name='Иван', last_name='Петров',
+            zip_code='450000', region='Башкортостан', city='Уфа', address='ул. Ленина, 1',
+            delivery_method='pickup', agreed_to_terms=True, products=[],
+        )
+        call_command('seed_catalog', flush=True, **options)
+        self.assertEqual(Order.objects.count(), 4)
+        self.assertTrue(Order.objects.filter(pk=real.pk, email='client@mail.ru').exists())
+        # Новые заказы не занимают id существующих
+        self.assertGreater(Order.objects.order_by('id').last().pk, real.pk)
+
+
+class BulkEditTests(TestCase):
+    def test_spreadsheet_round_trip(self):
+        seed_catalog(products=3, categories=1, sale_items=0, max_images=0, seed=1)
+        products = list(Product.objects.order_by('id'))
+        workbook = load_workbook(io.BytesIO(bulk_edit.export_products(Product.objects.all())))
+        rows = list(workbook.active.iter_rows(min_row=2))
+        rows[0][3].value = float(products[0].price) + 1
+        rows[1][4].value = products[1].quantity + 5
+        upload = io.BytesIO()
+        workbook.save(upload)
+        upload.seek(0)
+
+        changes = bulk_edit.unsign_changes(bulk_edit.sign_changes(bulk_edit.read_changes(upload)))
+        self.assertEqual([change.id for change in changes], [products[0].id, products[1].id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(bulk_edit.apply_changes(changes), 2)
+        products[0].refresh_from_db()
+        products[1].refresh_from_db()
+        self.assertEqual(products[0].price, changes[0].new_price)
+        self.assertEqual(products[1].quantity, changes[1].new_quantity)
+        self.assertEqual(CatalogChange.objects.filter(model='product').count(), 3 + 2)
+        with self.assertRaises(bulk_edit.BulkEditError):
+            bulk_edit.apply_changes(changes)
@@ -0,0 +1,92 @@
+"""Ограничение анонимной записи токен-бакетами в PostgreSQL.
+
+Для области throttle_scope представления в WRITE_THROTTLE_RATES заданы два
+бакета: на IP клиента (из X-Real-IP, который выставляет nginx; адреса IPv6
+группируются по /64) и общий. Бакет вмещает burst токенов и пополняется на
+per_minute в минуту; запрос забирает по токену из обоих, сначала из бакета
+IP, чтобы один флудящий адрес не расходовал общий.
+
+Бакеты — строки нежурналируемой таблицы ThrottleBucket, поэтому лимиты общие
+для всех воркеров. Проверка — один UPSERT: пополнение и списание идут в
+ON CONFLICT DO UPDATE ... WHERE, и отклонённый запрос ничего не пишет.
+Проверка выполняется в initial() DRF, до разбора тела запроса.
+"""
+import ipaddress
+import math
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import THROTTLED, client_ip
+from .models import ThrottleBucket
+
+# Сколько давно полных бакетов удаляется при создании нового
+PURGE_BATCH = 100
+
+TABLE = ThrottleBucket._meta.db_table
+REFILLED = 'LEAST(%(burst)s, b.tokens + EXTRACT(EPOCH FROM now() - b.updated_at) * %(rate)s)'
+TAKE_SQL = (
+    f'INSERT INTO {TABLE} AS b (key, tokens, updated_at) VALUES (%(key)s, %(burst)s - 1, now()) '
+    f'ON CONFLICT (key) DO UPDATE SET tokens = {REFILLED} - 1, updated_at = now() WHERE {REFILLED} >= 1 '
+    'RETURNING xmax = 0'
+)
+# Бакет, который успел наполниться, ничем не отличается от отсутствующего
+PURGE_SQL = (
+    f'DELETE FROM {TABLE} WHERE key IN (SELECT key FROM {TABLE} '
+    'WHERE updated_at < now() - make_interval(secs => %s) LIMIT %s)'
+)
+
+
+def bucket_ip(ip):
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip
+    if address.version == 6:
+        return str(ipaddress.ip_network(f'{address}/64', strict=False))
+    return str(address)
+
+
+def _refill_seconds():
+    return max(
+        burst * 60 / per_minute
+        for rates in settings.WRITE_THROTTLE_RATES.values() for burst, per_minute in rates.values()
+    )
+
+
+def take_token(key, burst, per_minute):
+    """Забрать токен из бакета key; False — бакет пуст"""
+    rate = per_minute / 60
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.execute(TAKE_SQL, {'key': key, 'burst': burst, 'rate': rate})
+        row = cursor.fetchone()
+        if row is not None and row[0]:
+            cursor.execute(PURGE_SQL, [_refill_seconds(), PURGE_BATCH])
+    return row is not None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Токен-бакеты для небезопасных методов; область — атрибут throttle_scope представления"""
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        scope = getattr(view, 'throttle_scope', None)
+        rates = settings.WRITE_THROTTLE_RATES.get(scope)
+        if not settings.WRITE_THROTTLE_ENABLED or rates is None or request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return True
+        buckets = (
+            ('ip', f'{scope}:ip:{bucket_ip(client_ip(request))}'),
+            ('global', f'{scope}:global'),
+        )
+        for bucket, key in buckets:
+            burst, per_minute = rates[bucket]
+            if not take_token(key, burst, per_minute):
+                THROTTLED.labels(scope, bucket).inc()
+                # Токен появится не позже чем через 60 / per_minute секунд
+                self.retry_after = math.ceil(60 / per_minute)
+                return False
+        return True
+
+    def wait(self):
+        return self.retry_after
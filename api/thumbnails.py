@@ -0,0 +1,47 @@
+"""Превью изображений для админки.
+
+Вместо оригинала (до нескольких мегабайт) страница списка получает WebP
+размером не больше THUMBNAIL_SIZE пикселей. Превью создаётся при первом
+показе и хранится рядом с медиафайлами в thumbnails/<размер>/, поэтому
+nginx раздаёт его как обычный файл. SVG показывается как есть.
+"""
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils.html import format_html
+from django.utils.translation import gettext_lazy as _
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_DIR = 'thumbnails'
+
+
+def thumbnail_url(field_file, size=None):
+    size = size or settings.THUMBNAIL_SIZE
+    if field_file.name.lower().endswith('.svg'):
+        return field_file.url
+    name = f'{THUMBNAILS_DIR}/{size}/{os.path.splitext(field_file.name)[0]}.webp'
+    storage = field_file.storage
+    if not storage.exists(name):
+        try:
+            with field_file.open('rb'), Image.open(field_file) as image:
+                image.thumbnail((size, size))
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA')
+                buffer = io.BytesIO()
+                image.save(buffer, 'WEBP', quality=80)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Cannot make a thumbnail of {field_file.name}: {e}')
+            return field_file.url
+        storage.save(name, ContentFile(buffer.getvalue()))
+    return storage.url(name)
+
+
+def thumbnail_tag(field_file, height=100):
+    if not field_file:
+        return _("Нет изображения")
+    return format_html('<img src="{}" height="{}" loading="lazy" />', thumbnail_url(field_file), height)
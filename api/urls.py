@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework import routers
+
+from . import async_views
 from .views import (
     ContactMessageViewSet,
     EmployeeViewSet,
@@ -10,6 +13,7 @@ from .views import (
     SaleItemImageViewSet,
     ProductImageViewSet,
     CategoryFiltersView,
+    CatalogChangesView,
 )
 
 v1_router_api = routers.DefaultRouter()
@@ -25,8 +29,18 @@ v1_router_api.register(r'orders', OrderViewSet, basename='orders')
 api_urls = [
     path('categories/<int:category_id>/filters/', CategoryFiltersView.as_view(), name='category-filters'),
     path('products/filters/', ProductViewSet.as_view({'get': 'filters'}), name='product-filters'),
+    path('changes/', CatalogChangesView.as_view(), name='catalog-changes'),
 ]
 
+if settings.ASYNC_CATALOG_VIEWS:
+    # Под ASGI горячие чтения каталога обслуживают корутины; имена маршрутов те же
+    api_urls = [
+        path('categories/<int:category_id>/filters/', async_views.category_filters, name='category-filters'),
+        path('products/filters/', async_views.product_filters, name='product-filters'),
+        path('products/', async_views.product_list, name='products-list'),
+        path('sale-items/', async_views.sale_item_list, name='sale-items-list'),
+    ] + api_urls
+
 
 api_urls.extend(v1_router_api.urls)
 
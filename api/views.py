@@ -1,17 +1,30 @@
 from django.core.mail import send_mail
-from django.db.models import Count
+from django.db import connection, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import Http404
+from django.utils import timezone
 from rest_framework import viewsets, mixins, status
 from django.conf import settings
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 import logging
 import threading
 
+from .budgets import QueryBudgetMixin
+from .caching import get_or_compute, get_version
+from .changes import InvalidCursor, changes_since
+from .filters import ProductFilter, PRODUCT_FILTER_FIELDS
+from .idempotency import idempotent
+from .metrics import EMAIL_OUTBOX, EMAILS
 from .permissions import IsSuperUserOrReadOnly
-from .models import ContactMessage, Employee, Category, Product, Order, SaleItemImage, SaleItem, ProductImage
+from .routers import replica_reads
+from .throttling import TokenBucketThrottle
+from .models import ContactMessage, Employee, Category, Product, Order, SaleItemImage, SaleItem, ProductImage, \
+    ProductSimilarity, OrderArchive
 from .serializers import ContactMessageSerializer, EmployeeSerializer, CategorySerializer, ProductSerializer, \
     OrderSerializer, SaleItemImageSerializer, SaleItemSerializer, ProductImageSerializer, CategoryProductsSerializer
 
@@ -22,18 +35,34 @@ class ContactMessageViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
     queryset = ContactMessage.objects.all()
     serializer_class = ContactMessageSerializer
     http_method_names = ['post']
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'contact'
+
+    @idempotent('contact')
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         instance = serializer.save()
-        send_mail(
-            subject='Новое сообщение с сайта Geology',
-            message=f'От: {instance.email}\n\nСообщение: {instance.message}',
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[settings.ADMIN_EMAIL],
-            fail_silently=False,
-        )
+        # После коммита: откатившееся сообщение (см. api.idempotency) не должно уйти письмом
+        transaction.on_commit(lambda: self.send_email(instance))
+
+    def send_email(self, instance):
+        try:
+            send_mail(
+                subject='Новое сообщение с сайта Geology',
+                message=f'От: {instance.email}\n\nСообщение: {instance.message}',
+                from_email=settings.EMAIL_HOST_USER,
+                recipient_list=[settings.ADMIN_EMAIL],
+                fail_silently=False,
+            )
+            EMAILS.labels('contact', 'sent').inc()
+        except Exception as e:
+            logger.error(f"Email sending failed for contact message #{instance.id}: {str(e)}")
+            EMAILS.labels('contact', 'failed').inc()
 
 
+@replica_reads
 class EmployeeViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsSuperUserOrReadOnly]
     queryset = Employee.objects.all()
@@ -43,14 +72,36 @@ class EmployeeViewSet(viewsets.ReadOnlyModelViewSet):
         return {'request': self.request}
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+def get_categories_with_counts():
+    """Меню категорий со счётчиками товаров: один запрос на промахе кэша.
+
+    Версия сбрасывается сигналами Category и Product; массовые обновления
+    в обход сигналов (update(), bulk_update) видны не позже чем через таймаут.
+    """
+    key = f'categories:counts:{get_version("categories")}'
+    return get_or_compute(
+        key,
+        lambda: list(Category.objects.with_counts()),
+        settings.CATEGORY_COUNTS_CACHE_TIMEOUT,
+    )
+
+
+@replica_reads
+class CategoryViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
+    # Счётчики товаров нужны только списку (get_categories_with_counts); retrieve и правки обходятся без GROUP BY
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsSuperUserOrReadOnly]
+    query_budget = {'list': 1, 'retrieve': 3, 'products': 3}
 
     def get_serializer_context(self):
         return {'request': self.request}
 
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(get_categories_with_counts())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['get'])
     def products(self, request, pk=None):
         category = self.get_object()
@@ -60,36 +111,74 @@ class CategoryViewSet(viewsets.ModelViewSet):
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
+        prefetch_related_objects([instance], Prefetch('products', Product.objects.prefetch_related('images')))
         serializer = CategoryProductsSerializer(instance, context={'request': request})
         return Response(serializer.data)
 
 
 def get_filter_counts(queryset, filter_fields):
-    """Возвращает доступные значения фильтров и их количество"""
-    result = {}
+    """Возвращает доступные значения фильтров, их количество и гистограмму цен.
+
+    Все фасеты считаются одним запросом: UNION ALL группировок по каждому
+    полю и width_bucket по квантилям цены, так что границы корзин
+    подстраиваются под распределение цен в выборке.
+    """
+    base_sql, params = queryset.order_by().values('price', *filter_fields).query.sql_with_params()
+    buckets = settings.PRICE_HISTOGRAM_BUCKETS
+    quantiles = [i / buckets for i in range(1, buckets)]
+
+    facets = [
+        f"SELECT %s, {field}::text, COUNT(*), NULL::numeric, NULL::numeric "
+        f"FROM base WHERE {field} IS NOT NULL AND {field} <> '' GROUP BY {field}"
+        for field in filter_fields
+    ]
+    facets.append(
+        "SELECT %s, width_bucket(price::float8, edges.e)::text, COUNT(*), MIN(price), MAX(price) "
+        "FROM base, edges GROUP BY 2"
+    )
+    sql = (
+        f"WITH base AS ({base_sql}), "
+        f"edges AS (SELECT percentile_cont(%s::float8[]) WITHIN GROUP (ORDER BY price) AS e FROM base) "
+        + " UNION ALL ".join(facets)
+    )
+    params = (*params, quantiles, *filter_fields, 'price')
+
+    result = {field: [] for field in filter_fields}
+    histogram = []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for facet, value, count, price_from, price_to in cursor.fetchall():
+            if facet == 'price':
+                histogram.append((int(value), price_from, price_to, count))
+            else:
+                result[facet].append({"value": value, "count": count})
+
     for field in filter_fields:
-        # Группируем и считаем количество
-        aggregation = (
-            queryset
-            .exclude(**{field: None})
-            .exclude(**{field: ""})
-            .values(field)
-            .annotate(count=Count('id'))
-            .order_by(field)
-        )
-
-        result[field] = [
-            {"value": item[field], "count": item["count"]}
-            for item in aggregation
-        ]
+        result[field].sort(key=lambda item: item["value"])
+    histogram.sort()
+    result['price'] = {
+        "min": str(histogram[0][1]) if histogram else None,
+        "max": str(histogram[-1][2]) if histogram else None,
+        "histogram": [
+            {"min": str(price_from), "max": str(price_to), "count": count}
+            for _, price_from, price_to, count in histogram
+        ],
+    }
     return result
 
 
+def get_cached_filter_counts(queryset, filter_fields, product_filter):
+    """get_filter_counts с кэшем по нормализованному фильтру"""
+    return get_or_compute(
+        f'filter-counts:{product_filter.cache_key}',
+        lambda: get_filter_counts(queryset, filter_fields),
+        settings.FILTER_COUNTS_CACHE_TIMEOUT,
+    )
+
+
+@replica_reads
 class CategoryFiltersView(APIView):
-    filter_fields = [
-        'size', 'brand', 'thread_connection',
-        'thread_connection_2', 'armament', 'seal', 'iadc'
-    ]
+    filter_fields = PRODUCT_FILTER_FIELDS
 
     def get(self, request, category_id):
         try:
@@ -98,35 +187,21 @@ class CategoryFiltersView(APIView):
             return Response({"error": "Category not found"}, status=404)
 
         # Применяем фильтры из запроса
-        filters = {}
-        for field in self.filter_fields:
-            value = request.query_params.get(field)
-            if value:
-                filters[f"{field}__exact"] = value
-
-        # Фильтр по наличию
-        availability = request.query_params.get('availability')
-        if availability == 'in-stock':
-            filters['quantity__gt'] = 0
-        elif availability == 'out-of-stock':
-            filters['quantity'] = 0
-
-        # Получаем продукты с учетом фильтров
-        products = Product.objects.filter(category=category, **filters)
+        product_filter = ProductFilter(request.query_params, self.filter_fields, category_id=category.id)
+        products = product_filter.apply(Product.objects.all())
 
         # Используем общую функцию для получения фильтров
-        result = get_filter_counts(products, self.filter_fields)
+        result = get_cached_filter_counts(products, self.filter_fields, product_filter)
         return Response(result)
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+@replica_reads
+class ProductViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all().prefetch_related('images')
     serializer_class = ProductSerializer
     permission_classes = [IsSuperUserOrReadOnly]
-    filter_fields = [
-        'size', 'brand', 'thread_connection',
-        'thread_connection_2', 'armament', 'seal', 'iadc'
-    ]
+    filter_fields = PRODUCT_FILTER_FIELDS
+    query_budget = {'list': 3, 'retrieve': 2, 'filters': 1, 'similar': 4}
 
     def get_serializer_context(self):
         return {'request': self.request}
@@ -134,25 +209,8 @@ class ProductViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = super().get_queryset()
 
-        # Фильтрация по категории
-        category_id = self.request.query_params.get('category')
-        if category_id:
-            queryset = queryset.filter(category_id=category_id)
-
-        # Фильтрация по наличию
-        availability = self.request.query_params.get('availability')
-        if availability == 'in-stock':
-            queryset = queryset.filter(quantity__gt=0)
-        elif availability == 'out-of-stock':
-            queryset = queryset.filter(quantity=0)
-
-        # Применяем дополнительные фильтры
-        for field in self.filter_fields:
-            value = self.request.query_params.get(field)
-            if value:
-                queryset = queryset.filter(**{field: value})
-
-        return queryset
+        # Категория, наличие, цена и атрибуты компилируются в одно условие
+        return ProductFilter(self.request.query_params, self.filter_fields).apply(queryset)
 
     @action(detail=False, methods=['get'])
     def filters(self, request):
@@ -161,10 +219,27 @@ class ProductViewSet(viewsets.ModelViewSet):
         queryset = self.filter_queryset(self.get_queryset())
 
         # Используем общую функцию для получения фильтров
-        result = get_filter_counts(queryset, self.filter_fields)
+        product_filter = ProductFilter(request.query_params, self.filter_fields)
+        result = get_cached_filter_counts(queryset, self.filter_fields, product_filter)
         return Response(result)
 
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Похожие товары из предрассчитанной таблицы ProductSimilarity"""
+        product = self.get_object()
+        similar_ids = (
+            ProductSimilarity.objects
+            .filter(product=product)
+            .values_list('similar_ids', flat=True)
+            .first()
+        ) or []
+        products = {p.id: p for p in Product.objects.filter(id__in=similar_ids).prefetch_related('images')}
+        ordered = [products[product_id] for product_id in similar_ids if product_id in products]
+        serializer = ProductSerializer(ordered, many=True, context={'request': request})
+        return Response(serializer.data)
 
+
+@replica_reads
 class ProductImageViewSet(viewsets.ModelViewSet):
     serializer_class = ProductImageSerializer
     parser_classes = (MultiPartParser, FormParser)
@@ -189,14 +264,29 @@ class OrderViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
     http_method_names = ['get', 'post', 'head', 'options']
     authentication_classes = []
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'order'
 
+    def retrieve(self, request, *args, **kwargs):
+        # Старые заказы перенесены в архив (api.archive) с теми же id
+        try:
+            instance = self.get_object()
+        except Http404:
+            instance = get_object_or_404(OrderArchive, pk=kwargs[self.lookup_field])
+        return Response(self.get_serializer(instance).data)
+
+    @idempotent('order')
     def create(self, request, *args, **kwargs):
         # Сохраняем заказ
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
+        transaction.on_commit(lambda: self.start_email(order))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def start_email(self, order):
         # Запускаем отправку email в фоновом режиме
+        EMAIL_OUTBOX.inc()
         try:
             threading.Thread(
                 target=self.send_simple_email,
@@ -204,10 +294,9 @@ class OrderViewSet(viewsets.ModelViewSet):
                 daemon=True
             ).start()
         except Exception as e:
+            EMAIL_OUTBOX.dec()
             logger.error(f"Failed to start email thread: {str(e)}")
 
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-
     def send_simple_email(self, order):
         """Минимальная отправка уведомления администратору"""
         try:
@@ -240,28 +329,114 @@ class OrderViewSet(viewsets.ModelViewSet):
                 fail_silently=False
             )
             logger.info(f"Order email sent for order #{order.id}")
+            EMAILS.labels('order', 'sent').inc()
 
         except Exception as e:
             logger.error(f"Email sending failed for order #{order.id}: {str(e)}")
+            EMAILS.labels('order', 'failed').inc()
+        finally:
+            EMAIL_OUTBOX.dec()
+
+
+def sale_items_cache_key(version, minute):
+    return f'sale-items:active:{version}:{minute:%Y%m%d%H%M}'
+
+
+def get_active_sale_items():
+    """Активные распродажи на текущую минуту: два запроса на промахе, ноль на попадании.
 
+    Ключ включает минуту, поэтому окна starts_at/ends_at срабатывают сами,
+    а версия сбрасывается сигналами при изменении распродаж.
+    """
+    minute = timezone.now().replace(second=0, microsecond=0)
+    return get_or_compute(
+        sale_items_cache_key(get_version('sale-items'), minute),
+        lambda: list(SaleItem.objects.active(minute).prefetch_related('images')),
+        settings.SALE_ITEMS_CACHE_TIMEOUT,
+    )
 
-class SaleItemViewSet(viewsets.ModelViewSet):
+
+@replica_reads
+class SaleItemViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     permission_classes = [IsSuperUserOrReadOnly]
     queryset = SaleItem.objects.prefetch_related('images').all()
     serializer_class = SaleItemSerializer
     lookup_field = 'slug'
+    query_budget = {'list': 2, 'retrieve': 2}
 
     def get_queryset(self):
         if self.action == 'list':
-            return self.queryset.filter(is_active=True)
+            return self.queryset.active()
         return self.queryset
 
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(get_active_sale_items())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
 
 
+@replica_reads
+class CatalogChangesView(APIView):
+    """Лента изменений каталога: /changes/?since=<курсор>&limit=<n>.
+
+    Начало и конец окна показа распродажи сами по себе в журнал не попадают,
+    поэтому запланированные и завершившиеся распродажи отдаются с данными, и
+    клиент сам сверяет их starts_at/ends_at. Удалёнными считаются только
+    скрытые (is_active=False) распродажи и их изображения.
+    """
+    sources = {
+        'category': (Category.objects.with_counts(), CategorySerializer),
+        'product': (Product.objects.prefetch_related('images'), ProductSerializer),
+        'product_image': (ProductImage.objects.all(), ProductImageSerializer),
+        'sale_item': (SaleItem.objects.prefetch_related('images'), SaleItemSerializer),
+        'sale_item_image': (SaleItemImage.objects.all(), SaleItemImageSerializer),
+    }
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', settings.CHANGES_FEED_PAGE_SIZE)),
+                        settings.CHANGES_FEED_MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({"error": "Invalid limit"}, status=400)
+        try:
+            changes, next_token, has_more = changes_since(request.query_params.get('since'), max(limit, 1))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor"}, status=400)
+
+        # Текущее состояние изменённых объектов — один запрос на модель
+        ids_by_model = {}
+        for change in changes:
+            if not change.deleted:
+                ids_by_model.setdefault(change.model, []).append(change.object_id)
+        objects = {}
+        for model, ids in ids_by_model.items():
+            queryset, serializer_class = self.sources[model]
+            # Скрытые распродажи (и их изображения) клиент получает как удалённые
+            if model == 'sale_item':
+                queryset = queryset.filter(is_active=True)
+            elif model == 'sale_item_image':
+                queryset = queryset.filter(sale_item__is_active=True)
+            for obj in queryset.filter(pk__in=ids):
+                objects[(model, obj.pk)] = serializer_class(obj, context={'request': request}).data
+
+        results = []
+        for change in changes:
+            data = objects.get((change.model, change.object_id))
+            results.append({
+                "type": change.model,
+                "id": change.object_id,
+                "deleted": data is None,
+                "data": data,
+            })
+        return Response({"next": next_token, "has_more": has_more, "results": results})
+
+
+@replica_reads
 class SaleItemImageViewSet(viewsets.ModelViewSet):
     serializer_class = SaleItemImageSerializer
     queryset = SaleItemImage.objects.all()
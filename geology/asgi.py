@@ -12,5 +12,18 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'geology.settings')
+# Под ASGI список товаров, фасеты и распродажи обслуживают асинхронные представления
+os.environ.setdefault('ASYNC_CATALOG_VIEWS', 'True')
+# Потоки sync_to_async не постоянны, и привязанные к ним соединения не переживут запрос: под ASGI — пул
+os.environ.setdefault('DB_POOL_SIZE', '10')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.streaming import STREAM_PATH, product_stream  # noqa: E402 — после настройки Django
+
+
+async def application(scope, receive, send):
+    # Поток остатков и цен — долгие соединения, которые обслуживаются мимо цикла запросов Django
+    if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+        return await product_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
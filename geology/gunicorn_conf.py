@@ -0,0 +1,136 @@
+"""
+Gunicorn configuration for geology project.
+
+    gunicorn -c geology/gunicorn_conf.py geology.wsgi:application
+
+or, with async catalog views under ASGI:
+
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker \
+        gunicorn -c geology/gunicorn_conf.py geology.asgi:application
+
+Defaults are derived from the CPU cores available to the container and can be
+overridden with GUNICORN_* environment variables. The app is preloaded and
+warmed up in the master, so workers share its memory copy-on-write.
+"""
+import gc
+import math
+import os
+import sys
+import time
+import traceback
+
+
+def _available_cores():
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    # Лимит CPU контейнера (cgroup v2): "200000 100000" — две ядра, "max" — без лимита
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cores = min(cores, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _reset_metrics_dir():
+    # Каталог метрик Prometheus должен существовать и быть пуст до preload_app: импорт приложения
+    # создаёт файлы метрик, и в отсутствующем каталоге он падает с FileNotFoundError
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+
+cores = _available_cores()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class == 'gthread':
+    # Потоки перекрывают ожидание базы и SMTP; процессов — по ядру и один запасной
+    workers = _env_int('GUNICORN_WORKERS', cores + 1)
+    threads = _env_int('GUNICORN_THREADS', 4)
+elif worker_class.startswith('uvicorn'):
+    # Ожидание базы в асинхронных представлениях не занимает воркер: процесс на ядро
+    workers = _env_int('GUNICORN_WORKERS', cores)
+    threads = 1
+else:
+    workers = _env_int('GUNICORN_WORKERS', cores * 2 + 1)
+    threads = 1
+
+_reset_metrics_dir()
+preload_app = True
+# Перезапуск воркеров против утечек памяти; разброс, чтобы они не перезапускались одновременно
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 200)
+timeout = _env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+# Heartbeat-файлы воркеров в памяти: в docker /tmp может лежать на медленном overlayfs
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    """Прогрев в мастере до fork: всё, что загружено здесь, воркеры получают готовым"""
+    start = time.perf_counter()
+    from django.db import connections
+    from django.urls import get_resolver, reverse
+
+    from api import serializers
+    from api.metrics import mark_worker_dead
+
+    resolver = get_resolver()
+    resolver.check()
+    for name in ('categories-list', 'products-list', 'sale-items-list', 'orders-list', 'category-filters'):
+        reverse(name, kwargs={'category_id': 1} if name == 'category-filters' else None)
+    for serializer_class in (
+        serializers.CategorySerializer, serializers.ProductSerializer, serializers.SaleItemSerializer,
+        serializers.CategoryProductsSerializer, serializers.OrderSerializer,
+    ):
+        serializer_class().fields
+
+    # Соединения с базой не должны наследоваться воркерами
+    connections.close_all()
+    # Мастер запросов не обслуживает: live-метрики, созданные импортом приложения, не должны
+    # выглядеть ещё одним воркером
+    mark_worker_dead(os.getpid())
+    # Загруженные объекты переносятся в постоянное поколение: сборщик мусора в воркерах
+    # их не обходит и не трогает счётчики ссылок, страницы памяти остаются общими
+    gc.collect()
+    gc.freeze()
+    server.log.info(
+        f'Warmed up in {(time.perf_counter() - start) * 1000:.0f} ms; '
+        f'{workers} {worker_class} workers x {threads} threads on {cores} cores'
+    )
+
+
+def post_fork(server, worker):
+    from api.metrics import register_worker
+
+    register_worker()
+
+
+def child_exit(server, worker):
+    from api.metrics import mark_worker_dead
+
+    mark_worker_dead(worker.pid)
+
+
+def worker_abort(worker):
+    # SIGABRT приходит при превышении timeout: пишем стеки всех потоков, чтобы найти зависший запрос
+    frames = sys._current_frames()
+    for thread_id, frame in frames.items():
+        worker.log.warning(f'Thread {thread_id}:\n' + ''.join(traceback.format_stack(frame)))
@@ -0,0 +1,143 @@
+"""PostgreSQL с учётом соединений и необязательным пулом в процессе.
+
+Без POOL_SIZE это стандартный бэкенд: соединение живёт CONN_MAX_AGE секунд
+и переиспользуется запросами своего потока. С POOL_SIZE > 0 закрытое
+Django соединение возвращается в пул процесса, а новое берётся из него;
+одновременно открыто не больше POOL_SIZE соединений, остальные ждут до
+POOL_TIMEOUT секунд. Это нужно под ASGI, где потоки не постоянны, и для
+ограничения числа соединений при масштабировании воркеров.
+
+Каждое получение соединения учитывается в api.metrics: открыто новое или
+переиспользовано и сколько запрос его ждал.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from api.metrics import record_connection
+
+# Соединение, пролежавшее в пуле дольше, проверяется перед выдачей
+POOL_RECHECK_IDLE = 30
+
+
+class ConnectionPool:
+    def __init__(self, size, timeout):
+        self.pid = os.getpid()
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Свободное соединение из пула (None — открыть новое); ждёт свободного места до timeout"""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise OperationalError(f'No database connection available in the pool within {self.timeout} s')
+        while True:
+            with self.lock:
+                if not self.idle:
+                    return None
+                connection, isolation_level, released_at = self.idle.pop()
+            if connection.closed:
+                continue
+            if time.monotonic() - released_at > POOL_RECHECK_IDLE and not _is_healthy(connection):
+                connection.close()
+                continue
+            return connection, isolation_level
+
+    def release(self, connection, isolation_level):
+        with self.lock:
+            self.idle.append((connection, isolation_level, time.monotonic()))
+        self.slots.release()
+
+    def discard(self):
+        self.slots.release()
+
+
+def _is_healthy(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except Exception:
+        return False
+    return True
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, size, timeout):
+    with _pools_lock:
+        pool = _pools.get(alias)
+        # После fork пул родителя не используется: его соединения принадлежат другому процессу
+        if pool is None or pool.pid != os.getpid():
+            pool = _pools[alias] = ConnectionPool(size, timeout)
+        return pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_size = self.settings_dict.get('POOL_SIZE') or 0
+        self.pool_timeout = self.settings_dict.get('POOL_TIMEOUT', 10)
+        self.reused = False
+        # Соединение уже учтено в текущем запросе
+        self.checked_out = False
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.pool_size, self.pool_timeout) if self.pool_size else None
+
+    def connect(self):
+        start = time.perf_counter()
+        self.reused = False
+        self.checked_out = True
+        super().connect()
+        record_connection(self.reused, time.perf_counter() - start)
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        pooled = pool.acquire()
+        if pooled is not None:
+            self.reused = True
+            connection, self.isolation_level = pooled
+            return connection
+        try:
+            return super().get_new_connection(conn_params)
+        except Exception:
+            pool.discard()
+            raise
+
+    @async_unsafe
+    def ensure_connection(self):
+        if self.connection is not None and not self.checked_out:
+            # Постоянное соединение, пережившее предыдущий запрос
+            self.checked_out = True
+            record_connection(True, 0.0)
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # Проверка на границе HTTP-запросов сама обращается к соединению — это не получение
+        self.checked_out = True
+        super().close_if_unusable_or_obsolete()
+        self.checked_out = False
+
+    def _close(self):
+        pool = self.pool
+        if pool is None:
+            return super()._close()
+        if self.errors_occurred or self.in_atomic_block or self.connection.closed or \
+                self.connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                return super()._close()
+            finally:
+                pool.discard()
+        pool.release(self.connection, self.isolation_level)
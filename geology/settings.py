@@ -29,18 +29,23 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_json_widget',
     'rest_framework',
     'corsheaders',
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.ServerTimingMiddleware',
+    'api.metrics.PrometheusMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.profiling.ProfilingMiddleware',
+    'api.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -69,17 +74,49 @@ TEMPLATES = [
 WSGI_APPLICATION = 'geology.wsgi.application'
 
 # Database
+# Пул соединений в процессе (geology.postgresql): не больше DB_POOL_SIZE соединений на процесс, 0 — без пула
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'geology.postgresql',
         'NAME': os.environ.get('POSTGRES_DB', 'django'),
         'USER': os.environ.get('POSTGRES_USER', 'django_user'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
         'HOST': os.environ.get('DB_HOST', 'db'),
-        'PORT': os.environ.get('DB_PORT', 5432)
+        'PORT': os.environ.get('DB_PORT', 5432),
+        # Постоянные соединения (секунды); с пулом соединение возвращается в пул после каждого запроса
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        # Перед первым запросом в новом HTTP-запросе соединение проверяется, упавшее открывается заново
+        'CONN_HEALTH_CHECKS': True,
+        'POOL_SIZE': DB_POOL_SIZE,
+        # Сколько секунд запрос ждёт свободного места в пуле, затем OperationalError
+        'POOL_TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
     }
 }
 
+# Реплики для чтения каталога (api.routers): хосты через запятую, можно с портом (db-replica:5432)
+REPLICA_DATABASES = []
+for _number, _host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    _host, _, _port = _host.strip().partition(':')
+    DATABASES[f'replica{_number}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        # Недоступная реплика не должна надолго задерживать запрос: после неё чтение идёт в основную базу
+        'OPTIONS': {'connect_timeout': 2},
+        # В тестах реплика — та же база
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica{_number}')
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+# После записи чтения клиента REPLICA_STICKY_SECONDS секунд идут в основную базу (по cookie)
+REPLICA_STICKY_COOKIE = 'db_primary'
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+# Реплика проверяется раз в REPLICA_HEALTH_INTERVAL секунд; отстающая больше REPLICA_MAX_LAG секунд не используется
+REPLICA_HEALTH_INTERVAL = 10
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -97,6 +134,23 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Кэш общий для всех воркеров (Redis): сброс версий api.caching виден сразу во всех процессах.
+# Без REDIS_URL (разработка, тесты) — память процесса, и другие воркеры видят сброс только по таймауту
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -125,12 +179,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Настройки безопасности для HTTPS
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 SECURE_SSL_REDIRECT = True  # Перенаправлять все HTTP на HTTPS
+# Prometheus снимает /metrics по HTTP напрямую с backend:8000, минуя nginx
+SECURE_REDIRECT_EXEMPT = [r'^metrics$']
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 
 
 CORS_ALLOW_CREDENTIALS = True
-CORS_EXPOSE_HEADERS = ['Content-Type', 'X-CSRFToken']
+CORS_EXPOSE_HEADERS = ['Content-Type', 'X-CSRFToken', 'Idempotent-Replayed']
 CORS_ALLOW_METHODS = [
     'GET',
     'PATCH',
@@ -149,6 +205,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
 
 
@@ -193,9 +250,121 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', 'mbo_geology@bk.ru')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.environ.get('EMAIL_HOST_USER', 'mbo_geology@bk.ru')
 SERVER_EMAIL = os.environ.get('EMAIL_HOST_USER', 'mbo_geology@bk.ru')
+# Получатель сообщений с формы обратной связи
+ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', EMAIL_HOST_USER)
 
 
 SITE_URL = 'https://geologiya-ru.ru'
+PUBLIC_API_URL = 'https://api.geologiya-ru.ru'
+PRODUCT_PAGE_URL = SITE_URL + '/product/{id}'
+CATEGORY_PAGE_URL = SITE_URL + '/catalog/{id}'
+
+# Количество предрассчитанных похожих товаров на продукт
+SIMILAR_PRODUCTS_COUNT = 10
+
+# Количество корзин в гистограмме цен фасетов
+PRICE_HISTOGRAM_BUCKETS = 10
+# Время жизни кэша фасетов (секунды), ключ — нормализованный фильтр
+FILTER_COUNTS_CACHE_TIMEOUT = 60
+# Активные распродажи кэшируются поминутно
+SALE_ITEMS_CACHE_TIMEOUT = 120
+# Меню категорий со счётчиками товаров
+CATEGORY_COUNTS_CACHE_TIMEOUT = 60
+
+# Асинхронные представления каталога (api.async_views); geology.asgi включает их по умолчанию
+ASYNC_CATALOG_VIEWS = os.environ.get('ASYNC_CATALOG_VIEWS', 'False') == 'True'
+
+# Поток остатков и цен /api/v1/products/stream/ (api.streaming, только под ASGI)
+PRODUCT_UPDATES_CHANNEL = 'product_updates'
+SSE_MAX_PRODUCTS = 100
+SSE_HEARTBEAT_SECONDS = 15
+# Через сколько миллисекунд браузер переподключается после обрыва
+SSE_RETRY_MS = 5000
+
+# Idempotency-Key для заказов и сообщений (api.idempotency): сколько хранится ответ, секунды
+IDEMPOTENCY_KEY_TTL = 24 * 3600
+# Ключ, занятый дольше, считается брошенным (запрос упал вместе с воркером)
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Токен-бакеты анонимной записи (api.throttling): бакет вмещает burst токенов и пополняется на per_minute в минуту
+WRITE_THROTTLE_ENABLED = os.environ.get('WRITE_THROTTLE_ENABLED', 'True') == 'True'
+WRITE_THROTTLE_RATES = {
+    'order': {'ip': (5, 2), 'global': (60, 120)},
+    'contact': {'ip': (3, 1), 'global': (30, 30)},
+}
+
+# Заказы и сообщения старше срока (дни) переносятся в архивные таблицы командой archive_submissions
+ORDER_ARCHIVE_AFTER_DAYS = int(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', 365))
+CONTACT_ARCHIVE_AFTER_DAYS = int(os.environ.get('CONTACT_ARCHIVE_AFTER_DAYS', 180))
+ARCHIVE_BATCH_SIZE = 1000
+
+# Списки админки: без фильтров число строк таблицы больше порога берётся из статистики Postgres
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
+# Наибольшая сторона превью изображений в админке, пиксели (api.thumbnails)
+THUMBNAIL_SIZE = 200
+
+# Массовая правка цен и остатков через XLSX (api.bulk_edit): строк в одном UPDATE и в предпросмотре
+BULK_EDIT_BATCH_SIZE = 1000
+BULK_EDIT_PREVIEW_ROWS = 200
+
+# Лента изменений каталога /changes/
+CHANGES_FEED_PAGE_SIZE = 500
+CHANGES_FEED_MAX_PAGE_SIZE = 1000
+
+# Ревалидация статических страниц фронтенда (выключена, если URL не задан)
+FRONTEND_REVALIDATE_URL = os.environ.get('FRONTEND_REVALIDATE_URL', '')
+FRONTEND_REVALIDATE_SECRET = os.environ.get('FRONTEND_REVALIDATE_SECRET', '')
+FRONTEND_REVALIDATE_TIMEOUT = 10
+# Изменения копятся REVALIDATE_WINDOW секунд после последнего, но не дольше REVALIDATE_MAX_DELAY
+REVALIDATE_WINDOW = float(os.environ.get('REVALIDATE_WINDOW', 5))
+REVALIDATE_MAX_DELAY = float(os.environ.get('REVALIDATE_MAX_DELAY', 30))
+REVALIDATE_MAX_BATCH = 200
+REVALIDATE_RETRIES = 3
+REVALIDATE_PATHS = {
+    'category': ['/', '/catalog/{id}'],
+    'product': ['/catalog/{category_id}', '/product/{id}'],
+    'sale_item': ['/sale', '/sale/{slug}'],
+}
+
+# Фид Яндекс.Маркета и sitemap (команда build_feeds, раздаёт nginx)
+FEEDS_ROOT = os.path.join(BASE_DIR, 'feeds')
+FEEDS_URL = PUBLIC_API_URL + '/feeds/'
+FEED_SHARD_SIZE = 5000
+FEED_SHOP_NAME = 'Геология'
+FEED_COMPANY = 'МБО Геология'
+# Запас (секунды) при поиске изменённых с прошлой сборки товаров
+FEED_REBUILD_OVERLAP = 60
+
+# Статический снимок каталога для анонимных чтений (команда publish_catalog, раздаёт nginx)
+CATALOG_SNAPSHOT_ROOT = os.path.join(BASE_DIR, 'catalog')
+CATALOG_SNAPSHOT_KEEP = 3
+# Автопубликация (publish_catalog --watch): журнал изменений проверяется раз в POLL секунд,
+# после изменения ждём окно тишины WINDOW, но не дольше MAX_DELAY
+CATALOG_PUBLISH_POLL = 5
+CATALOG_PUBLISH_WINDOW = 60
+CATALOG_PUBLISH_MAX_DELAY = 300
+
+# Замеры запросов (api.instrumentation): заголовок Server-Timing и журнал api.performance
+REQUEST_TIMING_ENABLED = os.environ.get('REQUEST_TIMING_ENABLED', 'True') == 'True'
+# Server-Timing для всех клиентов; иначе только для сотрудников
+REQUEST_TIMING_HEADER = os.environ.get('REQUEST_TIMING_HEADER', str(DEBUG)) == 'True'
+# Запросы дольше SLOW_REQUEST_MS и повторы одного SQL от REPEATED_QUERY_THRESHOLD раз пишутся как WARNING
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+REPEATED_QUERY_THRESHOLD = int(os.environ.get('REPEATED_QUERY_THRESHOLD', 10))
+# Превышение бюджета запросов представления (api.budgets): 'raise', 'log' или None
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'log' if DEBUG else '') or None
+
+# Метрики Prometheus (api.metrics); для gunicorn нужна переменная PROMETHEUS_MULTIPROC_DIR
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+# /metrics доступен только из этих сетей (docker, localhost)
+METRICS_ALLOWED_NETWORKS = ['127.0.0.0/8', '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', '::1/128']
+
+# Профилирование запросов суперпользователя по X-Profile: 1 или ?_profile=1 (api.profiling);
+# по умолчанию только при DEBUG, в продакшене включается на время разбора переменной окружения
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', str(DEBUG)) == 'True'
+PROFILING_ROOT = os.path.join(BASE_DIR, 'profiles')
+PROFILING_KEEP = 50
+PROFILING_TOP_FUNCTIONS = 60
 
 # Logging
 LOGGING = {
@@ -221,5 +390,11 @@ LOGGING = {
             'level': 'DEBUG' if DEBUG else 'WARNING',
             'propagate': False,
         },
+        # INFO — строка на каждый запрос, WARNING — только медленные и N+1
+        'api.performance': {
+            'handlers': ['console'],
+            'level': os.environ.get('REQUEST_TIMING_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
     },
 }
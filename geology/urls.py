@@ -18,11 +18,16 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
 
+from api.metrics import metrics_view
+from api.profiling import report_list_view, report_view
 from geology import settings
 
 urlpatterns = [
+    path('admin/profiles/', admin.site.admin_view(report_list_view), name='profile-reports'),
+    path('admin/profiles/<str:name>/', admin.site.admin_view(report_view), name='profile-report'),
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG: